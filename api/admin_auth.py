@@ -0,0 +1,148 @@
+import os
+import hmac
+import asyncio
+import hashlib
+import secrets
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+from .utils import LRUCache, get_supabase_client
+from .logs import get_logger
+
+log = get_logger("admin_auth")
+
+# Admin login / JWT / password hashing.
+# Imported on first use by api/index.py; jwt and passlib are imported lazily
+# as well, so a cold start that only serves the webhook never loads them.
+
+# Security Config
+SECRET_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Using Service Key as Secret implies robust secret, or use a dedicated one.
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 4320
+
+# Raising BCRYPT_ROUNDS re-hashes existing passwords on their next login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+# bcrypt is deliberately slow; keep it off the event loop and cap how many run at once
+AUTH_MAX_WORKERS = int(os.environ.get("AUTH_MAX_WORKERS", "2"))
+_auth_executor = ThreadPoolExecutor(max_workers=AUTH_MAX_WORKERS, thread_name_prefix="bcrypt")
+
+async def run_auth_work(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_auth_executor, fn, *args)
+
+def verify_password(plain_password, hashed_password):
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    # -> (is_valid, new_hash or None)
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return get_pwd_context().hash(password)
+
+# Recent successful logins, so repeated logins skip bcrypt.
+# Keyed by an HMAC (per-process random key) of id + stored hash + password:
+# changing the password changes the stored hash and invalidates the entry.
+LOGIN_CACHE_TTL = int(os.environ.get("LOGIN_CACHE_TTL", "300"))
+_login_cache = LRUCache(256)
+_login_cache_key = secrets.token_bytes(32)
+
+def _login_cache_token(admin_id, stored_pw, password):
+    msg = f"{admin_id}\0{stored_pw}\0{password}".encode("utf-8")
+    return hmac.new(_login_cache_key, msg, hashlib.sha256).hexdigest()
+
+def create_access_token(data: dict):
+    import jwt
+    to_encode = data.copy()
+    expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+def verify_admin_token(token: str):
+    import jwt
+    try:
+        # Check for special migration token if needed, or just standard JWT
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return username
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+
+async def admin_login(username: str, password: str):
+    try:
+        supabase = get_supabase_client()
+        if not supabase: return {"error": "DB Failed"}
+        if '"' in username or "\\" in username:
+            return {"status": "error", "message": "User not found"}
+
+        # 1. Fetch user by Phone OR Username (one round trip)
+        # We fetch the HASHED password (or plain text if not migrated yet)
+        user_res = supabase.table("villingili_admin_users").select("*")\
+            .or_(f'phone_number.eq."{username}",username.eq."{username}"').execute()
+
+        if not user_res.data:
+            return {"status": "error", "message": "User not found"}
+
+        # Phone match wins over a username match (same precedence as before)
+        admin = next((a for a in user_res.data if a.get("phone_number") == username), user_res.data[0])
+        stored_pw = admin["password"]
+
+        # 2. Verify Password (Handle Legacy Plain Text vs Bcrypt)
+        is_valid = False
+        cache_token = _login_cache_token(admin["id"], stored_pw, password)
+        cached_until = _login_cache.get(cache_token)
+        if cached_until and cached_until > time.time():
+            is_valid = True
+        else:
+            new_hash = None
+            try:
+                # Try verifying as hash (in the bcrypt pool)
+                is_valid, new_hash = await run_auth_work(verify_and_update_password, password, stored_pw)
+            except Exception:
+                # Fallback for legacy plain text (temporary migration logic)
+                if hmac.compare_digest(str(stored_pw), password):
+                    is_valid = True
+                    # Auto-migrate to hash
+                    new_hash = await run_auth_work(get_password_hash, stored_pw)
+
+            if is_valid and new_hash:
+                # Legacy plain text or bcrypt cost changed: store the fresh hash
+                supabase.table("villingili_admin_users").update({"password": new_hash}).eq("id", admin["id"]).execute()
+                stored_pw = new_hash
+            if is_valid:
+                _login_cache.put(_login_cache_token(admin["id"], stored_pw, password), time.time() + LOGIN_CACHE_TTL)
+
+        if is_valid:
+            # 3. Generate Token
+            access_token = create_access_token(data={"sub": admin["username"], "role": "admin"})
+
+            return {
+                "status": "ok",
+                "access_token": access_token,
+                "token_type": "bearer",
+                "user": {
+                    "username": admin["username"],
+                    "phone_number": admin["phone_number"],
+                    "role": "admin",
+                    "telegram_id": admin["telegram_id"]
+                }
+            }
+
+        return {"status": "error", "message": "Invalid Password"}
+    except Exception as e:
+        log.error("Login Error: %s", e)
+        return {"status": "error", "message": f"Server Error: {str(e)}"}
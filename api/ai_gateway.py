@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+
+from .tracing import span
+from .logs import get_logger
+
+log = get_logger("ai")
+
+# Shared OpenAI access for the whole process.
+# - One client (connection pool) instead of a new OpenAI() per call
+# - Hard per-call deadline and a cap on in-flight calls; waiting for a slot
+#   and retries (up to AI_MAX_RETRIES) all fit inside the deadline
+# - Blocking: async handlers call it through asyncio.to_thread
+# - Per call type counters so slow/expensive flows are visible
+#
+# OPENAI_BASE_URL can point at scripts/mock_openai_server.py for offline runs.
+
+AI_TIMEOUT_SECONDS = float(os.environ.get("AI_TIMEOUT_SECONDS", "15"))
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "4"))
+AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", "1"))
+
+_client = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+
+_metrics_lock = threading.Lock()
+AI_METRICS = {}
+
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.environ.get("OPENAI_API_KEY")
+                if not api_key:
+                    return None
+                from openai import OpenAI
+                _client = OpenAI(
+                    api_key=api_key,
+                    base_url=os.environ.get("OPENAI_BASE_URL") or None,
+                    timeout=AI_TIMEOUT_SECONDS,
+                    max_retries=0,  # chat_json retries within its own deadline
+                )
+    return _client
+
+
+def reset_openai_client():
+    # For tests/benchmarks that change OPENAI_* env vars at runtime
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _record(call_type, **values):
+    with _metrics_lock:
+        m = AI_METRICS.setdefault(call_type, {
+            "calls": 0, "errors": 0, "timeouts": 0, "rejected": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+            "total_ms": 0.0, "max_ms": 0.0,
+        })
+        for key, val in values.items():
+            if key == "latency_ms":
+                m["total_ms"] += val
+                m["max_ms"] = max(m["max_ms"], val)
+            else:
+                m[key] += val
+
+
+def get_ai_metrics():
+    with _metrics_lock:
+        snapshot = {}
+        for call_type, m in AI_METRICS.items():
+            done = m["calls"] or 1
+            snapshot[call_type] = dict(m, avg_ms=round(m["total_ms"] / done, 1))
+        return snapshot
+
+
+def _retryable(e):
+    # Timeouts, dropped connections, 429 and 5xx; not bad requests or auth errors
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return "timeout" in type(e).__name__.lower() or "connection" in type(e).__name__.lower()
+
+
+def chat_json(call_type: str, model: str, messages: list, timeout: float = None):
+    """Runs a JSON-mode chat completion. Returns the parsed dict or None."""
+    client = get_openai_client()
+    if client is None:
+        log.warning("OpenAI API key missing.")
+        return None
+
+    deadline = timeout or AI_TIMEOUT_SECONDS
+    start = time.perf_counter()
+    # Waiting for a slot counts against the same deadline
+    if not _slots.acquire(timeout=deadline):
+        log.warning("AI %s: too many calls in flight, giving up", call_type)
+        _record(call_type, rejected=1)
+        return None
+
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline - (time.perf_counter() - start)
+            try:
+                with span("ai", call_type=call_type, model=model):
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        timeout=max(remaining, 0.1),
+                    )
+                break
+            except Exception as e:
+                attempt += 1
+                # Another try only if it can still finish before the deadline
+                left = deadline - (time.perf_counter() - start)
+                if attempt > AI_MAX_RETRIES or not _retryable(e) or left < min(1.0, deadline / 4):
+                    raise
+                log.warning("AI %s: %s, retrying with %.1fs left", call_type, e, left)
+        usage = getattr(response, "usage", None)
+        _record(
+            call_type,
+            calls=1,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+        return json.loads(response.choices[0].message.content)
+    except Exception as e:
+        is_timeout = "timeout" in type(e).__name__.lower() or "timed out" in str(e).lower()
+        _record(call_type, calls=1, errors=1, timeouts=1 if is_timeout else 0,
+                latency_ms=(time.perf_counter() - start) * 1000)
+        log.error("AI %s Error: %s", call_type, e)
+        return None
+    finally:
+        _slots.release()
@@ -0,0 +1,90 @@
+import os
+from datetime import datetime, timedelta
+
+# Delta sync for the dashboard: rows whose updated_at moved since the
+# client's cursor, plus tombstones for deleted rows (supabase/changes.sql).
+#
+# The cursor is the newest updated_at/deleted_at the client has seen. Reads
+# start CHANGES_OVERLAP_SECONDS before it so rows committed slightly late
+# aren't skipped; re-sent rows are harmless since clients merge by key.
+
+CHANGES_OVERLAP_SECONDS = float(os.environ.get("CHANGES_OVERLAP_SECONDS", "2"))
+# Tombstones older than this may have been pruned: older cursors get a full reload
+CHANGES_TOMBSTONE_DAYS = int(os.environ.get("CHANGES_TOMBSTONE_DAYS", "30"))
+
+SYNC_TABLES = {
+    # name -> (table, key column)
+    "users": ("villingili_users", "telegram_id"),
+    "requests": ("villingili_requests", "id"),
+}
+
+
+def _parse_cursor(since):
+    try:
+        return datetime.fromisoformat(since.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _attach_requesters(supabase, requests):
+    # Same shape as /api/requests, one lookup for the whole batch
+    ids = list({r["requester_id"] for r in requests if r.get("requester_id")})
+    users = {}
+    if ids:
+        res = supabase.table("villingili_users").select("telegram_id, full_name, phone_number").in_("telegram_id", ids).execute()
+        users = {u["telegram_id"]: {"full_name": u["full_name"], "phone_number": u["phone_number"]} for u in res.data or []}
+    for req in requests:
+        req["requester"] = users.get(req.get("requester_id"))
+    return requests
+
+
+def get_changes(supabase, names, since=None):
+    """Returns {"full", "cursor", <name>: rows..., "deleted": {<name>: [ids]}}"""
+    since_dt = _parse_cursor(since) if since else None
+    if since_dt is not None:
+        now = datetime.now(since_dt.tzinfo) if since_dt.tzinfo else datetime.now()
+        if now - since_dt > timedelta(days=CHANGES_TOMBSTONE_DAYS):
+            since_dt = None
+    full = since_dt is None
+    read_from = None if full else (since_dt - timedelta(seconds=CHANGES_OVERLAP_SECONDS)).isoformat()
+
+    result = {"full": full, "deleted": {}}
+    stamps = [since] if not full else []
+
+    for name in names:
+        table, key = SYNC_TABLES[name]
+        query = supabase.table(table).select("*")
+        if full:
+            query = query.order("created_at", desc=True)
+            if name == "requests":
+                query = query.limit(50)  # same window as /api/requests
+        else:
+            query = query.gte("updated_at", read_from).order("updated_at", desc=True)
+        rows = query.execute().data or []
+        if name == "requests":
+            _attach_requesters(supabase, rows)
+        result[name] = rows
+        stamps.extend(r["updated_at"] for r in rows if r.get("updated_at"))
+
+        result["deleted"][name] = []
+        if not full:
+            res = supabase.table("villingili_tombstones").select("row_id, deleted_at")\
+                .eq("table_name", table).gte("deleted_at", read_from).execute()
+            tombstones = res.data or []
+            stamps.extend(t["deleted_at"] for t in tombstones)
+            # A key can be both deleted and (re)written in the window: the later one wins
+            by_key = {str(r[key]): r for r in rows}
+            for t in tombstones:
+                row = by_key.pop(t["row_id"], None)
+                if row is not None:
+                    written, deleted = _parse_cursor(row.get("updated_at")), _parse_cursor(t["deleted_at"])
+                    if written and deleted and written >= deleted:
+                        by_key[t["row_id"]] = row
+                        continue
+                    rows.remove(row)
+                result["deleted"][name].append(t["row_id"])
+
+    # Compare as datetimes: Postgres and LocalDB format timestamps differently
+    parsed = [(d, s) for s in stamps if (d := _parse_cursor(s)) is not None]
+    result["cursor"] = max(parsed, key=lambda p: p[0])[1] if parsed else None
+    return result
@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from .logs import get_logger
+
+log = get_logger("channel_edits")
+
+# Debounced edits of channel posts.
+#
+# A request's channel post changes with its status (donors found, expired).
+# Editing it on every event means redundant edits and 429s when events come
+# in bursts, so queue_edit() only records the latest text per
+# (chat_id, message_id). A background thread sends it once no newer text has
+# arrived for CHANNEL_EDIT_DEBOUNCE_SECONDS (but never holds an edit longer
+# than CHANNEL_EDIT_MAX_DELAY_SECONDS), at most one edit per
+# CHANNEL_EDIT_INTERVAL_SECONDS, and skips texts the post already shows.
+# A 429 pauses the queue for retry_after; the edit is retried unless a newer
+# text replaced it meanwhile.
+#
+# Serverless instances freeze once an invocation ends, taking the thread with
+# them, so there the webhook flushes what its update queued before it
+# finishes, and cron_expire sizes its flush to the queue (drain_seconds()).
+# Expired posts it can't edit in time stay flagged in the database
+# (expired_post_pending, supabase/expired_posts.sql) for its next run.
+
+CHANNEL_EDIT_DEBOUNCE_SECONDS = float(os.environ.get("CHANNEL_EDIT_DEBOUNCE_SECONDS", "1"))
+CHANNEL_EDIT_MAX_DELAY_SECONDS = float(os.environ.get("CHANNEL_EDIT_MAX_DELAY_SECONDS", "5"))
+CHANNEL_EDIT_INTERVAL_SECONDS = float(os.environ.get("CHANNEL_EDIT_INTERVAL_SECONDS", "1"))
+SERVERLESS = bool(os.environ.get("VERCEL"))
+SENT_TEXT_CACHE_SIZE = 1000
+
+
+def _edit(chat_id, message_id, text, reply_markup):
+    from .utils import edit_telegram_message
+    return edit_telegram_message(chat_id, message_id, text, reply_markup=reply_markup)
+
+
+class EditCoalescer:
+    def __init__(self, send=_edit, debounce=CHANNEL_EDIT_DEBOUNCE_SECONDS,
+                 max_delay=CHANNEL_EDIT_MAX_DELAY_SECONDS, interval=CHANNEL_EDIT_INTERVAL_SECONDS):
+        self.send = send
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.interval = interval
+        self._pending = {}  # (chat_id, message_id) -> {"text", "reply_markup", "first_at", "due_at"}
+        self._sent = OrderedDict()  # key -> (text, reply_markup) the post shows now
+        self._cond = threading.Condition()
+        self._thread = None
+        self._in_flight = 0
+        self._flushing = 0
+        self._next_send_at = 0.0
+        self.stats = {"queued": 0, "coalesced": 0, "sent": 0, "unchanged": 0, "rate_limited": 0, "failed": 0}
+
+    def queue_edit(self, chat_id, message_id, text, reply_markup=None):
+        key = (str(chat_id), int(message_id))
+        now = time.monotonic()
+        with self._cond:
+            self.stats["queued"] += 1
+            entry = self._pending.get(key)
+            if entry:
+                self.stats["coalesced"] += 1
+                entry.update(text=text, reply_markup=reply_markup,
+                             due_at=min(now + self.debounce, entry["first_at"] + self.max_delay))
+            else:
+                self._pending[key] = {"text": text, "reply_markup": reply_markup, "first_at": now, "due_at": now + self.debounce}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="channel-edits", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Sends everything queued now (still rate limited) and waits; returns how many are left."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return len(self._pending)
+            finally:
+                self._flushing -= 1
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def is_queued(self, chat_id, message_id):
+        with self._cond:
+            key = (str(chat_id), int(message_id))
+            return key in self._pending or (self._in_flight and key not in self._sent)
+
+    def drain_seconds(self):
+        """Roughly how long a flush of the current queue takes at the edit rate."""
+        with self._cond:
+            backlog = len(self._pending) + self._in_flight
+            wait = max(0.0, self._next_send_at - time.monotonic())
+        return wait + backlog * self.interval
+
+    def _next_due(self, now):
+        # Under the lock: (key, entry) to send now, or (None, seconds to wait)
+        if not self._pending:
+            return None, None
+        key = min(self._pending, key=lambda k: self._pending[k]["due_at"])
+        ready_at = max(self._next_send_at, now if self._flushing else self._pending[key]["due_at"])
+        if ready_at > now:
+            return None, ready_at - now
+        return key, self._pending.pop(key)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    key, entry = self._next_due(time.monotonic())
+                    if key is not None:
+                        break
+                    self._cond.wait(entry)
+                self._in_flight += 1
+            try:
+                self._deliver(key, entry)
+            except Exception as e:
+                log.error("Channel edit %s failed: %s", key, e)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _deliver(self, key, entry):
+        wanted = (entry["text"], entry["reply_markup"])
+        with self._cond:
+            if self._sent.get(key) == wanted:
+                self.stats["unchanged"] += 1
+                return
+
+        res = self.send(key[0], key[1], entry["text"], entry["reply_markup"]) or {}
+        description = res.get("description") or ""
+        retry_after = (res.get("parameters") or {}).get("retry_after")
+
+        with self._cond:
+            self._next_send_at = time.monotonic() + self.interval
+            if res.get("ok") or "message is not modified" in description:
+                self.stats["sent"] += 1
+                self._sent[key] = wanted
+                self._sent.move_to_end(key)
+                while len(self._sent) > SENT_TEXT_CACHE_SIZE:
+                    self._sent.popitem(last=False)
+            elif retry_after:
+                self.stats["rate_limited"] += 1
+                self._next_send_at = time.monotonic() + retry_after
+                # Retry, unless a newer text was queued in the meantime
+                if key not in self._pending:
+                    self._pending[key] = {**entry, "due_at": time.monotonic()}
+            else:
+                # Deleted post, bad text...: retrying won't help
+                self.stats["failed"] += 1
+                log.warning("Channel edit %s failed: %s", key, description or "no response from Telegram")
+
+
+coalescer = EditCoalescer()
+
+
+def queue_edit(chat_id, message_id, text, reply_markup=None):
+    coalescer.queue_edit(chat_id, message_id, text, reply_markup)
+
+
+def flush_edits(timeout=10.0):
+    return coalescer.flush(timeout)
+
+
+def update_request_post(req, requester_name, requester_phone, donors_found=None):
+    """Queues the new text of a request's channel post (if it has one)."""
+    channel_id = os.environ.get("TELEGRAM_CHANNEL_ID")
+    if not channel_id or not req.get("telegram_message_id"):
+        return
+    from .utils import format_blood_request_message
+    text = format_blood_request_message(req.get("blood_type"), req.get("location"), req.get("urgency"), requester_name, requester_phone)
+    donors = req.get("donors_found") if donors_found is None else donors_found
+    if donors:
+        text += f"\n🦸 {donors} donor{'s' if donors != 1 else ''} offered to help"
+    queue_edit(channel_id, req["telegram_message_id"], text)
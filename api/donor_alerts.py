@@ -0,0 +1,385 @@
+import os
+import time
+import heapq
+import datetime
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+from .logs import get_logger
+from .event_log import record_event
+
+log = get_logger("donor_alerts")
+
+# Private alerts to donors who can give blood for a new request.
+#
+# fan_out() queues a selection job; a background thread picks compatible,
+# active donors past their donation cooldown, nearest to the request first
+# (indexed queries, see supabase/donor_alerts.sql and gazetteer.sql), and
+# queues one alert each. Everything goes
+# through one priority queue, so a High urgency request's selection and
+# alerts go ahead of any Normal ones still waiting.
+#
+# Sending is paced at DONOR_ALERT_RATE_PER_SECOND (Telegram allows ~30
+# messages/s across chats) and each donor gets at most DONOR_ALERT_MAX_PER_DONOR
+# alerts per DONOR_ALERT_WINDOW_HOURS. A 429 pauses the queue for retry_after.
+# Donors the bot can't reach (blocked it, never started it) are skipped for
+# DONOR_UNREACHABLE_DAYS.
+#
+# Serverless instances don't share memory, so sent alerts and unreachable
+# donors are also recorded in the event log (donor_alerted /
+# donor_unreachable) and selection reads the candidates' history back from
+# villingili_events before applying the caps. Alerts sent by another instance
+# in the last few seconds (not yet flushed) aren't seen, so the cap can be
+# exceeded by a request or two racing each other. Without the event log the
+# caps are per process. Stats are per process.
+#
+# The queue lives in memory and its thread freezes with a serverless instance
+# once an invocation ends, so there the webhook drains it (drain_alerts) for up
+# to DONOR_ALERT_DRAIN_SECONDS before finishing. Whatever is left then only
+# goes out if the same instance handles a later call; alerts are best effort
+# on top of the channel post, which the outbox makes durable.
+
+DONOR_COOLDOWN_DAYS = int(os.environ.get("DONOR_COOLDOWN_DAYS", "90"))
+DONOR_ALERT_RATE_PER_SECOND = float(os.environ.get("DONOR_ALERT_RATE_PER_SECOND", "20"))
+DONOR_ALERT_MAX_PER_DONOR = int(os.environ.get("DONOR_ALERT_MAX_PER_DONOR", "3"))
+DONOR_ALERT_WINDOW_HOURS = float(os.environ.get("DONOR_ALERT_WINDOW_HOURS", "24"))
+DONOR_ALERT_LIMIT_HIGH = int(os.environ.get("DONOR_ALERT_LIMIT_HIGH", "200"))
+DONOR_ALERT_LIMIT_NORMAL = int(os.environ.get("DONOR_ALERT_LIMIT_NORMAL", "50"))
+DONOR_ALERT_QUEUE_MAX = int(os.environ.get("DONOR_ALERT_QUEUE_MAX", "5000"))
+DONOR_ALERTS_ENABLED = os.environ.get("DONOR_ALERTS_ENABLED", "true").lower() != "false"
+DONOR_ALERT_DRAIN_SECONDS = float(os.environ.get("DONOR_ALERT_DRAIN_SECONDS", "20"))
+DONOR_UNREACHABLE_DAYS = float(os.environ.get("DONOR_UNREACHABLE_DAYS", "30"))
+SERVERLESS = bool(os.environ.get("VERCEL"))
+SELECT_LIMIT = 1000  # donors read per request, before caps are applied
+RECENT_REQUESTS = 50  # per-request stats kept
+HISTORY_CHUNK = 200  # donors per event log query
+
+# Recipient type -> donor types whose red cells it can take (exact match first)
+COMPATIBLE_DONORS = {
+    "O-": ["O-"],
+    "O+": ["O+", "O-"],
+    "A-": ["A-", "O-"],
+    "A+": ["A+", "A-", "O+", "O-"],
+    "B-": ["B-", "O-"],
+    "B+": ["B+", "B-", "O+", "O-"],
+    "AB-": ["AB-", "A-", "B-", "O-"],
+    "AB+": ["AB+", "AB-", "A+", "A-", "B+", "B-", "O+", "O-"],
+}
+
+PRIORITY = {"High": 0, "Normal": 1}
+
+
+def can_donate(donor_type, recipient_type):
+    return donor_type in COMPATIBLE_DONORS.get(recipient_type, [recipient_type])
+
+
+def _priority(urgency):
+    return PRIORITY.get(urgency, PRIORITY["Normal"])
+
+
+def _send(chat_id, text, reply_markup):
+    from .utils import send_telegram_message
+    return send_telegram_message(chat_id, text, reply_markup=reply_markup)
+
+
+def alert_text(req):
+    if req.get("urgency") == "High":
+        lines = [f"🚨 <b>URGENT: {req.get('blood_type')} blood needed</b>"]
+    else:
+        lines = [f"🩸 <b>{req.get('blood_type')} blood needed</b>"]
+    if req.get("location") and req["location"] not in ["Not Specified", "Unknown", "None"]:
+        lines.append(f"Location: {req['location']}")
+    lines.append("Your blood type is compatible. Can you help?")
+    return "\n".join(lines)
+
+
+class AlertQueue:
+    def __init__(self, send=_send, rate=DONOR_ALERT_RATE_PER_SECOND, max_per_donor=DONOR_ALERT_MAX_PER_DONOR,
+                 window_hours=DONOR_ALERT_WINDOW_HOURS, max_queued=DONOR_ALERT_QUEUE_MAX):
+        self.send = send
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.max_per_donor = max_per_donor
+        self.window = window_hours * 3600
+        self.max_queued = max_queued
+        self._heap = []  # (priority, seq, kind, payload)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = False
+        self._next_send_at = 0.0
+        self._alerted = {}  # donor telegram_id -> deque of alert times (monotonic)
+        self._unreachable = set()
+        self._history_disabled = False
+        self.stats = {}  # (urgency, result) -> n
+        self.requests = OrderedDict()  # request id -> per-request counts
+        from .metrics import Histogram
+        self.delay = {"High": Histogram(), "Normal": Histogram()}  # fan_out -> alert sent, seconds
+
+    # --- producers ---
+
+    def fan_out(self, supabase, req):
+        """Queues donor selection for a saved request (a villingili_requests row)."""
+        urgency = "High" if req.get("urgency") == "High" else "Normal"
+        with self._cond:
+            self.requests[req["id"]] = {"urgency": urgency, "blood_type": req.get("blood_type"), "selected": 0,
+                                        "queued": 0, "sent": 0, "failed": 0, "capped": 0, "unreachable": 0,
+                                        "created_at": time.time()}
+            while len(self.requests) > RECENT_REQUESTS:
+                self.requests.popitem(last=False)
+            self._push(_priority(urgency), "select", {"supabase": supabase, "req": req})
+
+    def _push(self, priority, kind, payload):
+        # Under the lock. A full queue drops the least urgent, newest item
+        if len(self._heap) >= self.max_queued:
+            worst = max(range(len(self._heap)), key=lambda i: self._heap[i][:2])
+            if self._heap[worst][:2] < (priority, float("inf")):
+                self._count(payload, "dropped")
+                return
+            self._count(self._heap[worst][3], "dropped")
+            self._heap[worst] = self._heap[-1]
+            self._heap.pop()
+            heapq.heapify(self._heap)
+        payload.setdefault("queued_at", time.monotonic())
+        heapq.heappush(self._heap, (priority, next(self._seq), kind, payload))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="donor-alerts", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _count(self, payload, result, n=1):
+        # Under the lock
+        req = payload["req"]
+        urgency = "High" if req.get("urgency") == "High" else "Normal"
+        self.stats[(urgency, result)] = self.stats.get((urgency, result), 0) + n
+        per_request = self.requests.get(req["id"])
+        if per_request is not None and result in per_request:
+            per_request[result] += n
+
+    # --- worker ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._next_send_at <= now:
+                        break
+                    self._cond.wait(self._next_send_at - now if self._heap else None)
+                _, seq, kind, payload = heapq.heappop(self._heap)
+                self._busy = True
+            try:
+                if kind == "select":
+                    self._select(payload)
+                else:
+                    self._deliver(seq, payload)
+            except Exception as e:
+                log.error("Donor alert %s failed: %s", kind, e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _select(self, payload):
+        req = payload["req"]
+        donors = select_donors(payload["supabase"], req)
+        limit = DONOR_ALERT_LIMIT_HIGH if req.get("urgency") == "High" else DONOR_ALERT_LIMIT_NORMAL
+        with self._cond:
+            self._count(payload, "selected", len(donors))
+        queued = 0
+        for start in range(0, len(donors), HISTORY_CHUNK):
+            if queued >= limit:
+                break
+            chunk = donors[start:start + HISTORY_CHUNK]
+            # Outside the lock: alerts keep going out while the history loads
+            history = self._load_history(payload["supabase"], [d["telegram_id"] for d in chunk])
+            now = time.monotonic()
+            with self._cond:
+                if history:
+                    self._merge_history(*history, now)
+                for donor in chunk:
+                    if queued >= limit:
+                        break
+                    donor_id = donor["telegram_id"]
+                    if donor_id in self._unreachable:
+                        continue
+                    if self._recent_alerts(donor_id, now) >= self.max_per_donor:
+                        self._count(payload, "capped")
+                        continue
+                    # queued_at stays the request's, so the delay histogram covers selection too
+                    self._push(_priority(req.get("urgency")), "alert", {"req": req, "donor_id": donor_id, "queued_at": payload["queued_at"]})
+                    self._count(payload, "queued")
+                    queued += 1
+
+    def _load_history(self, supabase, donor_ids):
+        """(donor id -> alert times in the window, unreachable donor ids) from the event log, or None."""
+        if self._history_disabled or not donor_ids:
+            return None
+        from .utils import missing_table
+        now = datetime.datetime.now(datetime.timezone.utc)
+        ids = [str(i) for i in donor_ids]
+
+        def query(event_type, since):
+            res = supabase.table("villingili_events").select("subject_id, created_at")\
+                .eq("type", event_type)\
+                .eq("subject", "user")\
+                .in_("subject_id", ids)\
+                .gte("created_at", since.isoformat())\
+                .execute()
+            if getattr(res, "error", None):
+                # LocalDB reports errors instead of raising
+                raise RuntimeError(res.error)
+            return res.data or []
+
+        try:
+            alerted = query("donor_alerted", now - datetime.timedelta(seconds=self.window))
+            unreachable = query("donor_unreachable", now - datetime.timedelta(days=DONOR_UNREACHABLE_DAYS))
+        except Exception as e:
+            if missing_table(e):
+                log.warning("villingili_events missing (run supabase/events.sql); donor alert caps are per process")
+                self._history_disabled = True
+            else:
+                log.warning("Donor alert history unavailable, using this process's: %s", e)
+            return None
+        times = {}
+        for row in alerted:
+            at = datetime.datetime.fromisoformat(row["created_at"].replace("Z", "+00:00"))
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=datetime.timezone.utc)
+            times.setdefault(row["subject_id"], []).append((now - at).total_seconds())
+        return times, {row["subject_id"] for row in unreachable}
+
+    def _merge_history(self, times, unreachable, now):
+        # Under the lock. This process's own alerts are in both the log and
+        # memory (or only memory, until flushed), so the longer list wins
+        # instead of adding them up.
+        for donor_id, ages in times.items():
+            recent = sorted(now - age for age in ages if age <= self.window)
+            if len(recent) > self._recent_alerts(int(donor_id), now):
+                self._alerted[int(donor_id)] = deque(recent)
+        self._unreachable.update(int(donor_id) for donor_id in unreachable)
+
+    def _recent_alerts(self, donor_id, now):
+        times = self._alerted.get(donor_id)
+        if not times:
+            return 0
+        while times and now - times[0] > self.window:
+            times.popleft()
+        if not times:
+            del self._alerted[donor_id]
+        return len(times)
+
+    def _deliver(self, seq, payload):
+        req, donor_id = payload["req"], payload["donor_id"]
+        with self._cond:
+            # Caps are checked again: the donor may have been alerted for another request meanwhile
+            if self._recent_alerts(donor_id, time.monotonic()) >= self.max_per_donor:
+                self._count(payload, "capped")
+                return
+        keyboard = {"inline_keyboard": [[{"text": "🙋 I Can Help", "callback_data": f"help_{req['id']}"}]]}
+        res = self.send(donor_id, alert_text(req), keyboard) or {}
+        now = time.monotonic()
+        with self._cond:
+            self._next_send_at = now + self.interval
+            retry_after = (res.get("parameters") or {}).get("retry_after")
+            if res.get("ok"):
+                self._alerted.setdefault(donor_id, deque()).append(now)
+                record_event("donor_alerted", "user", donor_id, {"request_id": req["id"]})
+                self._count(payload, "sent")
+                urgency = "High" if req.get("urgency") == "High" else "Normal"
+                self.delay[urgency].observe(now - payload["queued_at"])
+            elif retry_after:
+                # Back in the queue at the same place
+                self._next_send_at = now + retry_after
+                self._count(payload, "rate_limited")
+                heapq.heappush(self._heap, (_priority(req.get("urgency")), seq, "alert", payload))
+            elif res.get("error_code") in (400, 403):
+                # Blocked the bot, or never started it (e.g. imported donors)
+                self._unreachable.add(donor_id)
+                record_event("donor_unreachable", "user", donor_id, {"request_id": req["id"], "error_code": res.get("error_code")})
+                self._count(payload, "unreachable")
+            else:
+                self._count(payload, "failed")
+                log.warning("Donor alert to %s failed: %s", donor_id, res.get("description") or "no response from Telegram")
+
+    # --- reading ---
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "queued": len(self._heap),
+                "unreachable_donors": len(self._unreachable),
+                "totals": [{"urgency": u, "result": r, "count": n} for (u, r), n in sorted(self.stats.items())],
+                "requests": [{"id": k, **v} for k, v in reversed(self.requests.items())],
+            }
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap) + (1 if self._busy else 0)
+
+    def wait_idle(self, timeout=10.0):
+        """Blocks until the queue is empty; returns how many are left."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._heap or self._busy) and time.monotonic() < deadline:
+                self._cond.wait(max(deadline - time.monotonic(), 0))
+            return len(self._heap)
+
+
+def select_donors(supabase, req):
+    """
+    Active donors compatible with the request and past their cooldown:
+    those on the request's island first, then its atoll, then everyone
+    else, exact type first within each. One indexed query per tier (see
+    supabase/gazetteer.sql), stopping once SELECT_LIMIT donors are found.
+    """
+    types = COMPATIBLE_DONORS.get(req.get("blood_type"))
+    if not types:
+        return []
+    cutoff = (datetime.date.today() - datetime.timedelta(days=DONOR_COOLDOWN_DAYS)).isoformat()
+    rank = {t: i for i, t in enumerate(types)}
+
+    def query(narrow):
+        q = supabase.table("villingili_users").select("telegram_id, blood_type, last_donation_date")\
+            .in_("blood_type", types)\
+            .eq("status", "active")\
+            .or_(f"last_donation_date.is.null,last_donation_date.lt.{cutoff}")\
+            .gt("telegram_id", 0)\
+            .neq("telegram_id", req.get("requester_id"))
+        rows = narrow(q).limit(SELECT_LIMIT).execute().data or []
+        return sorted(rows, key=lambda d: rank.get(d.get("blood_type"), len(types)))
+
+    # Wider tiers include the narrower ones; a full tier still adds enough new donors to fill the limit.
+    # Requests saved before gazetteer.sql have no codes, so they get the last tier only.
+    tiers = []
+    if req.get("island_code"):
+        tiers.append(lambda q: q.eq("island_code", req["island_code"]))
+    if req.get("atoll_code"):
+        tiers.append(lambda q: q.eq("atoll_code", req["atoll_code"]))
+    tiers.append(lambda q: q)
+
+    donors, seen = [], set()
+    for narrow in tiers:
+        for d in query(narrow):
+            if d["telegram_id"] not in seen:
+                seen.add(d["telegram_id"])
+                donors.append(d)
+        if len(donors) >= SELECT_LIMIT:
+            break
+    return donors[:SELECT_LIMIT]
+
+
+alerts = AlertQueue()
+
+
+def fan_out(supabase, req):
+    if DONOR_ALERTS_ENABLED:
+        alerts.fan_out(supabase, req)
+
+
+def drain_alerts(timeout=DONOR_ALERT_DRAIN_SECONDS):
+    """Sends what's queued for up to `timeout` seconds; returns how many are left."""
+    left = alerts.wait_idle(timeout)
+    if left:
+        log.warning("%d donor alerts still queued after %ss", left, timeout)
+    return left
@@ -0,0 +1,57 @@
+import hashlib
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from .logs import get_logger
+
+log = get_logger("etag")
+
+# Conditional GET for the dashboard list endpoints.
+#
+# A table's version is (row count, max(updated_at)) - one indexed query that
+# returns a single row. Inserts and updates move max(updated_at) (set by the
+# trigger in supabase/updated_at.sql, or by LocalDB), deletes change the count.
+
+
+def table_version(supabase, table):
+    """Returns 'count:max_updated_at' for a table, or None if it can't be versioned."""
+    try:
+        res = supabase.table(table).select("updated_at", count="exact")\
+            .order("updated_at", desc=True).limit(1).execute()
+    except Exception as e:
+        # e.g. the updated_at migration hasn't been applied yet
+        log.error("Version check failed for %s: %s", table, e)
+        return None
+    if getattr(res, "error", None) or res.count is None:
+        return None
+    latest = res.data[0].get("updated_at") if res.data else None
+    return f"{res.count}:{latest}"
+
+
+def make_etag(*versions):
+    """Combines table versions into a weak ETag; None if any part is unknown."""
+    if any(v is None for v in versions):
+        return None
+    digest = hashlib.sha1("|".join(versions).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: ignore W/ prefixes
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+def conditional_json(request: Request, etag, build):
+    """304 if the client already has `etag`, else JSON from build() tagged with it."""
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(build(), headers=headers)
@@ -0,0 +1,226 @@
+import os
+import asyncio
+import json
+import time
+import datetime
+import threading
+from collections import deque
+
+from .logs import get_logger
+from .utils import missing_table, start_invocation, invocation_time_left
+
+log = get_logger("event_log")
+
+# Append-only history of users and requests (villingili_events, see
+# supabase/events.sql).
+#
+# record() only appends to an in-memory queue, so bot flows never wait on
+# it. A background thread inserts the queue in batches of up to
+# EVENT_LOG_BATCH_SIZE, at most EVENT_LOG_FLUSH_SECONDS after an event was
+# recorded. A failed batch goes back to the front of the queue and is
+# retried with backoff; past EVENT_LOG_QUEUE_MAX the oldest events are
+# dropped. Events still queued when a process exits are lost, and a
+# serverless instance freezes once an invocation ends, so there
+# EventFlushMiddleware flushes what a request queued (for up to
+# EVENT_LOG_DRAIN_SECONDS, within the request's deadline) after its response
+# and background tasks are done.
+#
+# read_events() pages through the log by id. Ids can commit out of order
+# under concurrent writers, so it leaves out events logged in the last
+# EVENT_LOG_READ_LAG_SECONDS; a reader that resumes from the last id it saw
+# then misses nothing.
+
+EVENT_LOG_BATCH_SIZE = int(os.environ.get("EVENT_LOG_BATCH_SIZE", "100"))
+EVENT_LOG_FLUSH_SECONDS = float(os.environ.get("EVENT_LOG_FLUSH_SECONDS", "1"))
+EVENT_LOG_QUEUE_MAX = int(os.environ.get("EVENT_LOG_QUEUE_MAX", "10000"))
+EVENT_LOG_ENABLED = os.environ.get("EVENT_LOG_ENABLED", "true").lower() != "false"
+EVENT_LOG_DRAIN_SECONDS = float(os.environ.get("EVENT_LOG_DRAIN_SECONDS", "5"))
+EVENT_LOG_READ_LAG_SECONDS = 2
+SERVERLESS = bool(os.environ.get("VERCEL"))
+RETRY_MAX_SECONDS = 30
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class EventWriter:
+    def __init__(self, batch_size=EVENT_LOG_BATCH_SIZE, flush_seconds=EVENT_LOG_FLUSH_SECONDS,
+                 max_queued=EVENT_LOG_QUEUE_MAX, client=None):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queued = max_queued
+        self._client = client
+        self._queue = deque()  # (monotonic time recorded, row)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._in_flight = 0
+        self._flushing = 0
+        self._retry_at = 0.0
+        self._failures = 0
+        self._disabled = False
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "failed_batches": 0}
+
+    def record(self, event_type, subject, subject_id=None, data=None, actor=None):
+        row = {
+            "type": event_type,
+            "subject": subject,
+            "subject_id": None if subject_id is None else str(subject_id),
+            "actor": None if actor is None else str(actor),
+            "data": data or {},
+            "created_at": _utc_now().isoformat(),
+        }
+        with self._cond:
+            if self._disabled:
+                return
+            self.stats["recorded"] += 1
+            if len(self._queue) >= self.max_queued:
+                self._queue.popleft()
+                self.stats["dropped"] += 1
+            self._queue.append((time.monotonic(), row))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Writes everything queued now and waits; returns how many are left."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while (self._queue or self._in_flight) and not self._disabled:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return len(self._queue)
+            finally:
+                self._flushing -= 1
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _next_batch(self, now):
+        # Under the lock: (batch, None) to write now, or (None, seconds to wait)
+        if not self._queue:
+            return None, None
+        due = self._queue[0][0] + self.flush_seconds
+        if len(self._queue) >= self.batch_size or self._flushing:
+            due = now
+        due = max(due, self._retry_at)
+        if due > now:
+            return None, due - now
+        n = min(self.batch_size, len(self._queue))
+        return [self._queue.popleft() for _ in range(n)], None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    batch, wait = self._next_batch(time.monotonic())
+                    if batch:
+                        break
+                    self._cond.wait(wait)
+                self._in_flight += 1
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        try:
+            if self._client is None:
+                from .utils import get_supabase_client
+                self._client = get_supabase_client()
+            res = self._client.table("villingili_events").insert([row for _, row in batch]).execute()
+            if getattr(res, "error", None):
+                # LocalDB reports errors instead of raising
+                raise RuntimeError(res.error)
+        except Exception as e:
+            with self._cond:
+                if missing_table(e):
+                    self._disabled = True
+                    self.stats["dropped"] += len(batch) + len(self._queue)
+                    self._queue.clear()
+                    log.warning("villingili_events is missing (run supabase/events.sql); event log disabled")
+                    return
+                self._failures += 1
+                self.stats["failed_batches"] += 1
+                self._retry_at = time.monotonic() + min(2 ** self._failures, RETRY_MAX_SECONDS)
+                # Back in front, in order; the oldest go if the queue overflowed meanwhile
+                self._queue.extendleft(reversed(batch))
+                while len(self._queue) > self.max_queued:
+                    self._queue.popleft()
+                    self.stats["dropped"] += 1
+            log.error("Event log write of %d events failed: %s", len(batch), e)
+            return
+        with self._cond:
+            self._failures = 0
+            self._retry_at = 0.0
+            self.stats["written"] += len(batch)
+
+
+writer = EventWriter()
+
+
+def record_event(event_type, subject, subject_id=None, data=None, actor=None):
+    """Queues an event for the log; never raises."""
+    if not EVENT_LOG_ENABLED:
+        return
+    try:
+        writer.record(event_type, subject, subject_id, data, actor)
+    except Exception as e:
+        log.error("Event record failed: %s", e)
+
+
+def flush_events(timeout=10.0):
+    return writer.flush(timeout)
+
+
+class EventFlushMiddleware:
+    def __init__(self, app, enabled=SERVERLESS, timeout=EVENT_LOG_DRAIN_SECONDS):
+        self.app = app
+        self.enabled = enabled
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            # Starts the clock the webhook's drains share (utils.invocation_time_left)
+            start_invocation()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.enabled and scope["type"] == "http" and (writer.pending() or writer._in_flight):
+                timeout = min(self.timeout, max(invocation_time_left(), 0.5))
+                left = await asyncio.to_thread(flush_events, timeout)
+                if left:
+                    log.warning("%d events still queued after %ss; they may be lost", left, timeout)
+
+
+def read_events(supabase, after=0, limit=200, event_type=None, subject=None, subject_id=None):
+    """
+    Events with id > after, oldest first, leaving out the most recent
+    EVENT_LOG_READ_LAG_SECONDS. Returns {"events": [...], "next": id to pass
+    as `after` next time}.
+    """
+    settled = (_utc_now() - datetime.timedelta(seconds=EVENT_LOG_READ_LAG_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
+    q = supabase.table("villingili_events").select("*")\
+        .gt("id", int(after))\
+        .lt("logged_at", settled)
+    if event_type:
+        q = q.eq("type", event_type)
+    if subject:
+        q = q.eq("subject", subject)
+    if subject_id is not None:
+        q = q.eq("subject_id", str(subject_id))
+    events = q.order("id").limit(limit).execute().data or []
+    for e in events:
+        if isinstance(e.get("data"), str):
+            e["data"] = json.loads(e["data"])  # LocalDB keeps JSON as text
+    return {"events": events, "next": events[-1]["id"] if events else int(after)}
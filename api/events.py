@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import asyncio
+import secrets
+import threading
+from collections import deque
+
+from .logs import get_logger
+
+log = get_logger("events")
+
+# In-process event bus for the dashboard's live request feed (SSE).
+#
+# publish() is safe to call from the event loop or from worker threads (sync
+# endpoints such as cron_expire). Every connected dashboard gets its own queue;
+# the last EVENT_BUFFER_SIZE events are kept so a reconnecting client can
+# resume from its Last-Event-ID. Event ids carry a per-process prefix, so a
+# client that reconnects to a restarted (or different) instance is told to
+# reload instead of silently missing events.
+
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "500"))
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+
+_BOOT = secrets.token_hex(4)
+
+
+class Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: end the stream, the client resumes from its last id
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBus:
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._subscribers = set()
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._seq += 1
+            event = {"id": f"{_BOOT}-{self._seq}", "seq": self._seq, "type": event_type, "data": data}
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, event)
+            except RuntimeError:
+                # Loop already closed
+                self.unsubscribe(sub)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """Returns (subscriber, backlog); backlog is None if the client must reload."""
+        sub = Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+            backlog = self._events_after(last_event_id)
+        return sub, backlog
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _events_after(self, last_event_id):
+        if not last_event_id:
+            return []
+        boot, _, seq = last_event_id.partition("-")
+        if boot != _BOOT or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        if not self._buffer or self._buffer[0]["seq"] > seq + 1:
+            return None  # fell out of the buffer
+        return [e for e in self._buffer if e["seq"] > seq]
+
+    def current_id(self):
+        with self._lock:
+            return f"{_BOOT}-{self._seq}"
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+bus = EventBus()
+
+
+# Request fields kept in the event log (the live feed gets the whole row)
+_LOGGED_FIELDS = ("requester_id", "blood_type", "location", "urgency", "island_code", "is_active", "donors_found")
+
+
+def publish_request_event(event_type, request):
+    """request_created | request_expired | donor_found; `request` is the (partial) row."""
+    try:
+        bus.publish(event_type, request)
+    except Exception as e:
+        # Never let the live feed break the bot flow
+        log.error("Event publish failed: %s", e)
+    from .event_log import record_event
+    record_event(event_type, "request", request.get("id"), {k: request[k] for k in _LOGGED_FIELDS if k in request})
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+async def sse_stream(request, last_event_id=None):
+    """Async generator for StreamingResponse(media_type="text/event-stream")."""
+    sub, backlog = bus.subscribe(last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        if backlog is None:
+            # Resume point unknown: client reloads the list, then continues from here
+            yield format_sse({"id": bus.current_id(), "type": "reset", "data": {}})
+        else:
+            for event in backlog:
+                yield format_sse(event)
+
+        last_beat = time.monotonic()
+        while True:
+            if await request.is_disconnected():
+                return
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                event = False
+            if event is None:
+                return  # overflowed
+            if event:
+                yield format_sse(event)
+            if time.monotonic() - last_beat >= SSE_HEARTBEAT_SECONDS:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                last_beat = time.monotonic()
+    finally:
+        bus.unsubscribe(sub)
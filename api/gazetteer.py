@@ -0,0 +1,241 @@
+import re
+from functools import lru_cache
+
+from .logs import get_logger
+from .request_parser import normalize_request_text
+
+log = get_logger("gazetteer")
+
+# Canonical places for free-text addresses and request locations.
+#
+# place_codes() maps text like "Maafannu, Male'", "L. Gan" or "IGMH" to an
+# island code ("K.Male": atoll code + island name) and an atoll code ("K").
+# Both are stored next to the text (island_code/atoll_code on villingili_users
+# and villingili_requests, see supabase/gazetteer.sql), so finding donors on
+# the requesting hospital's island or atoll is an indexed equality filter.
+# Rows saved before that are filled in by scripts/backfill_places.py.
+
+# Atoll code -> (name, aliases). Aliases are normalized (lowercase, no punctuation)
+ATOLLS = {
+    "HA": ("Haa Alif", ["haa alif", "haa alifu", "north thiladhunmathi"]),
+    "HDh": ("Haa Dhaalu", ["haa dhaalu", "haa dhaal", "south thiladhunmathi"]),
+    "Sh": ("Shaviyani", ["shaviyani", "north miladhunmadulu"]),
+    "N": ("Noonu", ["noonu", "south miladhunmadulu"]),
+    "R": ("Raa", ["raa atoll", "north maalhosmadulu"]),
+    "B": ("Baa", ["baa atoll", "south maalhosmadulu"]),
+    "Lh": ("Lhaviyani", ["lhaviyani", "faadhippolhu"]),
+    "K": ("Kaafu", ["kaafu", "male atoll", "north male atoll", "south male atoll"]),
+    "AA": ("Alif Alif", ["alif alif", "alifu alifu", "north ari atoll"]),
+    "ADh": ("Alif Dhaal", ["alif dhaal", "alifu dhaalu", "south ari atoll"]),
+    "V": ("Vaavu", ["vaavu", "felidhu atoll"]),
+    "M": ("Meemu", ["meemu", "mulaku atoll"]),
+    "F": ("Faafu", ["faafu", "north nilandhe atoll"]),
+    "Dh": ("Dhaalu", ["dhaalu", "south nilandhe atoll"]),
+    "Th": ("Thaa", ["thaa atoll", "kolhumadulu"]),
+    "L": ("Laamu", ["laamu", "hadhdhunmathi"]),
+    "GA": ("Gaafu Alif", ["gaafu alif", "gaafu alifu", "north huvadhu"]),
+    "GDh": ("Gaafu Dhaalu", ["gaafu dhaalu", "south huvadhu"]),
+    "Gn": ("Gnaviyani", ["gnaviyani"]),
+    "S": ("Seenu", ["seenu", "addu", "addu city", "addu atoll"]),
+}
+
+# Atoll prefixes as written before island names ("GA. Villingili", "L Gan")
+ATOLL_PREFIXES = {
+    "HA": ["ha"], "HDh": ["hdh", "hd"], "Sh": ["sh"], "N": ["n"], "R": ["r"], "B": ["b"],
+    "Lh": ["lh"], "K": ["k"], "AA": ["aa"], "ADh": ["adh", "ad"], "V": ["v"], "M": ["m"],
+    "F": ["f"], "Dh": ["dh"], "Th": ["th"], "L": ["l"], "GA": ["ga"], "GDh": ["gdh", "gd"],
+    "Gn": ["gn"], "S": ["s"],
+}
+
+# (atoll code, island, aliases). An island name found in several atolls is
+# listed most populous first; that one wins unless the text names the atoll.
+# normalize_request_text() already turns "Male'" and "Malé" into "maale".
+ISLANDS = [
+    ("K", "Male", ["maale", "male city", "henveiru", "galolhu", "maafannu", "machchangolhi"]),
+    ("K", "Hulhumale", ["hulhumale", "hulhumaale", "hulhumalé"]),
+    ("K", "Villingili", ["villingili", "villimale", "vilimale", "viligili"]),
+    ("K", "Hulhule", ["hulhule", "airport"]),
+    ("K", "Thilafushi", ["thilafushi"]),
+    ("K", "Maafushi", ["maafushi"]),
+    ("K", "Guraidhoo", ["guraidhoo"]),
+    ("K", "Gulhi", ["gulhi"]),
+    ("K", "Huraa", ["huraa"]),
+    ("K", "Himmafushi", ["himmafushi"]),
+    ("K", "Thulusdhoo", ["thulusdhoo"]),
+    ("K", "Dhiffushi", ["dhiffushi"]),
+    ("K", "Kaashidhoo", ["kaashidhoo"]),
+    ("S", "Hithadhoo", ["hithadhoo"]),
+    ("S", "Maradhoo", ["maradhoo", "maradhoo feydhoo"]),
+    ("S", "Feydhoo", ["feydhoo"]),
+    ("S", "Gan", ["gan"]),
+    ("S", "Meedhoo", ["meedhoo"]),
+    ("S", "Hulhudhoo", ["hulhudhoo"]),
+    ("Gn", "Fuvahmulah", ["fuvahmulah", "fuvamulah", "foammulah", "fuvahmulah city"]),
+    ("HDh", "Kulhudhuffushi", ["kulhudhuffushi", "kulhudhuffushi city"]),
+    ("HDh", "Hanimaadhoo", ["hanimaadhoo"]),
+    ("HDh", "Nolhivaram", ["nolhivaram"]),
+    ("HA", "Dhidhdhoo", ["dhidhdhoo"]),
+    ("HA", "Ihavandhoo", ["ihavandhoo"]),
+    ("HA", "Hoarafushi", ["hoarafushi"]),
+    ("HA", "Baarah", ["baarah"]),
+    ("Sh", "Funadhoo", ["funadhoo"]),
+    ("Sh", "Milandhoo", ["milandhoo"]),
+    ("Sh", "Komandoo", ["komandoo"]),
+    ("N", "Manadhoo", ["manadhoo"]),
+    ("N", "Velidhoo", ["velidhoo"]),
+    ("N", "Holhudhoo", ["holhudhoo"]),
+    ("R", "Ungoofaaru", ["ungoofaaru"]),
+    ("R", "Dhuvaafaru", ["dhuvaafaru"]),
+    ("R", "Alifushi", ["alifushi"]),
+    ("R", "Maduvvari", ["maduvvari"]),
+    ("B", "Eydhafushi", ["eydhafushi"]),
+    ("B", "Thulhaadhoo", ["thulhaadhoo"]),
+    ("Lh", "Naifaru", ["naifaru"]),
+    ("Lh", "Hinnavaru", ["hinnavaru"]),
+    ("AA", "Rasdhoo", ["rasdhoo"]),
+    ("AA", "Thoddoo", ["thoddoo"]),
+    ("AA", "Ukulhas", ["ukulhas"]),
+    ("ADh", "Mahibadhoo", ["mahibadhoo"]),
+    ("ADh", "Dhangethi", ["dhangethi"]),
+    ("ADh", "Maamigili", ["maamigili"]),
+    ("V", "Felidhoo", ["felidhoo"]),
+    ("V", "Keyodhoo", ["keyodhoo"]),
+    ("M", "Muli", ["muli"]),
+    ("M", "Dhiggaru", ["dhiggaru"]),
+    ("F", "Nilandhoo", ["nilandhoo"]),
+    ("F", "Magoodhoo", ["magoodhoo"]),
+    ("Dh", "Kudahuvadhoo", ["kudahuvadhoo"]),
+    ("Dh", "Meedhoo", ["meedhoo"]),
+    ("Th", "Veymandoo", ["veymandoo"]),
+    ("Th", "Thimarafushi", ["thimarafushi"]),
+    ("Th", "Guraidhoo", ["guraidhoo"]),
+    ("L", "Fonadhoo", ["fonadhoo"]),
+    ("L", "Gan", ["gan"]),
+    ("L", "Hithadhoo", ["hithadhoo"]),
+    ("L", "Isdhoo", ["isdhoo"]),
+    ("L", "Maabaidhoo", ["maabaidhoo"]),
+    ("GA", "Villingili", ["villingili", "viligili"]),
+    ("GA", "Dhaandhoo", ["dhaandhoo"]),
+    ("GA", "Kolamaafushi", ["kolamaafushi"]),
+    ("GDh", "Thinadhoo", ["thinadhoo"]),
+    ("GDh", "Gadhdhoo", ["gadhdhoo"]),
+]
+
+# Aliases that are also English words. In request text they only count after
+# an atoll prefix ("K. Male"; "A+ male patient" is not the island); in an
+# address ("H. Sunny Side, Male") they count bare too.
+PREFIXED_ONLY = {"male": "K.Male"}
+
+# Hospital -> island code (names as in request_parser.KNOWN_LOCATIONS)
+HOSPITALS = {
+    "IGMH": ("K.Male", ["igmh", "indira gandhi", "indira gandhi memorial hospital", "igm hospital"]),
+    "ADK": ("K.Male", ["adk", "adk hospital"]),
+    "Tree Top": ("K.Male", ["tree top", "treetop", "tree top hospital"]),
+    "Senahiya": ("K.Male", ["senahiya", "senahiya hospital"]),
+    "Hulhumale Hospital": ("K.Hulhumale", ["hulhumale hospital", "hulhumale hosp"]),
+    "Villimale Hospital": ("K.Villingili", ["villimale hospital", "villingili hospital"]),
+    "Hithadhoo Regional Hospital": ("S.Hithadhoo", ["hithadhoo regional hospital", "addu hospital", "ehrh"]),
+    "Kulhudhuffushi Regional Hospital": ("HDh.Kulhudhuffushi", ["kulhudhuffushi regional hospital", "kulhudhuffushi hospital", "krh"]),
+    "Gan Regional Hospital": ("L.Gan", ["gan regional hospital", "gan hospital"]),
+    "Fuvahmulah Hospital": ("Gn.Fuvahmulah", ["fuvahmulah hospital"]),
+    "Thinadhoo Regional Hospital": ("GDh.Thinadhoo", ["thinadhoo regional hospital", "thinadhoo hospital"]),
+}
+
+
+def island_code(atoll, island):
+    return f"{atoll}.{island}"
+
+
+def _build_index():
+    # alias -> candidate island codes, in ISLANDS order; hospitals have exactly one
+    by_alias = {}
+    for atoll, island, aliases in ISLANDS:
+        for alias in aliases:
+            by_alias.setdefault(alias, []).append(island_code(atoll, island))
+    for alias, code in PREFIXED_ONLY.items():
+        by_alias.setdefault(alias, []).append(code)
+    hospital_aliases = set()
+    for code, aliases in HOSPITALS.values():
+        for alias in aliases:
+            by_alias[alias] = [code]
+            hospital_aliases.add(alias)
+    # Longest alias first, so "hulhumale hospital" beats "hulhumale" at the same position
+    alternation = "|".join(re.escape(a) for a in sorted(by_alias, key=len, reverse=True))
+    prefixes = {p: atoll for atoll, ps in ATOLL_PREFIXES.items() for p in ps}
+    island_re = re.compile(
+        rf"(?<!\w)(?:({'|'.join(sorted(prefixes, key=len, reverse=True))})\s+)?({alternation})(?!\w)"
+    )
+    atoll_aliases = {a: code for code, (_, aliases) in ATOLLS.items() for a in aliases}
+    atoll_re = re.compile(rf"(?<!\w)({'|'.join(re.escape(a) for a in sorted(atoll_aliases, key=len, reverse=True))})(?!\w)")
+    return by_alias, hospital_aliases, prefixes, island_re, atoll_aliases, atoll_re
+
+
+_BY_ALIAS, _HOSPITAL_ALIASES, _PREFIXES, _ISLAND_RE, _ATOLL_ALIASES, _ATOLL_RE = _build_index()
+
+
+def place_codes(text, address=False):
+    """{"island_code", "atoll_code"} for a location, or a user's address with
+    `address`; None where unknown."""
+    island, atoll = _lookup(normalize_request_text(text or ""), address)
+    return {"island_code": island, "atoll_code": atoll}
+
+
+@lru_cache(maxsize=4096)
+def _lookup(norm, address=False):
+    atoll_matches = list(_ATOLL_RE.finditer(norm))
+    named_atoll = _ATOLL_ALIASES[atoll_matches[0].group(1)] if atoll_matches else None
+
+    # A hospital beats an island named with its atoll ("L. Gan"), which beats a
+    # bare island name; the earliest match wins among equals
+    best = None
+    for match in _ISLAND_RE.finditer(norm):
+        prefix, alias = match.group(1), match.group(2)
+        if alias in PREFIXED_ONLY and not prefix:
+            # Not even in an address when it's part of an atoll's name ("Male Atoll")
+            if not address or any(a.start() <= match.start(2) < a.end() for a in atoll_matches):
+                continue
+        rank = 0 if alias in _HOSPITAL_ALIASES else 1 if prefix else 2
+        if best is not None and rank >= best[0]:
+            continue
+        candidates = _BY_ALIAS[alias]
+        wanted = _PREFIXES.get(prefix) or named_atoll
+        best = (rank, next((c for c in candidates if c.split(".")[0] == wanted), candidates[0]))
+        if rank == 0:
+            break
+    if best is None:
+        return None, named_atoll
+    return best[1], best[1].split(".")[0]
+
+
+_installed = None
+
+
+def columns_installed(supabase):
+    """Whether gazetteer.sql has been run (checked once per process)."""
+    global _installed
+    if _installed is None:
+        try:
+            supabase.table("villingili_users").select("island_code, atoll_code").limit(1).execute()
+            _installed = True
+        except Exception as e:
+            _installed = False
+            log.warning("island_code/atoll_code columns are missing (run supabase/gazetteer.sql): %s", e)
+    return _installed
+
+
+def place_fields(supabase, text, address=False):
+    """The code columns to save along with `text`, or {} before gazetteer.sql."""
+    if not supabase or not columns_installed(supabase):
+        return {}
+    return place_codes(text, address)
+
+
+def sync_user_place(supabase, user):
+    """Updates a user's codes if they don't match their address; returns the row."""
+    if not user or "island_code" not in user:
+        return user
+    codes = place_codes(user.get("address"), address=True)
+    if all(user.get(k) == v for k, v in codes.items()):
+        return user
+    supabase.table("villingili_users").update(codes).eq("telegram_id", user["telegram_id"]).execute()
+    return {**user, **codes}
@@ -1,55 +1,29 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, BackgroundTasks
 import asyncio
 from .utils import get_supabase_client, parse_request_with_ai, send_telegram_message
+from .logs import get_logger
+from .merge import merge_users, TAKE_SOURCE, FILL_MISSING
 from dotenv import load_dotenv
 
 load_dotenv()
 
+log = get_logger("bot")
+
 app = FastAPI()
 
 # Enable CORS for local development
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse
 import os
-import jwt
-from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException, status
 
-# Security Config
-SECRET_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Using Service Key as Secret implies robust secret, or use a dedicated one.
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 4320
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Admin auth (JWT, bcrypt) lives in api/admin_auth.py and is imported on first use
 security = HTTPBearer()
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        # Check for special migration token if needed, or just standard JWT
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return username
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    from .admin_auth import verify_admin_token
+    return verify_admin_token(credentials.credentials)
 
 
 app.add_middleware(
@@ -60,58 +34,135 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global Cache
-PENDING_SCANS = {}
+# Serverless: writes the request's queued events before the invocation ends
+from .event_log import EventFlushMiddleware
+app.add_middleware(EventFlushMiddleware)
+
+# Per-route latency / in-flight / error metrics (see api/metrics.py); outermost
+from .metrics import MetricsMiddleware, track_flow
+from .tracing import trace_update
+app.add_middleware(MetricsMiddleware)
 
-# --- SERVE FRONTEND (STATIC FILES) ---
 # --- SERVE FRONTEND (STATIC FILES) ---
 # Files are copied to 'static' folder next to this file during build
-base_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Robustly find dist_dir (api/static)
-possible_static_dirs = [
-    os.path.join(base_dir, "static"),
-    os.path.join(os.getcwd(), "api", "static"),
-    os.path.join(base_dir, "..", "api", "static"),
-]
-dist_dir = os.path.join(base_dir, "static") # Default
-for d in possible_static_dirs:
-    if os.path.isdir(d) and (os.path.exists(os.path.join(d, "index.html")) or os.path.exists(os.path.join(d, "favicon.png"))):
-        dist_dir = d
-        print(f"Server: Found static dir at {dist_dir}")
-        break
-
-assets_dir = os.path.join(dist_dir, "assets")
-
-if os.path.exists(assets_dir):
-    app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
+# (see api/static_files.py for caching / precompressed variants)
+from .static_files import serve_static, serve_index
+
+@app.get("/assets/{asset_path:path}")
+async def serve_asset(request: Request, asset_path: str):
+    return serve_static(request, f"assets/{asset_path}") or JSONResponse({"error": "Asset not found"}, status_code=404)
 
 @app.get("/api/index")
 def home():
     return {"message": "Blood Donation Bot API is running"}
 
 @app.get("/api/users")
-def get_users(current_user: str = Depends(get_current_admin)):
+def get_users(request: Request, current_user: str = Depends(get_current_admin)):
+    from .etag import table_version, make_etag, conditional_json
     supabase = get_supabase_client()
-    res = supabase.table("villingili_users").select("*").order("created_at", desc=True).execute()
-    return res.data
+    etag = make_etag(table_version(supabase, "villingili_users"))
+    return conditional_json(request, etag, lambda: supabase.table("villingili_users").select("*").order("created_at", desc=True).execute().data)
 
 @app.get("/api/requests")
-def get_requests(current_user: str = Depends(get_current_admin)):
+def get_requests(request: Request, current_user: str = Depends(get_current_admin)):
+    from .etag import table_version, make_etag, conditional_json
     supabase = get_supabase_client()
+    # Requester names are joined in, so user edits change the tag too
+    etag = make_etag(table_version(supabase, "villingili_requests"), table_version(supabase, "villingili_users"))
+    return conditional_json(request, etag, lambda: _build_requests_list(supabase))
+
+def _build_requests_list(supabase):
+    from .changes import _attach_requesters
     res = supabase.table("villingili_requests").select("*").order("created_at", desc=True).limit(50).execute()
-    requests = res.data
-    
-    # Manual Join to populate requester info
-    for req in requests:
-        user_id = req.get("requester_id")
-        if user_id:
-            user_res = supabase.table("villingili_users").select("full_name, phone_number").eq("telegram_id", user_id).execute()
-            if user_res.data:
-                req["requester"] = user_res.data[0]
-            else:
-                 req["requester"] = None
-    return requests
+    # Manual Join to populate requester info (one query for the page)
+    return _attach_requesters(supabase, res.data)
+
+@app.get("/api/requests/stream")
+async def stream_requests(request: Request, token: str, last_event_id: str = None):
+    # EventSource can't send an Authorization header, so the JWT comes in the query
+    from .admin_auth import verify_admin_token
+    verify_admin_token(token)
+    from fastapi.responses import StreamingResponse
+    from .events import sse_stream
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        sse_stream(request, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/changes")
+def get_changes_api(since: str = None, tables: str = "users,requests", current_user: str = Depends(get_current_admin)):
+    from .changes import get_changes, SYNC_TABLES
+    supabase = get_supabase_client()
+    names = [t for t in tables.split(",") if t in SYNC_TABLES]
+    if not names:
+        return JSONResponse({"error": f"tables must be among {', '.join(SYNC_TABLES)}"}, status_code=400)
+    try:
+        return get_changes(supabase, names, since)
+    except Exception as e:
+        # e.g. changes.sql not applied yet: clients still work off full reloads
+        log.error("Delta sync failed, sending full snapshot: %s", e)
+        return get_changes(supabase, names, None)
+
+async def get_metrics_reader(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # A scraper can use METRICS_TOKEN; people use their admin login
+    import hmac
+    from .metrics import METRICS_TOKEN
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return "metrics"
+    return await get_current_admin(credentials)
+
+@app.get("/api/metrics")
+def get_metrics_api(reader: str = Depends(get_metrics_reader)):
+    from fastapi.responses import PlainTextResponse
+    from .metrics import render_metrics
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/donor_alerts")
+def get_donor_alerts(current_user: str = Depends(get_current_admin)):
+    # Queue depth, totals by urgency/result and the latest requests' fan-out
+    from .donor_alerts import alerts
+    return alerts.snapshot()
+
+@app.get("/api/stats")
+def get_stats_api(days: int = 30, current_user: str = Depends(get_current_admin)):
+    # Donors by blood type/status/eligibility and requests per day, from the counter tables
+    from .stats import get_stats
+    return get_stats(get_supabase_client(), days)
+
+@app.post("/api/stats/recompute")
+def recompute_stats_api(current_user: str = Depends(get_current_admin)):
+    from .stats import recompute_stats
+    try:
+        return {"status": "ok", **recompute_stats(get_supabase_client())}
+    except Exception as e:
+        log.error("Stats Recompute Error: %s", e)
+        return {"status": "error", "detail": str(e)}
+
+@app.get("/api/events")
+def get_events_api(after: int = 0, limit: int = 200, type: str = None, subject: str = None, subject_id: str = None,
+                   current_user: str = Depends(get_current_admin)):
+    # The event log, oldest first from `after`; pass back `next` to continue
+    from .event_log import read_events
+    try:
+        return read_events(get_supabase_client(), after, max(1, min(limit, 1000)), type, subject, subject_id)
+    except Exception as e:
+        log.error("Event Log Read Error: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/api/traces/slow")
+def get_slow_traces_api(limit: int = 20, current_user: str = Depends(get_current_admin)):
+    from .tracing import get_slow_traces, TRACE_SLOW_MS
+    return {"threshold_ms": TRACE_SLOW_MS, "traces": get_slow_traces(max(1, min(limit, 100)))}
+
+@app.get("/api/scan_jobs/{job_id}")
+def get_scan_job_api(job_id: str, current_user: str = Depends(get_current_admin)):
+    from .ocr import get_scan_job
+    job = get_scan_job(get_supabase_client(), job_id)
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
 
 @app.get("/api/debug_files")
 def debug_files():
@@ -133,6 +184,30 @@ def debug_files():
 
 
 
+# Seconds of channel edits cron_expire sends per run (under maxDuration in vercel.json)
+CRON_EXPIRE_EDIT_SECONDS = float(os.environ.get("CRON_EXPIRE_EDIT_SECONDS", "40"))
+_expired_posts_installed = None
+
+def expired_posts_installed(supabase):
+    """Whether expired_posts.sql has been run (checked once per process)."""
+    global _expired_posts_installed
+    if _expired_posts_installed is None:
+        try:
+            res = supabase.table("villingili_requests").select("expired_post_pending").limit(1).execute()
+            _expired_posts_installed = not getattr(res, "error", None)
+        except Exception as e:
+            _expired_posts_installed = False
+            log.warning("expired_post_pending is missing (run supabase/expired_posts.sql): %s", e)
+    return _expired_posts_installed
+
+def expired_post_text(req):
+    return (
+        f"⏳ <b>EXPIRED REQUEST</b>\n"
+        f"Type: {req.get('blood_type')}\n"
+        f"Location: {req.get('location')}\n"
+        f"Requester: (Expired)"
+    )
+
 @app.get("/api/cron_expire")
 def cron_expire():
     supabase = get_supabase_client()
@@ -148,41 +223,82 @@ def cron_expire():
     
     try:
         active_reqs = supabase.table("villingili_requests").select("*").eq("is_active", True).execute()
-        if not active_reqs.data:
-            return {"status": "ok", "count": 0}
             
         from datetime import datetime, timezone, timedelta
+        from .channel_edits import CHANNEL_EDIT_INTERVAL_SECONDS, coalescer, queue_edit, flush_edits
+        from .events import publish_request_event
+        chan_id = os.environ.get("TELEGRAM_CHANNEL_ID")
+        tracked = bool(chan_id) and expired_posts_installed(supabase)
         now = datetime.now(timezone.utc)
         expired_count = 0
+        to_edit = []
         
-        for req in active_reqs.data:
+        for req in active_reqs.data or []:
             created_at = datetime.fromisoformat(req["created_at"].replace('Z', '+00:00'))
             if now - created_at > timedelta(hours=24):
-                # Expire it
-                supabase.table("villingili_requests").update({"is_active": False}).eq("id", req["id"]).execute()
+                # Expire it (always; only the channel edits are rate limited)
+                has_post = bool(chan_id and req.get("telegram_message_id"))
+                changes = {"is_active": False}
+                if has_post and tracked:
+                    changes["expired_post_pending"] = True
+                supabase.table("villingili_requests").update(changes).eq("id", req["id"]).execute()
                 expired_count += 1
-                
-                # Update Telegram Message
-                if req.get("telegram_message_id") and os.environ.get("TELEGRAM_CHANNEL_ID"):
-                    try:
-                         # We need to import edit_telegram_message logic
-                         # Re-fetching utils here if needed or relying on global scope if merged
-                         from .utils import edit_telegram_message 
-                         chan_id = os.environ.get("TELEGRAM_CHANNEL_ID")
-                         new_text = (
-                             f"⏳ <b>EXPIRED REQUEST</b>\n"
-                             f"Type: {req.get('blood_type')}\n"
-                             f"Location: {req.get('location')}\n"
-                             f"Requester: (Expired)"
-                         )
-                         edit_telegram_message(chan_id, req["telegram_message_id"], new_text)
-                    except Exception as e:
-                        print(f"Failed to edit msg: {e}")
-                        
-        return {"status": "ok", "expired": expired_count}
+                publish_request_event("request_expired", {"id": req["id"], "is_active": False})
+                if has_post and not tracked:
+                    to_edit.append(req)
+
+        # 2. Channel edits, oldest first: as many as go out at the edit rate in
+        # CRON_EXPIRE_EDIT_SECONDS; flagged posts left over wait for the next run
+        slots = max(1, int(CRON_EXPIRE_EDIT_SECONDS / max(CHANNEL_EDIT_INTERVAL_SECONDS, 0.01))) - coalescer.pending()
+        if tracked:
+            to_edit = []
+            if slots > 0:
+                to_edit = supabase.table("villingili_requests").select("id, blood_type, location, telegram_message_id")\
+                    .eq("expired_post_pending", True).order("created_at").limit(slots).execute().data or []
+        elif len(to_edit) > slots:
+            log.warning("cron_expire: %d expired posts won't be edited (run supabase/expired_posts.sql to carry them over)", len(to_edit) - max(slots, 0))
+            to_edit = to_edit[:max(slots, 0)]
+        for req in to_edit:
+            queue_edit(chan_id, req["telegram_message_id"], expired_post_text(req))
+
+        # Serverless instances may freeze once we return
+        left = flush_edits(timeout=min(coalescer.drain_seconds() + 5, CRON_EXPIRE_EDIT_SECONDS + 5))
+        if tracked:
+            done = [r["id"] for r in to_edit if not coalescer.is_queued(chan_id, r["telegram_message_id"])]
+            if done:
+                supabase.table("villingili_requests").update({"expired_post_pending": False}).in_("id", done).execute()
+        if left:
+            log.warning("cron_expire: %d channel edits unsent; flagged posts are retried next run", left)
+        return {"status": "ok", "expired": expired_count, "edited": len(to_edit) - left, "edits_unsent": left}
+
+    except Exception as e:
+        log.error("Cron Error: %s", e)
+        return {"status": "error", "detail": str(e)}
 
+def verify_cron(request: Request):
+    # Vercel cron calls carry "Authorization: Bearer $CRON_SECRET"
+    secret = os.environ.get("CRON_SECRET")
+    if not secret:
+        if os.environ.get("VERCEL"):
+            raise HTTPException(status_code=503, detail="CRON_SECRET is not set")
+        return  # local runs
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {secret}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid cron secret")
+
+@app.get("/api/cron_outbox", dependencies=[Depends(verify_cron)])
+async def cron_outbox():
+    # Channel posts left behind by an instance that stopped before sending them
+    from .outbox import dispatch_outbox
+    return {"status": "ok", **await dispatch_outbox(once=True)}
+
+@app.get("/api/cron_snapshot", dependencies=[Depends(verify_cron)])
+def cron_snapshot(full: bool = False):
+    # Keeps the local copy donor lookups fall back to when Supabase is down
+    from .snapshot import refresh_snapshot, snapshot_age
+    try:
+        written = refresh_snapshot(get_supabase_client(), full=full)
+        return {"status": "ok", "written": written, "age_seconds": snapshot_age()}
     except Exception as e:
-        print(f"Cron Error: {e}")
         return {"status": "error", "detail": str(e)}
 
 from pydantic import BaseModel
@@ -204,6 +320,9 @@ async def update_user_api(user: UserUpdate, current_user: str = Depends(get_curr
     
     data = user.dict(exclude_unset=True)
     tid = data.pop("telegram_id")
+    if "address" in data:
+        from .gazetteer import place_fields
+        data.update(place_fields(supabase, data["address"], address=True))
     
     try:
         # Check Phone Conflict logic (retained)
@@ -213,34 +332,38 @@ async def update_user_api(user: UserUpdate, current_user: str = Depends(get_curr
              if conflict.data:
                   other_u = conflict.data[0]
                   curr_name = data.get("full_name")
-                  if not curr_name:
-                       curr_u = supabase.table("villingili_users").select("full_name").eq("telegram_id", tid).execute()
-                       if curr_u.data: curr_name = curr_u.data[0].get('full_name')
+                  c_id = data.get("id_card_number")
+                  if not curr_name or not c_id:
+                       curr_u = supabase.table("villingili_users").select("full_name, id_card_number").eq("telegram_id", tid).execute()
+                       if curr_u.data:
+                            curr_name = curr_name or curr_u.data[0].get('full_name')
+                            c_id = c_id or curr_u.data[0].get("id_card_number")
                   
                   c_low = (curr_name or "").lower().strip()
                   o_low = (other_u.get("full_name") or "").lower().strip()
                   name_match = (c_low == o_low)
-                  c_id = data.get("id_card_number")
-                  if not c_id:
-                       if curr_u and curr_u.data: c_id = curr_u.data[0].get("id_card_number")
                   o_id = other_u.get("id_card_number")
                   id_conflict = False
                   if c_id and o_id and c_id.upper() != o_id.upper(): id_conflict = True
                   
                   if name_match and not id_conflict:
-                       old_id = other_u['telegram_id']
-                       supabase.table("villingili_users").update({"phone_number": f"{phone}_old_{old_id}"}).eq("telegram_id", old_id).execute()
-                       supabase.table("villingili_requests").update({"requester_id": tid}).eq("requester_id", old_id).execute()
-                       supabase.table("villingili_users").delete().eq("telegram_id", old_id).execute()
+                       # Fold the other record into this one, edits included
+                       merge_users(supabase, other_u['telegram_id'], tid, fields=data, actor=current_user)
+                       return {"status": "ok"}
                   else:
                        msg = f"Phone taken by {other_u.get('full_name')}"
                        if id_conflict: msg += " (ID Mismatch)"
                        return {"status": "error", "detail": msg}
 
         supabase.table("villingili_users").update(data).eq("telegram_id", tid).execute()
+        from .event_log import record_event
+        if "status" in data:
+            record_event("status_changed", "user", tid, {"status": data["status"], "via": "dashboard", "fields": sorted(data)}, actor=current_user)
+        else:
+            record_event("user_updated", "user", tid, {"fields": sorted(data)}, actor=current_user)
         return {"status": "ok"}
     except Exception as e:
-        print(f"Update Error: {e}")
+        log.error("Update Error: %s", e)
         return {"status": "error", "detail": str(e)}
 
 # ---------------- ADMIN AUTH ----------------
@@ -252,64 +375,21 @@ class AdminLogin(BaseModel):
 
 @app.post("/api/admin_login")
 async def admin_login_api(creds: AdminLogin):
-    try:
-        supabase = get_supabase_client()
-        if not supabase: return {"error": "DB Failed"}
-        
-        # 1. Fetch user by Phone OR Username
-        # We fetch the HASHED password (or plain text if not migrated yet)
-        user_res = supabase.table("villingili_admin_users").select("*").eq("phone_number", creds.username).execute()
-        if not user_res.data:
-             user_res = supabase.table("villingili_admin_users").select("*").eq("username", creds.username).execute()
-        
-        if not user_res.data:
-            return {"status": "error", "message": "User not found"}
-            
-        admin = user_res.data[0]
-        stored_pw = admin["password"]
-        
-        # 2. Verify Password (Handle Legacy Plain Text vs Bcrypt)
-        is_valid = False
-        try:
-            # Try verifying as hash
-            if verify_password(creds.password, stored_pw):
-                is_valid = True
-        except:
-            # Fallback for legacy plain text (temporary migration logic)
-            if stored_pw == creds.password:
-                is_valid = True
-                # Auto-migrate to hash?!
-                new_hash = get_password_hash(stored_pw)
-                supabase.table("villingili_admin_users").update({"password": new_hash}).eq("id", admin["id"]).execute()
-        
-        if is_valid:
-            # 3. Generate Token
-            access_token = create_access_token(data={"sub": admin["username"], "role": "admin"})
-            
-            return {
-                "status": "ok",
-                "access_token": access_token, 
-                "token_type": "bearer",
-                "user": {
-                    "username": admin["username"],
-                    "phone_number": admin["phone_number"],
-                    "role": "admin",
-                    "telegram_id": admin["telegram_id"]
-                }
-            }
-            
-        return {"status": "error", "message": "Invalid Password"}
-    except Exception as e:
-        print(f"Login Error: {e}")
-        return {"status": "error", "message": f"Server Error: {str(e)}"}
+    from .admin_auth import admin_login
+    return await admin_login(creds.username, creds.password)
 
 @app.get("/api/get_admins")
-async def get_admins_api(current_user: str = Depends(get_current_admin)):
+async def get_admins_api(request: Request, current_user: str = Depends(get_current_admin)):
+    from .etag import table_version, make_etag, conditional_json
     supabase = get_supabase_client()
     if not supabase:
-        print("DB Connection Failed in get_admins")
+        log.error("DB Connection Failed in get_admins")
         return []
-        
+    # "Linked" phone numbers are resolved from villingili_users
+    etag = make_etag(table_version(supabase, "villingili_admin_users"), table_version(supabase, "villingili_users"))
+    return conditional_json(request, etag, lambda: _build_admins_list(supabase))
+
+def _build_admins_list(supabase):
     # Security: This should verify header token actually, but we are skipping for MVP speed
     # Assuming Frontend only calls this if logged in. 
     # (In prod, add Auth Header check)
@@ -358,7 +438,8 @@ async def update_password_api(body: PasswordUpdate, current_user: str = Depends(
     identifier = body.username 
     # If frontend sends phone in username field:
     # HASH THE PASSWORD BEFORE SAVING!
-    hashed_pw = get_password_hash(body.new_password)
+    from .admin_auth import run_auth_work, get_password_hash
+    hashed_pw = await run_auth_work(get_password_hash, body.new_password)
     
     res = supabase.table("villingili_admin_users").update({"password": hashed_pw}).eq("phone_number", identifier).execute()
     
@@ -389,7 +470,8 @@ async def create_admin_api(body: AdminCreate, current_user: str = Depends(get_cu
     fake_id = int(datetime.now().timestamp() * 1000)
     
     # Hash default password
-    hashed_pw = get_password_hash("Password1")
+    from .admin_auth import run_auth_work, get_password_hash
+    hashed_pw = await run_auth_work(get_password_hash, "Password1")
     
     data = {
         "username": body.username,
@@ -405,34 +487,41 @@ async def create_admin_api(body: AdminCreate, current_user: str = Depends(get_cu
         return {"status": "error", "message": str(e)}
 
 
+@track_flow
+@trace_update
 async def process_update(data):
     from .utils import send_telegram_message
     supabase = get_supabase_client()
-    print(f"DEBUG: process_update called with keys: {list(data.keys())}", flush=True)
+    log.debug("process_update called with keys: %s", list(data.keys()))
     if not supabase:
-        print("DB connection failed")
+        log.error("DB connection failed")
         return
 
-    global PENDING_SCANS
-
     # Handle Callback Queries (Buttons)
     if "callback_query" in data:
         cb = data["callback_query"]
         cb_id = cb["id"]
         chat_id = cb["message"]["chat"]["id"]
-        print(f'DEBUG: Chat ID={chat_id}')
+        log.debug('Chat ID=%s', chat_id)
         user_id = cb["from"]["id"]
         data_str = cb.get("data")
-        print(f"DEBUG: Callback received: {data_str} from {user_id}")
+        log.debug("Callback received: %s from %s", data_str, user_id)
         
-        # Check registration
+        # Check registration (from the local snapshot while Supabase is down)
         try:
-            user_query = supabase.table("villingili_users").select("*").eq("telegram_id", user_id).execute()
-            user = user_query.data[0] if user_query.data else None
+            from .snapshot import read_through
+            rows, user_age = read_through(supabase, lambda db: db.table("villingili_users").select("*").eq("telegram_id", user_id).execute().data)
+            user = rows[0] if rows else None
         except Exception as e:
-            print(f"DEBUG: User check failed: {e}")
+            log.warning("User check failed: %s", e)
             return
         
+        if not user and user_age is not None:
+             # May have registered after the snapshot was taken
+             from .utils import answer_callback_query
+             answer_callback_query(cb_id, text="⚠️ Database unreachable right now. Please try again in a few minutes.", show_alert=True)
+             return
+
         if not user:
              # If channel interaction or user hasn't started bot, send alert instead of message
              # Redirect to Bot Start
@@ -452,14 +541,18 @@ async def process_update(data):
 
         if data_str.startswith("force_update_"):
             fake_tg_id = data_str.split("_")[2]
-            # global PENDING_SCANS (Declared at top)
-            user_data = PENDING_SCANS.get(fake_tg_id)
+            # Shared, TTL-bounded store; pop so a double click can't apply it twice
+            from .pending_store import get_pending_scan_store
+            user_data = get_pending_scan_store().pop(fake_tg_id)
             
             if user_data:
-                # Execute Update
-                supabase.table("villingili_users").upsert(user_data).execute()
-                # Clean cache
-                del PENDING_SCANS[fake_tg_id]
+                # Only the scanned fields; the rest of the row stays as it is
+                from .gazetteer import place_fields
+                changes = {k: v for k, v in user_data.items() if k != "telegram_id"}
+                changes.update(place_fields(supabase, changes.get("address"), address=True))
+                supabase.table("villingili_users").update(changes).eq("telegram_id", user_data["telegram_id"]).execute()
+                from .event_log import record_event
+                record_event("user_updated", "user", user_data["telegram_id"], {"fields": sorted(changes), "via": "scan"}, actor=user_id)
                 
                 # Proceed to Confirm
                 msg_text = (
@@ -481,8 +574,8 @@ async def process_update(data):
 
         if data_str.startswith("cancel_update_"):
             fake_tg_id = data_str.split("_")[2]
-            if str(fake_tg_id) in PENDING_SCANS:
-                del PENDING_SCANS[str(fake_tg_id)]
+            from .pending_store import get_pending_scan_store
+            get_pending_scan_store().pop(fake_tg_id)
             
             from .utils import edit_telegram_message
             msg_id = cb["message"]["message_id"]
@@ -603,8 +696,8 @@ async def process_update(data):
             # 1. Fetch & Send Donor List
             try:
                 # Exclude self? .neq("telegram_id", user_id)
-                donors = supabase.table("villingili_users").select("full_name, phone_number").eq("blood_type", blood_type).eq("status", "active").execute()
-                donor_list = donors.data
+                from .snapshot import read_through, stale_note
+                donor_list, age = read_through(supabase, lambda db: db.table("villingili_users").select("full_name, phone_number").eq("blood_type", blood_type).eq("status", "active").execute().data)
                 
                 if donor_list:
                     list_text = f"🩸 <b>Found {len(donor_list)} Donors for {blood_type}:</b>\n\n"
@@ -612,6 +705,7 @@ async def process_update(data):
                         list_text += f"👤 {d.get('full_name')} - ☎️ {d.get('phone_number')}\n"
                 else:
                     list_text = f"🩸 <b>No active donors found for {blood_type}</b> yet."
+                list_text += stale_note(age)
                 
                 # Send List Privately
                 # Use edit for the button message or new message? User said "send list". 
@@ -620,7 +714,7 @@ async def process_update(data):
                 edit_telegram_message(chat_id, cb["message"]["message_id"], list_text)
                 
             except Exception as e:
-                print(f"Donor Fetch Error: {e}")
+                log.error("Donor Fetch Error: %s", e)
                 send_telegram_message(chat_id, "⚠️ Error fetching donor list.")
 
             # 2. Auto-Create Request & Broadcast (Location: Not Specified)
@@ -628,40 +722,13 @@ async def process_update(data):
             urgency = "Normal"
             
             try:
-                req_data = {
-                     "requester_id": user_id,
-                     "blood_type": blood_type,
-                     "location": location,
-                     "urgency": urgency,
-                     "is_active": True
-                }
-                res = supabase.table("villingili_requests").insert(req_data).execute()
-                req_id = res.data[0]['id']
-                
-                # Broadcast to Channel
-                import os
-                channel_id = os.environ.get("TELEGRAM_CHANNEL_ID")
-                if channel_id:
-                     from .utils import format_blood_request_message
-                     msg_text = format_blood_request_message(blood_type, location, urgency, user['full_name'], user.get('phone_number'))
-                     keyboard = {
-                          "inline_keyboard": [[
-                              {"text": "🙋♂️ I Can Help", "callback_data": f"help_{req_id}"}
-                          ]]
-                     }
-                     # Send to channel
-                     sent = send_telegram_message(channel_id, msg_text)
-                     
-                     # Store message ID
-                     if sent and sent.get("ok"):
-                        msg_id = sent["result"]["message_id"]
-                        supabase.table("villingili_requests").update({"telegram_message_id": msg_id}).eq("id", req_id).execute()
-
-                # send_telegram_message(chat_id, f"✅ Request Sent to Channel")
+                # Saved with its channel post queued; the outbox posts it
+                from .outbox import create_blood_request
+                create_blood_request(supabase, {**user, "telegram_id": user_id}, blood_type, location, urgency)
                 return
 
             except Exception as e:
-                print(f"Request Creation Error: {e}")
+                log.error("Request Creation Error: %s", e)
                 # Don't spam error if list was sent
                 return
             
@@ -671,9 +738,9 @@ async def process_update(data):
         if data_str.startswith("req_loc_"):
              return # Disabled logic
 
-        if data_str.startswith("admin_set_blood_"):
+        if data_str.startswith("admin_set_blood_") or data_str.startswith("album_set_blood_"):
             parts = data_str.split("_")
-            # format: admin_set_blood_{fake_id}_{type}
+            # format: admin_set_blood_{fake_id}_{type} (album_set_blood_ from album summaries)
             if len(parts) >= 5:
                 fake_id = parts[3]
                 b_type = parts[4]
@@ -683,11 +750,11 @@ async def process_update(data):
                 
                 
                 # Fetch Data for Confirmation
-                print(f"DEBUG: Fetching user for confirmation: {fake_id}")
+                log.debug("Fetching user for confirmation: %s", fake_id)
                 try:
                     u_res = supabase.table("villingili_users").select("full_name, id_card_number, address").eq("telegram_id", fake_id).execute()
                 except Exception as e:
-                    print(f"DEBUG: User Update Fetch Error: {e}")
+                    log.warning("User Update Fetch Error: %s", e)
                     send_telegram_message(chat_id, "⚠️ Error fetching user data. Please scan again.")
                     return
 
@@ -712,7 +779,9 @@ async def process_update(data):
                     # ForceReply only works on SEND message.
                     # So we delete (or edit to 'Saved') and SEND new one.
                     
-                    edit_telegram_message(chat_id, cb["message"]["message_id"], f"✅ <b>Blood Type: {b_type} Selected.</b>")
+                    # Album summaries list several cards, so leave them intact
+                    if data_str.startswith("admin_"):
+                        edit_telegram_message(chat_id, cb["message"]["message_id"], f"✅ <b>Blood Type: {b_type} Selected.</b>")
                     send_telegram_message(chat_id, msg_text, reply_markup=reply_markup)
             return
 
@@ -754,6 +823,10 @@ async def process_update(data):
                             # Update Count & Notify Channel
                             new_count = (req.get("donors_found") or 0) + 1
                             supabase.table("villingili_requests").update({"donors_found": new_count}).eq("id", p_req_id).execute()
+                            from .events import publish_request_event
+                            publish_request_event("donor_found", {"id": p_req_id, "donors_found": new_count})
+                            from .channel_edits import update_request_post
+                            update_request_post(req, r_name, r_phone, new_count)
                             
                             import os
                             channel_id = os.environ.get("TELEGRAM_CHANNEL_ID")
@@ -764,7 +837,7 @@ async def process_update(data):
                             supabase.table("villingili_users").update({"pending_request_id": None}).eq("telegram_id", user_id).execute()
                             return
                 except Exception as e:
-                    print(f"Deferred Help Error: {e}")
+                    log.error("Deferred Help Error: %s", e)
 
             # Normal Flow
             keyboard = {
@@ -792,7 +865,8 @@ async def process_update(data):
             edit_telegram_message(chat_id, msg_id, f"✅ Sex Updated to <b>{sex}</b>", reply_markup=keyboard)
             return
              
-        if data_str.startswith("help_") and False: # Disabled Feature
+        if data_str.startswith("help_"):
+            # "🙋 I Can Help" on a donor alert (donor_alerts.py)
             request_id = data_str.split("_")[1]
             
             # Check Donor Profile
@@ -811,11 +885,16 @@ async def process_update(data):
                     return
                 
                 req = req_query.data[0]
+                if not req.get("is_active"):
+                    from .utils import answer_callback_query
+                    answer_callback_query(cb_id, text="⚠️ This request has been closed or has expired. Thank you!", show_alert=True)
+                    return
                 
-                # STRICT BLOOD TYPE MATCH CHECK
+                # BLOOD TYPE COMPATIBILITY CHECK (same rules as the donor alerts)
                 # Donor: user.get("blood_type")
                 # Request: req.get("blood_type")
-                if user.get("blood_type") != req.get("blood_type"):
+                from .donor_alerts import can_donate
+                if not can_donate(user.get("blood_type"), req.get("blood_type")):
                      from .utils import answer_callback_query
                      answer_callback_query(cb_id, text=f"⚠️ You are {user.get('blood_type')}. This request needs {req.get('blood_type')}.", show_alert=True)
                      return
@@ -853,8 +932,18 @@ async def process_update(data):
                     # Update Count
                     new_count = (req.get("donors_found") or 0) + 1
                     supabase.table("villingili_requests").update({"donors_found": new_count}).eq("id", request_id).execute()
+                    from .events import publish_request_event
+                    publish_request_event("donor_found", {"id": request_id, "donors_found": new_count})
+                    from .channel_edits import update_request_post
+                    update_request_post(req, r_name, r_phone, new_count)
+
+                    # Drop the button so the same offer isn't counted twice
+                    from .utils import edit_telegram_message
+                    from .donor_alerts import alert_text
+                    edit_telegram_message(chat_id, cb["message"]["message_id"], alert_text(req) + "\n\n✅ You offered to help.")
             except Exception as e:
-                print(f"Help Error: {e}")
+                log.error("Help Error: %s", e)
+            return
                 
         if data_str.startswith("edit_field_"):
              from .utils import answer_callback_query, edit_telegram_message
@@ -931,6 +1020,8 @@ async def process_update(data):
              
              # Activate
              supabase.table("villingili_users").update({"status": "active"}).eq("telegram_id", target_id).execute()
+             from .event_log import record_event
+             record_event("status_changed", "user", target_id, {"status": "active", "via": "activate"}, actor=cb["from"]["id"])
              
              # Notify Admin
              from .utils import edit_telegram_message, answer_callback_query
@@ -953,6 +1044,8 @@ async def process_update(data):
              
              # Deactivate (Set to pending to satisfy DB constraint)
              supabase.table("villingili_users").update({"status": "pending"}).eq("telegram_id", target_id).execute()
+             from .event_log import record_event
+             record_event("status_changed", "user", target_id, {"status": "pending", "via": "remove"}, actor=cb["from"]["id"])
              
              # Notify Admin
              from .utils import edit_telegram_message, answer_callback_query
@@ -1015,7 +1108,6 @@ async def process_update(data):
             target_username = target_user 
 
             try:
-                import time
                 # Fetch real phone from users table
                 existing_u = supabase.table("villingili_users").select("phone_number").eq("telegram_id", target_id).execute()
                 if existing_u.data and existing_u.data[0].get('phone_number'):
@@ -1047,7 +1139,7 @@ async def process_update(data):
                 else:
                      send_telegram_message(chat_id, f"⚠️ Couldn't PM {target_name}. Please start the bot first!")
             except Exception as e:
-                print(f"Admin Access Error: {e}")
+                log.error("Admin Access Error: %s", e)
                 send_telegram_message(chat_id, "⚠️ Error creating admin credentials.")
             return
         # LOGIC FOR GROUPS/SUPERGROUPS (Early Check for Photos)
@@ -1057,7 +1149,7 @@ async def process_update(data):
             env_grp = os.environ.get("TELEGRAM_ADMIN_GROUP_ID")
             ADMIN_GROUP_ID = int(env_grp) if env_grp else -1003695872031
             
-            print(f"DEBUG: Checking Group Message. Chat ID: {chat_id}, Configured Admin Group: {ADMIN_GROUP_ID}", flush=True)
+            log.debug("Checking Group Message. Chat ID: %s, Configured Admin Group: %s", chat_id, ADMIN_GROUP_ID)
 
             # Debug Mismatch (For troubleshooting ONLY)
             if int(chat_id) != ADMIN_GROUP_ID and photo:
@@ -1068,123 +1160,23 @@ async def process_update(data):
 
             # 1. HANDLE PHOTOS (ID Card Scan)
             if int(chat_id) == ADMIN_GROUP_ID and photo:
-                try:
-                    # Get largest photo
-                    file_id = photo[-1]["file_id"]
-                    
-                    # Get File Path
-                    import requests
-                    import os
-                    token = os.environ.get("TELEGRAM_BOT_TOKEN")
-                    res = requests.get(f"https://api.telegram.org/bot{token}/getFile?file_id={file_id}").json()
-                    
-                    if res.get("ok"):
-                        file_path = res["result"]["file_path"]
-                        image_url = f"https://api.telegram.org/file/bot{token}/{file_path}"
-                        
-                        send_telegram_message(chat_id, "🔍 Scanning ID Card...")
-                        
-                        # Analyze
-                        from .utils import analyze_id_card_with_ai
-                        result = analyze_id_card_with_ai(image_url)
-                        
-                        if result:
-                            # 1. Invalid Image Handling
-                            if not result.get("is_valid"):
-                                error_code = result.get("error")
-                                if error_code == "UNCLEAR":
-                                    send_telegram_message(chat_id, "⚠️ **Image Unclear**\nPlease re-upload a **clear image** of the ID card without glare or reflection.")
-                                else:
-                                    send_telegram_message(chat_id, "❌ **Not Identified**\nPlease upload a valid Maldives National Identity Card.")
-                                return
-
-                            # 2. Success - Extract & Ask for Blood Type
-                            name = result.get("full_name", "Unknown")
-                            nid = result.get("id_card_number", "Unknown")
-                            sex = result.get("sex", "Unknown")
-                            addr = result.get("address", "Unknown")
-                            dob = result.get("date_of_birth", "Unknown")
-                            
-                            # Normalize Sex
-                            if sex and sex.upper().startswith("M"): sex = "Male"
-                            elif sex and sex.upper().startswith("F"): sex = "Female"
-
-                            # Store temporarily using a callback-friendly approach or DB draft
-                            # Since callback data is limited (64 bytes), we can't put everything there.
-                            # We will upsert a 'draft' user into DB with status='draft_scanning'
-                            
-                            # Generate Temp ID from NID hash to be consistent
-                            import hashlib
-                            id_hash = int(hashlib.sha256(nid.encode('utf-8')).hexdigest(), 16) % (10**12)
-                            fake_tg_id = id_hash 
-                            
-                            # Store in DB as DRAFT
-                            user_data = {
-                                "telegram_id": fake_tg_id,
-                                "full_name": name,
-                                "phone_number": f"DRAFT_{fake_tg_id}", # Placeholder to satisfy NOT NULL constraint
-                                "id_card_number": nid,
-                                "sex": sex,
-                                "address": addr,
-                                "status": "pending", # Satisfies CHECK (status in ('active', 'pending', 'banned'))
-                                "role": "user"
-                            }
-                            # Upsert by ID Card Number to handle re-uploads/corrections
-                            # But we need to be careful not to overwrite valid active users if we are just "checking"
-                            # The requirement is to 'update db', so upserting IS the goal.
-                            # We'll use 'id_card_number' as the unique key for this logic basically.
-                            
-                            # Manual Upsert (Check -> Insert/Update)
-                            try:
-                                ex = supabase.table("villingili_users").select("telegram_id").eq("telegram_id", fake_tg_id).execute()
-                                if ex.data:
-                                    supabase.table("villingili_users").update(user_data).eq("telegram_id", fake_tg_id).execute()
-                                else:
-                                    supabase.table("villingili_users").insert(user_data).execute()
-                            except Exception as e:
-                                print(f"DB Upsert Error: {e}")
-                                send_telegram_message(chat_id, f"⚠️ Database Error: {e}")
-                                return
-                            
-                            # Send Blood Type Buttons
-                            keyboard = {
-                                "inline_keyboard": [
-                                    [{"text": "A+", "callback_data": f"admin_set_blood_{fake_tg_id}_A+"}, {"text": "A-", "callback_data": f"admin_set_blood_{fake_tg_id}_A-"}],
-                                    [{"text": "B+", "callback_data": f"admin_set_blood_{fake_tg_id}_B+"}, {"text": "B-", "callback_data": f"admin_set_blood_{fake_tg_id}_B-"}],
-                                    [{"text": "O+", "callback_data": f"admin_set_blood_{fake_tg_id}_O+"}, {"text": "O-", "callback_data": f"admin_set_blood_{fake_tg_id}_O-"}],
-                                    [{"text": "AB+", "callback_data": f"admin_set_blood_{fake_tg_id}_AB+"}, {"text": "AB-", "callback_data": f"admin_set_blood_{fake_tg_id}_AB-"}]
-                                ]
-                            }
-                            
-                            msg = (
-                                f"✅ **ID Scanned Successfully!**\n\n"
-                                f"👤 Name: {name}\n"
-                                f"🆔 ID: {nid}\n"
-                                f"🎂 DOB: {dob}\n"
-                                f"🏠 Addr: {addr}\n\n"
-                                f"🩸 **Select Blood Type:**"
-                            )
-                            send_telegram_message(chat_id, msg, reply_markup=keyboard)
-                        else:
-                             send_telegram_message(chat_id, "⚠️ AI Analysis failed. Please try again.")
-
-
-                    
-                    return # Stop processing
-                    
-                except Exception as e:
-                    print(f"Photo Error: {e}")
-                    send_telegram_message(chat_id, f"⚠️ Error processing photo: {e}")
-                    return
+                # Runs in the background and edits the "Scanning..." message when done
+                if msg.get("media_group_id"):
+                    # Album: batch all cards into one summary
+                    from .ocr import queue_album_photo
+                    await queue_album_photo(chat_id, msg["media_group_id"], photo)
                     return
+                from .ocr import start_id_card_scan
+                await start_id_card_scan(chat_id, photo)
+                return # Stop processing
         
             # 2. Handle ID Card Phone Input (Admin Group)
             reply = msg.get("reply_to_message")
             # DEBUG LOGGING (Temporary)
             if reply:
-                 print(f"DEBUG: Reply detected in Chat {chat_id}. Text: {reply.get('text', '')[:20]}...")
+                 log.debug("Reply detected in Chat %s. Text: %s...", chat_id, reply.get('text', '')[:20])
             if int(chat_id) == ADMIN_GROUP_ID and reply and "REF:" in reply.get("text", ""):
-                 print("DEBUG: REF ID found in reply. Processing...")
+                 log.debug("REF ID found in reply. Processing...")
                  ref_line = [l for l in reply.get("text", "").split("\n") if "REF:" in l]
                  if ref_line:
                      fake_id_str = ref_line[0].split("REF:")[1].strip()
@@ -1200,73 +1192,44 @@ async def process_update(data):
                          final_phone = digits[3:] # Strip 960, store 7 digits
                          
                      if final_phone:
-                         # ROBUST MERGE LOGIC (Patch V3)
+
+                         def merge_scan_into(c_pk):
+                             # The scan's ID card details win over the existing (mobile) record
+                             merged = merge_users(supabase, fake_id_str, c_pk, policy=TAKE_SOURCE, fields={"status": "active"}, actor=user_id)
+                             if not merged:
+                                 send_telegram_message(chat_id, "⚠️ Error finding pending scan record.")
+                                 return
+                             send_telegram_message(chat_id, f"✅ <b>Merged!</b>\nPhone {final_phone} was already registered.\nUpdated record with ID Card info.")
+                             # Notify User
+                             try:
+                                 kb = {"keyboard": [[{"text": "🩸 Request Blood"}]], "resize_keyboard": True}
+                                 send_telegram_message(c_pk, "✅ <b>Your Profile has been Updated!</b>\nYou can now request blood.", reply_markup=kb)
+                             except: pass
+
                          try:
                              # Check if Phone Exists
-                             existing_ph = supabase.table("villingili_users").select("*").eq("phone_number", final_phone).execute()
+                             existing_ph = supabase.table("villingili_users").select("telegram_id").eq("phone_number", final_phone).neq("telegram_id", fake_id_str).execute()
                              if existing_ph.data:
-                                 conflict_user = existing_ph.data[0]
-                                 # Merge New Info (Scan) INTO Old User (Mobile)
-                                 c_pk = conflict_user["telegram_id"]
-                                 # Get Target Info (Scan User)
-                                 try:
-                                     target_u_res = supabase.table("villingili_users").select("*").eq("telegram_id", fake_id_str).execute()
-                                 except Exception as e:
-                                     return
-                                     
-                                 if target_u_res.data:
-                                      target_u = target_u_res.data[0]
-                                      # Update Conflict User with ID Details
-                                      supabase.table("villingili_users").update({
-                                           "full_name": target_u.get("full_name"),
-                                           "id_card_number": target_u.get("id_card_number"),
-                                           "sex": target_u.get("sex"),
-                                           "address": target_u.get("address"),
-                                           "blood_type": target_u.get("blood_type"),
-                                           "status": "active"
-                                      }).eq("telegram_id", c_pk).execute()
-                                      # Delete Pending Scan User
-                                      supabase.table("villingili_users").delete().eq("telegram_id", fake_id_str).execute()
-                                      send_telegram_message(chat_id, f"✅ <b>Merged!</b>\nPhone {final_phone} was already registered.\nUpdated record with ID Card info.")
-                                      # Notify User
-                                      try:
-                                          kb = {"keyboard": [[{"text": "🩸 Request Blood"}]], "resize_keyboard": True}
-                                          send_telegram_message(c_pk, "✅ <b>Your Profile has been Updated!</b>\nYou can now request blood.", reply_markup=kb)
-                                      except: pass
-                                 else:
-                                      send_telegram_message(chat_id, "⚠️ Error finding pending scan record.")
+                                 merge_scan_into(existing_ph.data[0]["telegram_id"])
                              else:
                                  # Normal Update
                                  supabase.table("villingili_users").update({
                                      "phone_number": final_phone,
                                      "status": "active"
                                  }).eq("telegram_id", fake_id_str).execute()
+                                 from .event_log import record_event
+                                 record_event("status_changed", "user", fake_id_str, {"status": "active", "via": "scan"}, actor=user_id)
                                  send_telegram_message(chat_id, f"✅ <b>Registration Complete!</b>\nPhone: {final_phone}\n\nUser is now active.")
                          except Exception as e:
                              err_str = str(e)
                              if "23505" in err_str or "already exists" in err_str:
-                                 # FORCE MERGE (Duplicate Key)
+                                 # Someone took the phone in the meantime: merge into them
                                  try:
-                                     # Fetch the Conflict User
-                                     con_res = supabase.table("villingili_users").select("*").eq("phone_number", final_phone).execute()
+                                     con_res = supabase.table("villingili_users").select("telegram_id").eq("phone_number", final_phone).execute()
                                      if con_res.data:
-                                          conflict_user = con_res.data[0]
-                                          c_pk = conflict_user["telegram_id"]
-                                          # Update Conflict User
-                                          supabase.table("villingili_users").update({
-                                               "full_name": target_u.get("full_name"),
-                                               "id_card_number": target_u.get("id_card_number"),
-                                               "sex": target_u.get("sex"),
-                                               "address": target_u.get("address"),
-                                               "blood_type": target_u.get("blood_type"),
-                                               "status": "active"
-                                          }).eq("telegram_id", c_pk).execute()
-                                          # Delete Draft
-                                          supabase.table("villingili_users").delete().eq("telegram_id", fake_id_str).execute()
-                                          send_telegram_message(chat_id, f"✅ <b>Merged!</b>\nPhone {final_phone} was already registered.\nUpdated record with ID Card info.")
-                                          return
+                                          merge_scan_into(con_res.data[0]["telegram_id"])
                                  except Exception as merge_err:
-                                      print(f"Merge Error: {merge_err}")
+                                      log.error("Merge Error: %s", merge_err)
                                       send_telegram_message(chat_id, f"⚠️ Error merging: {merge_err}")
                              else:
                                  send_telegram_message(chat_id, f"⚠️ Error updating phone: {e}")
@@ -1278,11 +1241,12 @@ async def process_update(data):
             if int(chat_id) == ADMIN_GROUP_ID and text and not text.startswith("/"):
                  # A. Explicit "list" command
                  if text.strip().lower() == "list":
-                      donors = supabase.table("villingili_users").select("full_name, phone_number, blood_type").neq("blood_type", None).execute()
-                      if donors.data:
+                      from .snapshot import read_through, stale_note
+                      donors, age = read_through(supabase, lambda db: db.table("villingili_users").select("full_name, phone_number, blood_type").neq("blood_type", None).execute().data)
+                      if donors:
                            # Group by Blood Type
                            grouped = {}
-                           for d in donors.data:
+                           for d in donors:
                                 bt = d.get('blood_type') or "Unknown"
                                 if bt not in grouped: grouped[bt] = []
                                 grouped[bt].append(d)
@@ -1294,7 +1258,7 @@ async def process_update(data):
                                 for d in grouped[bt]:
                                      msg_list.append(f"- {d['full_name']}: {d['phone_number']}")
                            
-                           full_msg = "\n".join(msg_list)
+                           full_msg = "\n".join(msg_list) + stale_note(age)
                            # Simple split if too long (naive)
                            if len(full_msg) > 4000:
                                 send_telegram_message(chat_id, full_msg[:4000] + "...")
@@ -1310,14 +1274,15 @@ async def process_update(data):
                      bt = text.strip().upper()
                      valid_types = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
                      if bt in valid_types:
-                          donors = supabase.table("villingili_users").select("full_name, phone_number").eq("blood_type", bt).execute()
-                          if donors.data:
+                          from .snapshot import read_through, stale_note
+                          donors, age = read_through(supabase, lambda db: db.table("villingili_users").select("full_name, phone_number").eq("blood_type", bt).execute().data)
+                          if donors:
                               msg = f"<b>Donors for {bt}:</b>\n"
-                              for d in donors.data:
+                              for d in donors:
                                    msg += f"- {d['full_name']}: {d['phone_number']}\n"
-                              send_telegram_message(chat_id, msg)
+                              send_telegram_message(chat_id, msg + stale_note(age))
                           else:
-                              send_telegram_message(chat_id, f"No donors found for {bt}.")
+                              send_telegram_message(chat_id, f"No donors found for {bt}." + stale_note(age))
                           return
 
                           return
@@ -1328,7 +1293,7 @@ async def process_update(data):
                           "<b>🛠 Admin Group Commands:</b>\n"
                           "1. <b>list</b> - Show ALL active donors (grouped by blood type).\n"
                           "2. <b>[Type]</b> (e.g. <code>A+</code>) - Show donors for that type.\n"
-                          "3. <b>[Photo]</b> - Send ID Card Photo to scan/register.\n"
+                          "3. <b>[Photo]</b> - Send ID Card Photo (or an album of cards) to scan/register.\n"
                           "4. <b>Reply to Scan</b> - Reply with Phone Number to link/merge.\n"
                           "5. <b>/admin_access</b> or <b>/reset_password</b>"
                       )
@@ -1360,15 +1325,20 @@ async def process_update(data):
                              supabase.table("villingili_users").upsert(stub_data).execute()
                              # Note: Next time this user messages, they will be found as 'pending'
                     except Exception as e:
-                        print(f"Start Payload Error: {e}")
+                        log.error("Start Payload Error: %s", e)
 
         # 1. Check if user is registered (using user_id, NOT chat_id)
         try:
-             user_query = supabase.table("villingili_users").select("*").eq("telegram_id", user_id).execute()
-             user = user_query.data[0] if user_query.data else None
+             from .snapshot import read_through
+             rows, user_age = read_through(supabase, lambda db: db.table("villingili_users").select("*").eq("telegram_id", user_id).execute().data)
+             user = rows[0] if rows else None
              user_exists = user is not None
         except Exception as e:
-            print(f"DB Error: {e}")
+            log.error("DB Error: %s", e)
+            return
+        if not user_exists and user_age is not None:
+            # Registering needs the live database
+            send_telegram_message(chat_id, "⚠️ Database unreachable right now. Please try again in a few minutes.")
             return
             
         if chat_type == "private":
@@ -1399,22 +1369,14 @@ async def process_update(data):
                         
                         if existing_phone.data:
                              old_id = existing_phone.data[0]['telegram_id']
-                             print(f"Migrating user {old_id} to {user_id}...")
-                             
-                             # 1. Free up the phone number (change old to temporary)
-                             supabase.table("villingili_users").update({"phone_number": f"{phone}_old_{old_id}"}).eq("telegram_id", old_id).execute()
-                             
-                             # 2. Register New User
-                             supabase.table("villingili_users").upsert(user_data).execute()
-                             
-                             # 3. Migrate Requests (Move ownership)
-                             supabase.table("villingili_requests").update({"requester_id": user_id}).eq("requester_id", old_id).execute()
-                             
-                             # 4. Delete Old User
-                             supabase.table("villingili_users").delete().eq("telegram_id", old_id).execute()
+                             log.info("Migrating user %s to %s...", old_id, user_id)
+                             # Register this account and move the old one's requests to it
+                             merge_users(supabase, old_id, user_id, fields=user_data, actor=user_id)
                         else:
                              # Normal Upsert
                              supabase.table("villingili_users").upsert(user_data).execute()
+                             from .event_log import record_event
+                             record_event("status_changed", "user", user_id, {"status": "active", "via": "contact"}, actor=user_id)
                         
 
                         
@@ -1472,10 +1434,14 @@ async def process_update(data):
                                         
                                         new_count = (req.get("donors_found") or 0) + 1
                                         supabase.table("villingili_requests").update({"donors_found": new_count}).eq("id", pending_req).execute()
+                                        from .events import publish_request_event
+                                        publish_request_event("donor_found", {"id": pending_req, "donors_found": new_count})
+                                        from .channel_edits import update_request_post
+                                        update_request_post(req, r_name, r_phone, new_count)
                                         supabase.table("villingili_users").update({"pending_request_id": None}).eq("telegram_id", user_id).execute()
                                         return
                             except Exception as e:
-                                 print(f"Deferred Help Error: {e}")
+                                 log.error("Deferred Help Error: %s", e)
 
                         # Standard Flow (Request First) if no help processed
                         # Wait for client to process keyboard removal
@@ -1500,7 +1466,7 @@ async def process_update(data):
                         send_telegram_message(chat_id, "🩸 <b>Select blood group you want:</b>", reply_markup=keyboard)
                         
                     except Exception as e:
-                        print(f"Registration Error: {e}")
+                        log.error("Registration Error: %s", e)
                         send_telegram_message(chat_id, "⚠️ Error registering. Please try again.")
                 else:
                     # Prompt for Contact
@@ -1561,40 +1527,17 @@ async def process_update(data):
                                        send_telegram_message(chat_id, "⚠️ <b>Incomplete Blood Type</b>\nPlease specify if Positive (+) or Negative (-).")
                                        return
 
-                                  # create request
-                                  req_data = {
-                                       "requester_id": user_id,
-                                       "blood_type": blood_type,
-                                       "location": location,
-                                       "urgency": urgency,
-                                       "is_active": True
-                                  }
-                                  res = supabase.table("villingili_requests").insert(req_data).execute()
-                                  req_id = res.data[0]['id']
-                            
-                                  # Broadcast to Channel
-                                  channel_id = os.environ.get("TELEGRAM_CHANNEL_ID")
-                                  if channel_id:
-                                       from .utils import format_blood_request_message
-                                       msg_text = format_blood_request_message(blood_type, location, urgency, user['full_name'], user.get('phone_number'))
-                                       keyboard = {
-                                            "inline_keyboard": [[
-                                                {"text": "🙋♂️ I Can Help", "callback_data": f"help_{req_id}"}
-                                            ]]
-                                       }
-                                       sent = send_telegram_message(channel_id, msg_text)
-                                       if sent and sent.get("ok"):
-                                          msg_id = sent["result"]["message_id"]
-                                          supabase.table("villingili_requests").update({"telegram_message_id": msg_id}).eq("id", req_id).execute()
-
-                                  send_telegram_message(chat_id, f"✅ <b>Request Sent!</b>\n\nWe have broadcast your need for <b>{blood_type}</b> at <b>{location}</b> to the channel.")
+                                  from .outbox import create_blood_request
+                                  create_blood_request(supabase, {**user, "telegram_id": user_id}, blood_type, location, urgency)
+
+                                  send_telegram_message(chat_id, f"✅ <b>Request Received!</b>\n\nYour need for <b>{blood_type}</b> at <b>{location}</b> is being posted to the channel.")
                             
                                   # Now ask if they want to register as donor?
                                   # Maybe not now, don't spam.
                                   return
 
                               except Exception as e:
-                                  print(f"Request Creation Error: {e}")
+                                  log.error("Request Creation Error: %s", e)
                                   send_telegram_message(chat_id, "⚠️ Error creating request.")
                                   return
 
@@ -1611,24 +1554,10 @@ async def process_update(data):
                               conflict_user = next((u for u in existing_res.data if str(u.get("telegram_id")) != str(chat_id)), None)
 
                               if conflict_user:
-                                  import time
-                                  c_pk = conflict_user["telegram_id"]
-                                  old_tg_id = conflict_user.get("telegram_id")
                                   send_telegram_message(chat_id, f"🔄 Found existing record for **{conflict_user.get('full_name', 'User')}**. Merging...")
-                                  temp_phone = f"{phone}_old_{int(time.time())}"
-                                  supabase.table("villingili_users").update({"phone_number": temp_phone}).eq("telegram_id", c_pk).execute()
-                                  supabase.table("villingili_users").update({"phone_number": phone}).eq("telegram_id", chat_id).execute()
-                                  user["phone_number"] = phone
-                                  updates = {}
-                                  for field in ["sex", "address", "island", "birth_date", "blood_type", "permanent_address"]:
-                                       if not user.get(field) and conflict_user.get(field):
-                                           updates[field] = conflict_user[field]
-                                  if updates:
-                                       supabase.table("villingili_users").update(updates).eq("telegram_id", chat_id).execute()
-                                       user.update(updates)
-                                  if old_tg_id:
-                                       supabase.table("villingili_requests").update({"requester_id": chat_id}).eq("requester_id", old_tg_id).execute()
-                                  supabase.table("villingili_users").delete().eq("id", c_pk).execute()
+                                  # Take the phone, and whatever profile details this account is missing
+                                  merged = merge_users(supabase, conflict_user["telegram_id"], chat_id, policy=FILL_MISSING, fields={"phone_number": phone}, actor=chat_id)
+                                  user.update(merged or {"phone_number": phone})
                                   send_telegram_message(chat_id, "✅ Account merged successfully!")
                               else:
                                   supabase.table("villingili_users").update({"phone_number": phone}).eq("telegram_id", chat_id).execute()
@@ -1768,7 +1697,8 @@ async def process_update(data):
  
                     # Check for Blood Request intent
                     if not text.startswith("/"):
-                        parsed = parse_request_with_ai(text)
+                        # Blocking (AI call, concurrency cap): keep it off the event loop
+                        parsed = await asyncio.to_thread(parse_request_with_ai, text)
                         if parsed and parsed.get("blood_type"):
                              blood_type = parsed['blood_type']
                              location = parsed.get('location', 'Unknown')
@@ -1780,36 +1710,11 @@ async def process_update(data):
                                   send_telegram_message(chat_id, "⚠️ <b>Incomplete Blood Type</b>\nPlease specify if Positive (+) or Negative (-) (e.g., 'A+' or 'A Negative').")
                                   return
 
-                             # Save Request
-                             req_data = {
-                                 "requester_id": user_id,
-                                 "blood_type": blood_type,
-                                 "location": location,
-                                 "urgency": urgency,
-                                 "is_active": True
-                             }
-                             res = supabase.table("villingili_requests").insert(req_data).execute()
-                             req_id = res.data[0]['id']
-                             
-                             # Broadcast to Channel
-                             import os
-                             channel_id = os.environ.get("TELEGRAM_CHANNEL_ID")
-                             if channel_id:
-                                 from .utils import format_blood_request_message
-                                 msg_text = format_blood_request_message(
-                                     blood_type,
-                                     location,
-                                     urgency,
-                                     user['full_name'],
-                                     user.get('phone_number')
-                                 )
-
-                                 sent = send_telegram_message(channel_id, msg_text)
-                                 if sent and sent.get("ok"):
-                                     msg_id = sent["result"]["message_id"]
-                                     supabase.table("villingili_requests").update({"telegram_message_id": msg_id}).eq("id", req_id).execute()
-                             
-                             send_telegram_message(chat_id, f"✅ Request sent to channel! Waiting for donors...")
+                             # Save Request (the channel post goes out from the outbox)
+                             from .outbox import create_blood_request
+                             create_blood_request(supabase, {**user, "telegram_id": user_id}, blood_type, location, urgency)
+
+                             send_telegram_message(chat_id, f"✅ Request received! Posting it to the channel and waiting for donors...")
                              
                              # Find Matches
                              try:
@@ -1827,7 +1732,7 @@ async def process_update(data):
                                  else:
                                      send_telegram_message(chat_id, f"⚠️ <b>No direct matches found.</b>\nWe have broadcast your request to the channel.")
                              except Exception as e:
-                                 print(f"Match Error: {e}")
+                                 log.error("Match Error: %s", e)
 
                         else:
                             keyboard = {
@@ -1841,16 +1746,16 @@ async def process_update(data):
                             send_telegram_message(chat_id, "Please select a blood group to request:", reply_markup=keyboard)
 
     if "channel_post" in data:
-        print(f"DEBUG: Received channel_post: {data['channel_post']}")
+        log.debug("Received channel_post: %s", data['channel_post'])
         msg = data["channel_post"]
         chat_id = msg["chat"]["id"]
         text = msg.get("text", "")
         
         # Only process if meaningful text
         if text and len(text) > 5 and not text.startswith("/"):
-             print(f"DEBUG: Parsing text: {text}")
-             parsed = parse_request_with_ai(text)
-             print(f"DEBUG: Parsed result: {parsed}")
+             log.debug("Parsing text: %s", text)
+             parsed = await asyncio.to_thread(parse_request_with_ai, text)
+             log.debug("Parsed result: %s", parsed)
              
              if parsed and parsed.get("blood_type"):
                  # Create Request (Requester = Channel itself)
@@ -1862,7 +1767,7 @@ async def process_update(data):
                  try:
                      # Use unique pseudo-phone for channel
                      pseudo_phone = f"channel_{chat_id}" 
-                     print(f"DEBUG: Registering Channel {chat_id} with phone {pseudo_phone}")
+                     log.debug("Registering Channel %s with phone %s", chat_id, pseudo_phone)
                      
                      user_data = {
                          "telegram_id": chat_id,
@@ -1872,41 +1777,19 @@ async def process_update(data):
                          "role": "admin"
                      }
                      # Upsert to handle existing or new
-                     supabase.table("users").upsert(user_data).execute()
-                     print("DEBUG: Channel Registration Successful")
+                     supabase.table("villingili_users").upsert(user_data).execute()
+                     log.debug("Channel Registration Successful")
                  except Exception as e:
-                     print(f"DEBUG: Channel Registration FAILED: {e}")
+                     log.error("Channel Registration FAILED: %s", e)
                      # If registration failed and user doesn't exist, Next step will fail.
                      # But maybe it failed because it exists? Upsert shouldn't fail on existence.
                      # If it failed on something else, we should probably return.
                      # allow to proceed just in case valid error (like 'already exists' but upsert handles that?)
 
                  
-                 # Create Request
-                 req_data = {
-                      "requester_id": chat_id,
-                      "blood_type": parsed['blood_type'],
-                      "location": parsed.get('location', 'Unknown'),
-                      "urgency": parsed.get('urgency', 'Normal'),
-                      "is_active": True
-                 }
-                 res = supabase.table("requests").insert(req_data).execute()
-                 req_id = res.data[0]['id']
-                 
-                 # Post Formatted Message
-                 from .utils import format_blood_request_message
-                 msg_text = format_blood_request_message(
-                     parsed['blood_type'], 
-                     parsed.get('location', 'Unknown'), 
-                     parsed.get('urgency', 'Normal'), 
-                     user_data['full_name'], 
-                     user_data['phone_number']
-                 )
-                 sent = send_telegram_message(chat_id, msg_text)
-                 
-                 if sent and sent.get("ok"):
-                     msg_id = sent["result"]["message_id"]
-                     supabase.table("requests").update({"telegram_message_id": msg_id}).eq("id", req_id).execute()
+                 # Create Request; the formatted post goes back to this channel via the outbox
+                 from .outbox import create_blood_request
+                 create_blood_request(supabase, user_data, parsed['blood_type'], parsed.get('location', 'Unknown'), parsed.get('urgency', 'Normal'), channel_id=chat_id)
 
         return
 
@@ -1924,10 +1807,12 @@ async def update_last_donation(request: Request, current_user: str = Depends(get
 
         # Update the user record
         res = supabase.table("villingili_users").update({"last_donation_date": date_str}).eq("telegram_id", user_id).execute()
+        from .event_log import record_event
+        record_event("donation_recorded", "user", user_id, {"date": date_str}, actor=current_user)
         
         return {"status": "ok", "message": "Donation date updated"}
     except Exception as e:
-        print(f"Update Donation Error: {e}")
+        log.error("Update Donation Error: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -1961,13 +1846,13 @@ async def broadcast_message(request: Request, current_user: str = Depends(get_cu
                     send_telegram_message(tid, message)
                     count += 1
                 except Exception as e:
-                    print(f"Failed to send to {tid}: {e}")
+                    log.error("Failed to send to %s: %s", tid, e)
                     failed += 1
                     
         return {"status": "ok", "sent_count": count, "failed_count": failed}
 
     except Exception as e:
-        print(f"Broadcast Error: {e}")
+        log.error("Broadcast Error: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -2003,7 +1888,7 @@ async def delete_admin(request: Request, current_user: str = Depends(get_current
         res = query.execute()
         return {"status": "ok"}
     except Exception as e:
-        print(f"Delete Admin Error: {e}")
+        log.error("Delete Admin Error: %s", e)
         return {"status": "error", "detail": str(e)}
 
 @app.post("/api/create_user")
@@ -2047,116 +1932,88 @@ async def create_user(request: Request, current_user: str = Depends(get_current_
             "role": data.get("role", "user"),
             "status": "active"
         }
+        from .gazetteer import place_fields
+        user_data.update(place_fields(supabase, user_data["address"], address=True))
         
         # Execute Supabase Insert
         res = supabase.table("villingili_users").insert(user_data).execute()
+        from .event_log import record_event
+        record_event("user_created", "user", final_tg_id, {"status": "active", "via": "dashboard"}, actor=current_user)
         
         return {"status": "ok", "id": fake_id}
              
     except Exception as e:
-        print(f"Create User Error: {e}")
+        log.error("Create User Error: %s", e)
         return {"status": "error", "detail": str(e)}
 
 @app.get("/api/settings")
 async def get_settings(current_user: str = Depends(get_current_admin)):
-    return {
-        "TELEGRAM_BOT_TOKEN": os.environ.get("TELEGRAM_BOT_TOKEN"),
-        "TELEGRAM_CHANNEL_ID": os.environ.get("TELEGRAM_CHANNEL_ID"),
-        "ADMIN_GROUP_ID": os.environ.get("TELEGRAM_ADMIN_GROUP_ID"),
-        "SUPABASE_URL": os.environ.get("SUPABASE_URL"),
-        # Mask Key for security
-        "SUPABASE_KEY": "HIDDEN", 
-    }
+    from .settings import get_settings
+    return get_settings()
 
 @app.post("/api/settings")
 async def update_settings(request: Request, current_user: str = Depends(get_current_admin)):
     try:
         data = await request.json()
-        # Updates .env file crudely
-        env_path = os.path.join(os.getcwd(), ".env")
-        
-        # Read existing
-        lines = []
-        if os.path.exists(env_path):
-            with open(env_path, "r") as f:
-                lines = f.readlines()
-        
-        updates = {
-            "TELEGRAM_BOT_TOKEN": data.get("TELEGRAM_BOT_TOKEN"),
-            "TELEGRAM_CHANNEL_ID": data.get("TELEGRAM_CHANNEL_ID"),
-            "TELEGRAM_ADMIN_GROUP_ID": data.get("ADMIN_GROUP_ID"), # Map Frontend name to Env name
-            "SUPABASE_URL": data.get("SUPABASE_URL"),
-            "SUPABASE_SERVICE_ROLE_KEY": data.get("SUPABASE_KEY") # Settings calls it KEY but likely means Service Role if Admin
-        }
-        
-        # We need to actully update lines or append
-        # This is a bit complex to do reliably in 10 lines, but basic approach:
-        new_lines = []
-        keys_handled = set()
-        for line in lines:
-            key = line.split("=")[0].strip()
-            if key in updates and updates[key]:
-                new_lines.append(f"{key}={updates[key]}\n")
-                keys_handled.add(key)
-            else:
-                new_lines.append(line)
-        
-        for k, v in updates.items():
-            if k not in keys_handled and v:
-                new_lines.append(f"{k}={v}\n")
-        
-        with open(env_path, "w") as f:
-            f.writelines(new_lines)
-            
-        # Also update memory
-        for k, v in updates.items():
-            if v: os.environ[k] = v
-            
-        return {"status": "ok", "message": "Settings Updated (Restart might be needed)"}
+        from .settings import update_settings
+        return update_settings(data)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+# Serverless instances freeze once an invocation ends, so work an update
+# started in the background (ID scans, albums) finishes before that: after
+# the reply to Telegram, but within the same invocation. Channel posts
+# queued by the update go out here too.
+async def refresh_snapshot_if_wanted(timeout):
+    # A lookup found the local snapshot stale; its thread would freeze with the instance
+    from .snapshot import refresh_if_wanted
+    try:
+        await asyncio.wait_for(asyncio.to_thread(refresh_if_wanted), timeout)
+    except asyncio.TimeoutError:
+        log.warning("Snapshot refresh still running after %ss", timeout)
+
+async def finish_update():
+    from .utils import drain_background, invocation_time_left
+    from .outbox import drain_outbox, OUTBOX_DRAIN_SECONDS
+    from .event_log import EVENT_LOG_DRAIN_SECONDS
+    # Everything below shares the request's deadline, keeping room for the
+    # event log flush that EventFlushMiddleware does after us
+    left = lambda: invocation_time_left(reserve=EVENT_LOG_DRAIN_SECONDS)
+    # Channel posts first: the requester has been told theirs is on its way
+    await drain_outbox(min(OUTBOX_DRAIN_SECONDS, left()))
+    # The rest side by side: their threads freeze with the instance too
+    from .channel_edits import SERVERLESS, coalescer, flush_edits
+    from .donor_alerts import alerts, drain_alerts, DONOR_ALERT_DRAIN_SECONDS
+    budget = left()
+    jobs = [drain_background(budget)]
+    if SERVERLESS and alerts.pending():
+        jobs.append(asyncio.to_thread(drain_alerts, min(DONOR_ALERT_DRAIN_SECONDS, budget)))
+    if SERVERLESS and coalescer.pending():
+        jobs.append(asyncio.to_thread(flush_edits, min(coalescer.drain_seconds() + 5, budget)))
+    if SERVERLESS:
+        jobs.append(refresh_snapshot_if_wanted(budget))
+    await asyncio.gather(*jobs)
+
 @app.post("/api/webhook")
-async def telegram_webhook(request: Request):
+async def telegram_webhook(request: Request, background_tasks: BackgroundTasks):
     data = await request.json()
     # print(f"Update: {data}")
     await process_update(data)
+    background_tasks.add_task(finish_update)
     return {"status": "ok"}
 
 
 # Serve Index for Root and SPA Catch-All
 @app.get("/favicon.png")
-async def favicon():
-    file_path = os.path.join(dist_dir, "favicon.png")
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    return JSONResponse({"error": "Favicon not found"}, status_code=404)
+async def favicon(request: Request):
+    return serve_static(request, "favicon.png") or JSONResponse({"error": "Favicon not found"}, status_code=404)
 
 @app.get("/")
 @app.get("/{rest_of_path:path}")
-async def serve_spa(rest_of_path: str = ""):
+async def serve_spa(request: Request, rest_of_path: str = ""):
     if rest_of_path.startswith("api/"):
         return JSONResponse({"error": "API route not found"}, status_code=404)
 
-    # Search locations for index.html
-    # 1. Check if it's a static file in dist_dir (e.g. favicon.png)
-    file_path = os.path.join(dist_dir, rest_of_path)
-    if os.path.isfile(file_path):
-        return FileResponse(file_path)
-
-    # 2. Search locations for index.html (SPA Fallback)
-    possible_paths = [
-        os.path.join(dist_dir, "index.html"),
-        os.path.join(base_dir, "frontend", "dist", "index.html"),
-        os.path.join(base_dir, "..", "frontend", "dist", "index.html"),
-        os.path.join(os.getcwd(), "frontend", "dist", "index.html"),
-    ]
-
-    for path in possible_paths:
-        if os.path.exists(path):
-            return FileResponse(path)
-
-    return JSONResponse({
-        "error": "Frontend Not Found", 
-        "dist_dir": dist_dir
-    }, status_code=404)
+    # 1. A file from the build (e.g. favicon.png, manifest.json)
+    # 2. Otherwise index.html (SPA Fallback)
+    return serve_static(request, rest_of_path) or serve_index(request)
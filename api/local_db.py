@@ -4,12 +4,430 @@ import os
 import datetime
 import uuid
 
-DB_PATH = "blood_donation.db"
+from .metrics import count_call, count_error
+from .tracing import span
+from .logs import get_logger
+
+log = get_logger("local_db")
+
+DB_PATH = os.environ.get("LOCAL_DB_PATH", "blood_donation.db")
+
+# PostgREST operator -> SQL
+_PG_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "like": "LIKE", "ilike": "LIKE", "is": "IS"}
+
+
+def _parse_or_filter(filters: str):
+    """Parses a PostgREST or() list: 'phone_number.eq.777,username.eq."a,b"'"""
+    clauses = []
+    i = 0
+    while i < len(filters):
+        col_end = filters.index(".", i)
+        op_end = filters.index(".", col_end + 1)
+        col, op = filters[i:col_end], filters[col_end + 1:op_end]
+        j = op_end + 1
+        if j < len(filters) and filters[j] == '"':
+            close = filters.index('"', j + 1)
+            val, i = filters[j + 1:close], close + 2
+        else:
+            comma = filters.find(",", j)
+            comma = len(filters) if comma == -1 else comma
+            val, i = filters[j:comma], comma + 1
+        if op == "is" and val in ("null", "true", "false"):
+            val = None if val == "null" else val == "true"
+        clauses.append((col, _PG_OPS[op], val))
+    return clauses
+
+# The Supabase schema (supabase/*.sql) in SQLite form, for offline runs,
+# benchmarks and load tests. Safe to run more than once.
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS villingili_users (
+    telegram_id INTEGER PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    phone_number TEXT UNIQUE NOT NULL,
+    alternate_phones TEXT,
+    blood_type TEXT,
+    sex TEXT,
+    id_card_number TEXT,
+    address TEXT,
+    role TEXT DEFAULT 'user',
+    status TEXT DEFAULT 'active',
+    last_donation_date TEXT,
+    username TEXT,
+    pending_request_id TEXT,
+    island_code TEXT,
+    atoll_code TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_requests (
+    id TEXT PRIMARY KEY,
+    requester_id INTEGER NOT NULL,
+    blood_type TEXT,
+    location TEXT,
+    urgency TEXT,
+    is_active BOOLEAN DEFAULT 1,
+    donors_found INTEGER DEFAULT 0,
+    telegram_message_id INTEGER,
+    island_code TEXT,
+    atoll_code TEXT,
+    expired_post_pending BOOLEAN DEFAULT 0,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_admin_users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER UNIQUE NOT NULL,
+    username TEXT,
+    phone_number TEXT,
+    password TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_blacklist (
+    phone_number TEXT PRIMARY KEY,
+    reason TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_tombstones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    deleted_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id TEXT,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    message_id INTEGER,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    sent_at TEXT
+);
+CREATE TABLE IF NOT EXISTS villingili_donor_counts (
+    blood_type TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    last_donation TEXT NOT NULL DEFAULT '',
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (blood_type, status, last_donation)
+);
+CREATE TABLE IF NOT EXISTS villingili_request_daily (
+    day TEXT PRIMARY KEY,
+    created INTEGER NOT NULL DEFAULT 0,
+    open INTEGER NOT NULL DEFAULT 0,
+    fulfilled INTEGER NOT NULL DEFAULT 0,
+    expired INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS villingili_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    subject_id TEXT,
+    actor TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT NOT NULL,
+    logged_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS villingili_scan_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    chat_id INTEGER,
+    message_id INTEGER,
+    cards INTEGER,
+    telegram_id INTEGER,
+    saved INTEGER,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_villingili_scan_jobs_created_at ON villingili_scan_jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_villingili_events_subject ON villingili_events(subject, subject_id, id);
+CREATE INDEX IF NOT EXISTS idx_villingili_events_type ON villingili_events(type, id);
+CREATE INDEX IF NOT EXISTS idx_villingili_events_logged_at ON villingili_events(logged_at);
+CREATE TRIGGER IF NOT EXISTS trg_villingili_events_no_update BEFORE UPDATE ON villingili_events
+BEGIN SELECT RAISE(ABORT, 'villingili_events is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_events_no_delete BEFORE DELETE ON villingili_events
+BEGIN SELECT RAISE(ABORT, 'villingili_events is append-only'); END;
+CREATE INDEX IF NOT EXISTS idx_villingili_outbox_due ON villingili_outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_villingili_requests_is_active ON villingili_requests(is_active);
+CREATE INDEX IF NOT EXISTS idx_villingili_users_phone_number ON villingili_users(phone_number);
+CREATE INDEX IF NOT EXISTS idx_villingili_users_blood_type ON villingili_users(blood_type);
+CREATE INDEX IF NOT EXISTS idx_villingili_users_donor_pool ON villingili_users(blood_type, last_donation_date) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_villingili_users_donor_island ON villingili_users(island_code, blood_type, last_donation_date) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_villingili_users_donor_atoll ON villingili_users(atoll_code, blood_type, last_donation_date) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_villingili_requests_island_code ON villingili_requests(island_code);
+CREATE INDEX IF NOT EXISTS idx_villingili_requests_atoll_code ON villingili_requests(atoll_code);
+CREATE INDEX IF NOT EXISTS idx_villingili_users_updated_at ON villingili_users(updated_at);
+CREATE INDEX IF NOT EXISTS idx_villingili_requests_updated_at ON villingili_requests(updated_at);
+CREATE INDEX IF NOT EXISTS idx_villingili_admin_users_updated_at ON villingili_admin_users(updated_at);
+CREATE INDEX IF NOT EXISTS idx_villingili_tombstones_deleted_at ON villingili_tombstones(deleted_at);
+"""
+
+# supabase/stats.sql: counters kept in step by triggers, rebuilt by _rpc_recompute_stats
+_DONOR_KEY = "COALESCE({r}.blood_type, ''), COALESCE({r}.status, ''), COALESCE(substr({r}.last_donation_date, 1, 10), '')"
+_REQUEST_STATE = (
+    "CASE WHEN COALESCE({r}.donors_found, 0) > 0 THEN 'fulfilled' "
+    "WHEN NOT COALESCE({r}.is_active, 1) THEN 'expired' ELSE 'open' END"
+)
+
+
+def _count_donor(r, d):
+    return (
+        f"INSERT INTO villingili_donor_counts (blood_type, status, last_donation, n) VALUES ({_DONOR_KEY.format(r=r)}, {d}) "
+        "ON CONFLICT (blood_type, status, last_donation) DO UPDATE SET n = n + excluded.n;"
+    )
+
+
+def _count_request(r, d):
+    state = _REQUEST_STATE.format(r=r)
+    return (
+        "INSERT INTO villingili_request_daily (day, created, open, fulfilled, expired) "
+        f"VALUES (substr({r}.created_at, 1, 10), {d}, "
+        + ", ".join(f"CASE WHEN {state} = '{s}' THEN {d} ELSE 0 END" for s in ("open", "fulfilled", "expired"))
+        + ") ON CONFLICT (day) DO UPDATE SET created = created + excluded.created, open = open + excluded.open, "
+        "fulfilled = fulfilled + excluded.fulfilled, expired = expired + excluded.expired;"
+    )
+
+
+LOCAL_SCHEMA += f"""
+CREATE TRIGGER IF NOT EXISTS trg_villingili_users_stats_insert AFTER INSERT ON villingili_users
+BEGIN {_count_donor("NEW", 1)} END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_users_stats_delete AFTER DELETE ON villingili_users
+BEGIN {_count_donor("OLD", -1)} END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_users_stats_update AFTER UPDATE OF blood_type, status, last_donation_date ON villingili_users
+BEGIN {_count_donor("OLD", -1)} {_count_donor("NEW", 1)} END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_requests_stats_insert AFTER INSERT ON villingili_requests
+BEGIN {_count_request("NEW", 1)} END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_requests_stats_delete AFTER DELETE ON villingili_requests
+BEGIN {_count_request("OLD", -1)} END;
+CREATE TRIGGER IF NOT EXISTS trg_villingili_requests_stats_update AFTER UPDATE OF created_at, is_active, donors_found ON villingili_requests
+BEGIN {_count_request("OLD", -1)} {_count_request("NEW", 1)} END;
+"""
+
+# Columns added after the tables first shipped (supabase/gazetteer.sql,
+# expired_posts.sql), for older local DBs
+_ADDED_COLUMNS = [
+    ("villingili_users", "island_code", "TEXT"),
+    ("villingili_users", "atoll_code", "TEXT"),
+    ("villingili_requests", "island_code", "TEXT"),
+    ("villingili_requests", "atoll_code", "TEXT"),
+    ("villingili_requests", "expired_post_pending", "BOOLEAN DEFAULT 0"),
+]
+
+
+def init_local_schema(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        for table, column, kind in _ADDED_COLUMNS:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        conn.executescript(LOCAL_SCHEMA)
+        conn.commit()
+        # Counters for rows written before the triggers existed
+        _rpc_recompute_stats(conn, db_path or DB_PATH, {})
+    finally:
+        conn.close()
+    _columns_cache.clear()
+
 
 class DBResponse:
-    def __init__(self, data=None, error=None):
+    def __init__(self, data=None, error=None, count=None):
         self.data = data
         self.error = error
+        self.count = count
+
+# Deleted rows are recorded in villingili_tombstones when that table exists
+_TOMBSTONE_KEYS = {"villingili_users": "telegram_id", "villingili_requests": "id"}
+
+_columns_cache = {}
+
+def _table_columns(cursor, db_path, table_name):
+    key = (db_path, table_name)
+    if key not in _columns_cache:
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+        if not columns:
+            return columns  # table not created yet, don't remember that
+        _columns_cache[key] = columns
+    return _columns_cache[key]
+
+def _record_tombstones(cursor, db_path, table_name, where_clause, params):
+    # Mirror the Postgres tombstone trigger (supabase/changes.sql)
+    key = _TOMBSTONE_KEYS.get(table_name)
+    if key and _table_columns(cursor, db_path, "villingili_tombstones"):
+        cursor.execute(f"SELECT {key} FROM {table_name} {where_clause}", params)
+        now = datetime.datetime.now().isoformat()
+        cursor.executemany(
+            "INSERT INTO villingili_tombstones (table_name, row_id, deleted_at) VALUES (?, ?, ?)",
+            [(table_name, str(row[0]), now) for row in cursor.fetchall()],
+        )
+
+def _set_clause(row):
+    keys = list(row.keys())
+    values = [json.dumps(v) if isinstance(v, (dict, list)) else v for v in row.values()]
+    return keys, values
+
+def _rpc_merge_users(conn, db_path, params):
+    # supabase/merge_users.sql, as one SQLite transaction
+    from .merge import merged_row
+    source_id, target_id = int(params["p_source"]), int(params["p_target"])
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        src = cursor.execute("SELECT * FROM villingili_users WHERE telegram_id = ?", (source_id,)).fetchone()
+        if not src:
+            conn.rollback()
+            return None
+        tgt = cursor.execute("SELECT * FROM villingili_users WHERE telegram_id = ?", (target_id,)).fetchone()
+        merged = merged_row(dict(src), dict(tgt) if tgt else {"telegram_id": target_id}, params.get("p_policy") or "keep_target", params.get("p_fields"))
+
+        now = datetime.datetime.now().isoformat()
+        if "updated_at" in _table_columns(cursor, db_path, "villingili_users"):
+            merged["updated_at"] = now
+        if not tgt:
+            merged.setdefault("created_at", now)
+
+        cursor.execute("UPDATE villingili_users SET phone_number = phone_number || '_merging_' || telegram_id WHERE telegram_id = ?", (source_id,))
+        keys, values = _set_clause(merged)
+        if tgt:
+            cursor.execute(f"UPDATE villingili_users SET {', '.join(f'{k} = ?' for k in keys)} WHERE telegram_id = ?", values + [target_id])
+        else:
+            cursor.execute(f"INSERT INTO villingili_users ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})", values)
+
+        if "updated_at" in _table_columns(cursor, db_path, "villingili_requests"):
+            cursor.execute("UPDATE villingili_requests SET requester_id = ?, updated_at = ? WHERE requester_id = ?", (target_id, now, source_id))
+        else:
+            cursor.execute("UPDATE villingili_requests SET requester_id = ? WHERE requester_id = ?", (target_id, source_id))
+
+        _record_tombstones(cursor, db_path, "villingili_users", "WHERE telegram_id = ?", [source_id])
+        cursor.execute("DELETE FROM villingili_users WHERE telegram_id = ?", (source_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    row = cursor.execute("SELECT * FROM villingili_users WHERE telegram_id = ?", (target_id,)).fetchone()
+    return dict(row) if row else merged
+
+def _now_plus(seconds):
+    return (datetime.datetime.now() + datetime.timedelta(seconds=float(seconds))).isoformat()
+
+def _rpc_create_request(conn, db_path, params):
+    # supabase/outbox.sql: the request and its channel post in one transaction
+    cursor = conn.cursor()
+    now = datetime.datetime.now().isoformat()
+    row = {"id": str(uuid.uuid4()), "is_active": True, "donors_found": 0, "created_at": now, **params["p_request"]}
+    if "updated_at" in _table_columns(cursor, db_path, "villingili_requests"):
+        row["updated_at"] = now
+    keys, values = _set_clause(row)
+    post = params.get("p_post")
+    try:
+        cursor.execute(f"INSERT INTO villingili_requests ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})", values)
+        if post:
+            cursor.execute(
+                "INSERT INTO villingili_outbox (request_id, chat_id, text, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (row["id"], str(post["chat_id"]), post["text"], now, now),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row
+
+def _rpc_outbox_claim(conn, db_path, params):
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    rows = [dict(r) for r in cursor.execute(
+        "SELECT * FROM villingili_outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+        (datetime.datetime.now().isoformat(), int(params["p_limit"])),
+    ).fetchall()]
+    lease = _now_plus(params["p_lease_seconds"])
+    cursor.executemany("UPDATE villingili_outbox SET next_attempt_at = ? WHERE id = ?", [(lease, r["id"]) for r in rows])
+    conn.commit()
+    for r in rows:
+        r["next_attempt_at"] = lease
+    return rows
+
+def _rpc_outbox_complete(conn, db_path, params):
+    cursor = conn.cursor()
+    now = datetime.datetime.now().isoformat()
+    stamp = "updated_at" in _table_columns(cursor, db_path, "villingili_requests")
+    try:
+        for r in params["p_results"]:
+            if "error" in r:
+                tried = 1 if r.get("attempted", True) else 0
+                cursor.execute(
+                    "UPDATE villingili_outbox SET attempts = attempts + ?, last_error = ?, next_attempt_at = ?, "
+                    "status = CASE WHEN attempts + ? >= ? THEN 'failed' ELSE status END WHERE id = ?",
+                    (tried, r["error"], _now_plus(r.get("retry_in") or 0), tried, int(params["p_max_attempts"]), r["id"]),
+                )
+                continue
+            cursor.execute(
+                "UPDATE villingili_outbox SET status = 'sent', attempts = attempts + 1, last_error = NULL, sent_at = ?, message_id = ? WHERE id = ?",
+                (now, r.get("message_id"), r["id"]),
+            )
+            if r.get("message_id") is not None:
+                cursor.execute(
+                    "UPDATE villingili_requests SET telegram_message_id = ?" + (", updated_at = ?" if stamp else "")
+                    + " WHERE id = (SELECT request_id FROM villingili_outbox WHERE id = ?)",
+                    (r["message_id"],) + ((now,) if stamp else ()) + (r["id"],),
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(params["p_results"])
+
+def _rpc_recompute_stats(conn, db_path, params):
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("DELETE FROM villingili_donor_counts")
+        cursor.execute(
+            "INSERT INTO villingili_donor_counts (blood_type, status, last_donation, n) "
+            f"SELECT {_DONOR_KEY.format(r='u')}, COUNT(*) FROM villingili_users u GROUP BY 1, 2, 3"
+        )
+        cursor.execute("DELETE FROM villingili_request_daily")
+        cursor.execute(
+            "INSERT INTO villingili_request_daily (day, created, open, fulfilled, expired) "
+            "SELECT day, COUNT(*), SUM(s = 'open'), SUM(s = 'fulfilled'), SUM(s = 'expired') "
+            f"FROM (SELECT substr(r.created_at, 1, 10) AS day, {_REQUEST_STATE.format(r='r')} AS s FROM villingili_requests r) "
+            "GROUP BY day"
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        "donor_groups": cursor.execute("SELECT COUNT(*) FROM villingili_donor_counts").fetchone()[0],
+        "days": cursor.execute("SELECT COUNT(*) FROM villingili_request_daily").fetchone()[0],
+    }
+
+def _rpc_stats(conn, db_path, params):
+    cursor = conn.cursor()
+    donors = [dict(r) for r in cursor.execute(
+        "SELECT blood_type, status, SUM(n) AS total, "
+        "SUM(CASE WHEN last_donation = '' OR last_donation < ? THEN n ELSE 0 END) AS eligible "
+        "FROM villingili_donor_counts GROUP BY blood_type, status HAVING SUM(n) > 0 ORDER BY blood_type, status",
+        (params["p_cutoff"],),
+    )]
+    requests = [dict(r) for r in cursor.execute(
+        "SELECT day, created, open, fulfilled, expired FROM villingili_request_daily WHERE day >= ? ORDER BY day",
+        (str(params["p_since"]),),
+    )]
+    return {"donors": donors, "requests": requests}
+
+# Postgres functions callable through LocalDB.rpc(), like supabase.rpc()
+_RPC_FUNCTIONS = {
+    "villingili_merge_users": _rpc_merge_users,
+    "villingili_create_request": _rpc_create_request,
+    "villingili_outbox_claim": _rpc_outbox_claim,
+    "villingili_outbox_complete": _rpc_outbox_complete,
+    "villingili_recompute_stats": _rpc_recompute_stats,
+    "villingili_stats": _rpc_stats,
+}
 
 class LocalDB:
     def __init__(self, db_path=DB_PATH):
@@ -22,6 +440,33 @@ class LocalDB:
         # Support both .table() and .from() (v1/v2 sdk styles)
         return self.table(table_name)
 
+    def rpc(self, fn, params=None):
+        return RpcQuery(self.db_path, fn, params or {})
+
+class RpcQuery:
+    def __init__(self, db_path, fn, params):
+        self.db_path = db_path
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        # Unlike table queries this raises, as the postgrest client does for RPC errors
+        count_call("db", f"rpc.{self.fn}")
+        if self.fn not in _RPC_FUNCTIONS:
+            count_error("db", f"rpc.{self.fn}")
+            raise ValueError(f"Could not find the function {self.fn} in LocalDB")
+        with span("db", target=f"rpc.{self.fn}"):
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                return DBResponse(data=_RPC_FUNCTIONS[self.fn](conn, self.db_path, self.params))
+            except Exception as e:
+                count_error("db", f"rpc.{self.fn}")
+                log.error("DB Error in %s: %s", self.fn, e)
+                raise
+            finally:
+                conn.close()
+
 class TableQuery:
     def __init__(self, db_path, table_name):
         self.db_path = db_path
@@ -32,10 +477,13 @@ class TableQuery:
         self.limit_val = None
         self.operation = "select"
         self.data_payload = None
+        self.count_method = None
+        self.single_row = False
 
-    def select(self, columns="*"):
+    def select(self, columns="*", count=None):
         self.operation = "select"
         self.select_cols = columns
+        self.count_method = count  # "exact" -> response.count, like postgrest
         return self
 
     def insert(self, data):
@@ -72,13 +520,33 @@ class TableQuery:
         self.filters.append((column, ">", value))
         return self
     
+    def gte(self, column, value):
+        self.filters.append((column, ">=", value))
+        return self
+    
     def lt(self, column, value):
         self.filters.append((column, "<", value))
         return self
+
+    def lte(self, column, value):
+        self.filters.append((column, "<=", value))
+        return self
+
+    def is_(self, column, value):
+        self.filters.append((column, "IS", value))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, "IN", list(values)))
+        return self
     
     def ilike(self, column, value):
         self.filters.append((column, "LIKE", value))
         return self
+
+    def or_(self, filters):
+        self.filters.append(("__or__", "OR", _parse_or_filter(filters)))
+        return self
         
     def order(self, column, desc=False):
         direction = "DESC" if desc else "ASC"
@@ -89,7 +557,17 @@ class TableQuery:
         self.limit_val = count
         return self
 
+    def single(self):
+        # Like postgrest: data is the row itself, and anything but one row is an error
+        self.single_row = True
+        return self
+
     def execute(self):
+        count_call("db", f"{self.table_name}.{self.operation}")
+        with span("db", target=f"{self.table_name}.{self.operation}"):
+            return self._execute()
+
+    def _execute(self):
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row # To access columns by name
         cursor = conn.cursor()
@@ -112,7 +590,8 @@ class TableQuery:
                 
         except Exception as e:
             conn.close()
-            print(f"DB Error: {e}")
+            count_error("db", f"{self.table_name}.{self.operation}")
+            log.error("DB Error: %s", e)
             return DBResponse(data=None, error=str(e))
         
         conn.close()
@@ -125,6 +604,21 @@ class TableQuery:
         clauses = []
         params = []
         for col, op, val in self.filters:
+            if op == "OR":
+                clauses.append("(" + " OR ".join(f"{c} {o} ?" for c, o, _ in val) + ")")
+                params.extend(v for _, _, v in val)
+                continue
+            if op == "IN":
+                if not val:
+                    clauses.append("0")  # empty IN matches nothing
+                    continue
+                clauses.append(f"{col} IN ({', '.join('?' * len(val))})")
+                params.extend(val)
+                continue
+            if op == "!=" and val is None:
+                # postgrest sends neq.None, which in practice drops NULLs
+                clauses.append(f"{col} IS NOT NULL")
+                continue
             clauses.append(f"{col} {op} ?")
             params.append(val)
         
@@ -146,9 +640,17 @@ class TableQuery:
         
         # Convert to dict list
         results = [dict(row) for row in rows]
+
+        count = None
+        if self.count_method:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.table_name} {where_clause}", params)
+            count = cursor.fetchone()[0]
         
-        # Determine if single result needed? Supabase returns list unless .single() called (not handled here, returning list)
-        return DBResponse(data=results, error=None)
+        if self.single_row:
+            if len(results) != 1:
+                return DBResponse(data=None, error=f"JSON object requested, multiple (or no) rows returned ({len(results)} rows)", count=count)
+            return DBResponse(data=results[0], error=None, count=count)
+        return DBResponse(data=results, error=None, count=count)
 
     def _execute_insert(self, conn, cursor, replace=False):
         results = []
@@ -161,10 +663,13 @@ class TableQuery:
                  pass
             if 'created_at' not in item:
                  item['created_at'] = datetime.datetime.now().isoformat()
+            # Mirror the Postgres updated_at trigger where the column exists
+            if 'updated_at' in _table_columns(cursor, self.db_path, self.table_name):
+                 item['updated_at'] = datetime.datetime.now().isoformat()
             
             # Special handling for UUIDs if needed? request ID often auto-gen by DB
             # For 'users', we assume telegram_id is key. For 'requests', if 'id' missing, gen it
-            if self.table_name == 'requests' and 'id' not in item:
+            if self.table_name in ('requests', 'villingili_requests') and 'id' not in item:
                 item['id'] = str(uuid.uuid4())
 
             keys = list(item.keys())
@@ -197,7 +702,10 @@ class TableQuery:
             
         updates = []
         update_params = []
-        for key, val in self.data_payload.items():
+        payload = dict(self.data_payload)
+        if 'updated_at' in _table_columns(cursor, self.db_path, self.table_name):
+            payload['updated_at'] = datetime.datetime.now().isoformat()
+        for key, val in payload.items():
             updates.append(f"{key} = ?")
             if isinstance(val, (dict, list)):
                 update_params.append(json.dumps(val))
@@ -218,6 +726,8 @@ class TableQuery:
         if not self.filters:
             return DBResponse(data=None, error="Delete requires filters")
             
+        _record_tombstones(cursor, self.db_path, self.table_name, where_clause, params)
+
         query = f"DELETE FROM {self.table_name} {where_clause}"
         cursor.execute(query, params)
         conn.commit()
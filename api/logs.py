@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# Logging for the whole app.
+#
+# Handlers never run on the request path: records go onto a bounded queue and
+# a background listener thread formats and writes them (stdout, plus an
+# optional rotating LOG_FILE). Mock-mode bot replies go to BOT_REPLY_LOG
+# through the same queue, with the file kept open and flushed in batches
+# instead of being reopened per message.
+#
+# LOG_LEVEL=DEBUG brings back the per-update "DEBUG:" detail; the default
+# (INFO) keeps it off. LOG_ASYNC=false writes synchronously (interactive
+# tools, or serverless runtimes that freeze between invocations); it is the
+# default on Vercel (VERCEL is set there), where a frozen listener thread
+# would hold back or lose an invocation's log lines.
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # text | json
+LOG_FILE = os.environ.get("LOG_FILE")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "3"))
+LOG_FLUSH_SECONDS = float(os.environ.get("LOG_FLUSH_SECONDS", "1"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "false" if os.environ.get("VERCEL") else "true").lower() != "false"
+BOT_REPLY_LOG = os.environ.get("BOT_REPLY_LOG", "bot_replies.log")
+
+ROOT_LOGGER = "villingili"
+BOT_REPLIES_LOGGER = "villingili.bot_replies"
+
+_listener = None
+_queue_handler = None
+_configured = False
+
+
+class _TraceIdFilter(logging.Filter):
+    # Runs on the calling thread, where the update's trace is current
+    def filter(self, record):
+        from .tracing import current_trace_id
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: if the writer falls behind, records are dropped and counted."""
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # Look up sys.stdout on every write so redirect_stdout (benchmarks) works
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class BatchedFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file that is flushed at most every LOG_FLUSH_SECONDS (and on close)."""
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True, **kwargs)
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        if time.monotonic() - self._last_flush >= LOG_FLUSH_SECONDS:
+            self._last_flush = time.monotonic()
+            super().flush()
+
+    def close(self):
+        self._last_flush = 0
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "-"),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _only(name):
+    return lambda record: record.name == name
+
+
+def _not(name):
+    return lambda record: record.name != name
+
+
+def _handlers():
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s")
+
+    console = _StdoutHandler()
+    console.setFormatter(formatter)
+    handlers = [console]
+
+    if LOG_FILE:
+        app_file = BatchedFileHandler(LOG_FILE)
+        app_file.setFormatter(formatter)
+        app_file.addFilter(_not(BOT_REPLIES_LOGGER))
+        handlers.append(app_file)
+
+    if BOT_REPLY_LOG:
+        replies = BatchedFileHandler(BOT_REPLY_LOG)
+        replies.setFormatter(logging.Formatter("%(message)s"))
+        replies.addFilter(_only(BOT_REPLIES_LOGGER))
+        handlers.append(replies)
+    return handlers
+
+
+def setup_logging():
+    global _listener, _queue_handler, _configured
+    if _configured:
+        return
+    _configured = True
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+    handlers = _handlers()
+
+    if LOG_ASYNC:
+        _queue_handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(_TraceIdFilter())
+        root.addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        for handler in handlers:
+            handler.addFilter(_TraceIdFilter())
+            root.addHandler(handler)
+
+
+def shutdown_logging():
+    """Drains the queue and flushes files (atexit does this too)."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+    for handler in logging.getLogger(ROOT_LOGGER).handlers:
+        handler.close()
+    if _DroppingQueueHandler.dropped:
+        sys.stderr.write(f"logging: dropped {_DroppingQueueHandler.dropped} records (queue full)\n")
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,99 @@
+from .logs import get_logger
+
+log = get_logger("merge")
+
+# Merging two villingili_users rows that turn out to be the same person
+# (same phone, different telegram_id): the source row's requests move to the
+# target, the target's profile is settled by the policy, and the source row is
+# deleted. The phone number usually moves from source to target, so the
+# source's is freed first (phone_number is UNIQUE).
+#
+# Supabase runs it as one Postgres function (supabase/merge_users.sql);
+# LocalDB runs the same steps in one SQLite transaction. Either way nothing is
+# left half-merged if a step fails.
+
+KEEP_TARGET = "keep_target"    # target keeps its profile
+TAKE_SOURCE = "take_source"    # source's profile fields overwrite the target's
+FILL_MISSING = "fill_missing"  # source fills the target's empty profile fields
+MERGE_POLICIES = (KEEP_TARGET, TAKE_SOURCE, FILL_MISSING)
+
+# The fields a policy moves between the two rows (keep in sync with merge_users.sql)
+PROFILE_FIELDS = ("full_name", "id_card_number", "sex", "address", "blood_type")
+
+RPC_NAME = "villingili_merge_users"
+
+_rpc_missing = False
+
+
+def merged_row(source, target, policy=KEEP_TARGET, fields=None):
+    """The target row after the merge (fields are applied last and always win)."""
+    merged = dict(target)
+    if policy == TAKE_SOURCE:
+        merged.update({f: source.get(f) for f in PROFILE_FIELDS})
+    elif policy == FILL_MISSING:
+        for f in PROFILE_FIELDS:
+            if not merged.get(f) and source.get(f):
+                merged[f] = source[f]
+    elif policy != KEEP_TARGET:
+        raise ValueError(f"unknown merge policy {policy!r}")
+    merged.update(fields or {})
+    merged["telegram_id"] = target["telegram_id"]
+    return merged
+
+
+def merge_users(supabase, source_id, target_id, policy=KEEP_TARGET, fields=None, actor=None):
+    """
+    Merges user source_id into target_id in one transaction.
+
+    fields are written to the target on top of the policy; if the target
+    doesn't exist yet it is created from them (so they must then include
+    full_name and phone_number). Returns the merged target row, or None if
+    the source doesn't exist. Raises on failure, with nothing changed.
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"unknown merge policy {policy!r}")
+    if int(source_id) == int(target_id):
+        raise ValueError("source and target are the same user")
+    params = {"p_source": int(source_id), "p_target": int(target_id), "p_policy": policy, "p_fields": fields or {}}
+    merged = _merge(supabase, params)
+    if merged:
+        from .event_log import record_event
+        record_event("user_merged", "user", target_id, {"source": int(source_id), "policy": policy, "fields": sorted(fields or {})}, actor=actor)
+    # The policy may move the source's address, so the place codes are settled afterwards
+    from .gazetteer import sync_user_place
+    return sync_user_place(supabase, merged)
+
+
+def _merge(supabase, params):
+    global _rpc_missing
+    if not _rpc_missing:
+        try:
+            return supabase.rpc(RPC_NAME, params).execute().data or None
+        except Exception as e:
+            # PGRST202: function not found, merge_users.sql hasn't been run yet
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            _rpc_missing = True
+            log.warning("%s is not installed (run supabase/merge_users.sql); merging without a transaction", RPC_NAME)
+    return _merge_sequential(supabase, params)
+
+
+def _merge_sequential(supabase, params):
+    # The same steps as the SQL function, one round trip each
+    source_id, target_id = params["p_source"], params["p_target"]
+    users = lambda: supabase.table("villingili_users")
+
+    src = users().select("*").eq("telegram_id", source_id).execute().data
+    if not src:
+        return None
+    tgt = users().select("*").eq("telegram_id", target_id).execute().data
+    merged = merged_row(src[0], tgt[0] if tgt else {"telegram_id": target_id}, params["p_policy"], params["p_fields"])
+
+    users().update({"phone_number": f"{src[0]['phone_number']}_merging_{source_id}"}).eq("telegram_id", source_id).execute()
+    if tgt:
+        users().update({k: v for k, v in merged.items() if k not in ("telegram_id", "created_at", "updated_at")}).eq("telegram_id", target_id).execute()
+    else:
+        users().insert(merged).execute()
+    supabase.table("villingili_requests").update({"requester_id": target_id}).eq("requester_id", source_id).execute()
+    users().delete().eq("telegram_id", source_id).execute()
+    return merged
@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import threading
+
+from .logs import get_logger
+
+log = get_logger("metrics")
+
+# In-process metrics, exposed in Prometheus text format at /api/metrics.
+#
+# - MetricsMiddleware: latency histogram, in-flight and 5xx counts per route
+#   template (so /api/scan_jobs/{job_id} is one series, not one per job)
+# - track_flow: the same for process_update, per bot flow ("callback:req_blood",
+#   "contact", "admin_group:photo", ...)
+# - count_call: outbound calls per system (db / telegram), plus the AI
+#   gateway's own counters
+#
+# Numbers are per process; on serverless every warm instance has its own.
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")  # lets a scraper in without an admin JWT
+
+# Seconds; Telegram expects a webhook answer well inside 10 s
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_FLOWS = 100  # callback data comes from clients; cap the label values
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+
+class Series:
+    """Histogram + in-flight gauge + error counter for one label set."""
+    def __init__(self):
+        self.latency = Histogram()
+        self.in_flight = 0
+        self.errors = 0
+
+
+_routes = {}  # (method, route) -> Series
+_flows = {}   # flow -> Series
+_calls = {}   # (system, target) -> [calls, errors]
+
+
+def _series(table, key):
+    series = table.get(key)
+    if series is None:
+        series = table[key] = Series()
+    return series
+
+
+def _begin(table, key):
+    with _lock:
+        _series(table, key).in_flight += 1
+
+
+def _end(table, key, seconds, error):
+    with _lock:
+        series = _series(table, key)
+        series.in_flight -= 1
+        series.latency.observe(seconds)
+        if error:
+            series.errors += 1
+
+
+def count_call(system, target, error=False):
+    with _lock:
+        counts = _calls.setdefault((system, target), [0, 0])
+        counts[0] += 1
+        if error:
+            counts[1] += 1
+
+
+def count_error(system, target):
+    # For a call already counted by count_call
+    with _lock:
+        _calls.setdefault((system, target), [0, 0])[1] += 1
+
+
+def _route_path(scope):
+    # Match up front (the router only records the route once it's running)
+    # so in-flight requests are counted under their route template
+    from starlette.routing import Match
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        key = (scope["method"], _route_path(scope))
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        _begin(_routes, key)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _end(_routes, key, time.perf_counter() - start, status["code"] >= 500)
+
+
+_CALLBACK_WORD = re.compile(r"^[a-z]+$")
+
+
+def update_flow(data):
+    """Names the bot flow an update belongs to, with a bounded set of values."""
+    if "callback_query" in data:
+        words = []
+        for word in (data["callback_query"].get("data") or "").split("_")[:3]:
+            if not _CALLBACK_WORD.match(word):
+                break
+            words.append(word)
+        return "callback:" + ("_".join(words) or "other")
+
+    msg = data.get("message")
+    if not msg:
+        return next((k for k in data if k != "update_id"), "unknown")
+
+    admin_group = os.environ.get("TELEGRAM_ADMIN_GROUP_ID")
+    prefix = "admin_group:" if admin_group and str(msg.get("chat", {}).get("id")) == admin_group else ""
+    if msg.get("contact"):
+        return prefix + "contact"
+    if msg.get("photo"):
+        return prefix + "photo"
+    text = msg.get("text") or ""
+    if text.startswith("/"):
+        command = text.split()[0].split("@")[0].lower()
+        return prefix + ("command:" + command if _CALLBACK_WORD.match(command[1:]) else "command")
+    if msg.get("reply_to_message"):
+        return prefix + "reply"
+    return prefix + ("text" if text else "other")
+
+
+def track_flow(handler):
+    """Wraps process_update(data) to record per-flow latency, in-flight and errors."""
+    async def wrapper(data):
+        flow = update_flow(data)
+        with _lock:
+            if flow not in _flows and len(_flows) >= MAX_FLOWS:
+                flow = "other"
+        _begin(_flows, flow)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = await handler(data)
+            error = False
+            return result
+        finally:
+            _end(_flows, flow, time.perf_counter() - start, error)
+
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+
+_DB_OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+def instrument_supabase(client):
+    # Count PostgREST round trips as they leave the shared httpx session
+    try:
+        session = client.postgrest.session
+    except Exception as e:
+        log.warning("Metrics: can't instrument Supabase client: %s", e)
+        return
+
+    def on_response(response):
+        request = response.request
+        prefix, _, name = request.url.path.rpartition("/")
+        if prefix.endswith("/rpc"):
+            target = f"rpc.{name}"
+        else:
+            target = f"{name}.{_DB_OPERATIONS.get(request.method, request.method.lower())}"
+        count_call("db", target, response.status_code >= 400)
+
+    session.event_hooks["response"].append(on_response)
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, histograms_by_labels):
+    lines = []
+    for labels, histogram in histograms_by_labels:
+        cumulative = 0
+        for bound, n in zip(BUCKETS, histogram.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def _family(name, kind, help_text, lines):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"] + lines
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format (0.0.4)."""
+    with _lock:
+        routes = [({"method": m, "route": r}, s) for (m, r), s in sorted(_routes.items())]
+        flows = [({"flow": f}, s) for f, s in sorted(_flows.items())]
+        calls = sorted((k, list(v)) for k, v in _calls.items())
+        out = []
+        out += _family("villingili_http_request_duration_seconds", "histogram", "HTTP request latency by route template.",
+                       _histogram_lines("villingili_http_request_duration_seconds", [(l, s.latency) for l, s in routes]))
+        out += _family("villingili_http_requests_in_flight", "gauge", "HTTP requests being served.",
+                       [f"villingili_http_requests_in_flight{_labels(**l)} {s.in_flight}" for l, s in routes])
+        out += _family("villingili_http_request_errors_total", "counter", "HTTP responses with a 5xx status.",
+                       [f"villingili_http_request_errors_total{_labels(**l)} {s.errors}" for l, s in routes])
+        out += _family("villingili_bot_update_duration_seconds", "histogram", "Telegram update handling latency by flow.",
+                       _histogram_lines("villingili_bot_update_duration_seconds", [(l, s.latency) for l, s in flows]))
+        out += _family("villingili_bot_updates_in_flight", "gauge", "Telegram updates being handled.",
+                       [f"villingili_bot_updates_in_flight{_labels(**l)} {s.in_flight}" for l, s in flows])
+        out += _family("villingili_bot_update_errors_total", "counter", "Telegram updates whose handler raised.",
+                       [f"villingili_bot_update_errors_total{_labels(**l)} {s.errors}" for l, s in flows])
+    out += _family("villingili_external_calls_total", "counter", "Outbound calls by system and target.",
+                   [f"villingili_external_calls_total{_labels(system=s, target=t)} {n}" for (s, t), (n, _) in calls])
+    out += _family("villingili_external_call_errors_total", "counter", "Failed outbound calls by system and target.",
+                   [f"villingili_external_call_errors_total{_labels(system=s, target=t)} {e}" for (s, t), (_, e) in calls])
+
+    from .channel_edits import coalescer
+    name = "villingili_channel_edits_total"
+    out += _family(name, "counter", "Channel post edits by outcome.",
+                   [f"{name}{_labels(result=k)} {v}" for k, v in sorted(coalescer.stats.items())])
+
+    from .event_log import writer
+    name = "villingili_event_log_total"
+    out += _family(name, "counter", "Event log entries by outcome.",
+                   [f"{name}{_labels(result=k)} {v}" for k, v in sorted(writer.stats.items())])
+    out += _family("villingili_event_log_queued", "gauge", "Events waiting to be written to the log.",
+                   [f"villingili_event_log_queued {writer.pending()}"])
+
+    from . import snapshot as local_snapshot
+    name = "villingili_snapshot_total"
+    out += _family(name, "counter", "Donor lookups by where they were answered, and snapshot refreshes.",
+                   [f"{name}{_labels(result=k)} {v}" for k, v in sorted(local_snapshot.stats.items())])
+    age = local_snapshot.snapshot_age()
+    if age is not None:
+        out += _family("villingili_snapshot_age_seconds", "gauge", "Age of the local snapshot reads fall back to.",
+                       [f"villingili_snapshot_age_seconds {age:.0f}"])
+
+    from .donor_alerts import alerts
+    snapshot = alerts.snapshot()
+    name = "villingili_donor_alerts_total"
+    out += _family(name, "counter", "Donor alerts by urgency and outcome.",
+                   [f"{name}{_labels(urgency=t['urgency'], result=t['result'])} {t['count']}" for t in snapshot["totals"]])
+    out += _family("villingili_donor_alerts_queued", "gauge", "Donor alerts and selections waiting to be sent.",
+                   [f"villingili_donor_alerts_queued {snapshot['queued']}"])
+    name = "villingili_donor_alert_delay_seconds"
+    out += _family(name, "histogram", "Time from a new request to each donor alert being sent, by urgency.",
+                   _histogram_lines(name, [({"urgency": u}, h) for u, h in sorted(alerts.delay.items())]))
+
+    from .ai_gateway import get_ai_metrics
+    ai = sorted(get_ai_metrics().items())
+    for field, kind, help_text in (
+        ("calls", "counter", "AI calls by call type."),
+        ("errors", "counter", "Failed AI calls."),
+        ("timeouts", "counter", "AI calls that timed out."),
+        ("rejected", "counter", "AI calls refused because too many were in flight."),
+        ("prompt_tokens", "counter", "Prompt tokens used."),
+        ("completion_tokens", "counter", "Completion tokens used."),
+    ):
+        name = f"villingili_ai_{field}_total"
+        out += _family(name, kind, help_text, [f"{name}{_labels(call_type=c)} {m[field]}" for c, m in ai])
+    name = "villingili_ai_latency_seconds_total"
+    out += _family(name, "counter", "Time spent in AI calls.", [f"{name}{_labels(call_type=c)} {m['total_ms'] / 1000:.6f}" for c, m in ai])
+    return "\n".join(out) + "\n"
+
+
+def reset_metrics():
+    # For benchmarks
+    with _lock:
+        _routes.clear()
+        _flows.clear()
+        _calls.clear()
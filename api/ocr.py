@@ -0,0 +1,449 @@
+import os
+import io
+import uuid
+import base64
+import asyncio
+import hashlib
+import datetime
+
+from .utils import LRUCache, run_in_background, send_telegram_message, edit_telegram_message, telegram_api_url, telegram_file_url
+from .metrics import count_call
+from .tracing import span
+from .logs import get_logger
+
+log = get_logger("ocr")
+
+# ID card scanning for the admin group.
+# The webhook only posts "Scanning ID Card..." and schedules a job; the job
+# downloads the photo once, shrinks it to what the vision model needs, asks
+# the AI and then edits the scanning message in place with the result.
+# Cards that read as valid are cached by Telegram file_unique_id and by a
+# SHA-256 of the downloaded bytes, so re-sending the same photo costs
+# nothing. Only exact copies match: cards printed from the same template
+# look alike to any fuzzy image hash, and a near match would hand one
+# person's name and ID number to another. Unclear or invalid results are
+# not cached, so a clearer re-upload gets a fresh read.
+#
+# Jobs run in the webhook's invocation (it drains them before finishing, see
+# finish_update in index.py) and their status is kept in villingili_scan_jobs
+# (supabase/scan_jobs.sql), so /api/scan_jobs/{job_id} answers from any
+# instance. The job id is shown at the foot of the scan message.
+
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", "1024"))
+OCR_JPEG_QUALITY = int(os.environ.get("OCR_JPEG_QUALITY", "85"))
+OCR_DOWNLOAD_TIMEOUT = float(os.environ.get("OCR_DOWNLOAD_TIMEOUT", "15"))
+
+OCR_CACHE = LRUCache(int(os.environ.get("OCR_CACHE_SIZE", "256")))   # file_unique_id -> result
+BYTES_CACHE = LRUCache(int(os.environ.get("OCR_CACHE_SIZE", "256")))  # sha256 of the photo -> result
+SCAN_JOBS = LRUCache(500)                                             # job_id -> status, until scan_jobs.sql is run
+
+# Albums (media groups) arrive as one update per photo; collect them briefly
+ALBUM_COLLECT_SECONDS = float(os.environ.get("ALBUM_COLLECT_SECONDS", "1.5"))
+ALBUM_SCAN_CONCURRENCY = int(os.environ.get("ALBUM_SCAN_CONCURRENCY", "4"))
+_ALBUMS = {}                                                          # media_group_id -> pending album
+
+BLOOD_TYPES = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
+
+
+def fetch_telegram_file(file_id: str):
+    import requests
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    with span("telegram", method="getFile"):
+        res = requests.get(
+            telegram_api_url(token, "getFile"),
+            params={"file_id": file_id},
+            timeout=OCR_DOWNLOAD_TIMEOUT,
+        ).json()
+    count_call("telegram", "getFile", not res.get("ok"))
+    if not res.get("ok"):
+        log.error("getFile failed: %s", res)
+        return None
+    file_path = res["result"]["file_path"]
+    with span("telegram", method="file_download"):
+        img = requests.get(telegram_file_url(token, file_path), timeout=OCR_DOWNLOAD_TIMEOUT)
+    count_call("telegram", "file_download", not img.ok)
+    img.raise_for_status()
+    return img.content
+
+
+def prepare_image(raw: bytes):
+    """Returns the JPEG to send. Without Pillow the bytes pass through unchanged."""
+    try:
+        from PIL import Image, ImageChops, ImageOps
+        img = Image.open(io.BytesIO(raw))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception:
+        # No Pillow, or a format it can't read: send as-is
+        return raw
+
+    # Crop uniform background (table/desk) around the card
+    bg = Image.new("RGB", img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, bg).convert("L").point(lambda p: 255 if p > 40 else 0)
+    box = diff.getbbox()
+    if box and (box[2] - box[0]) * (box[3] - box[1]) > 0.25 * img.size[0] * img.size[1]:
+        img = img.crop(box)
+
+    if max(img.size) > OCR_MAX_SIDE:
+        img.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=OCR_JPEG_QUALITY)
+    return out.getvalue()
+
+
+def scan_id_card(photo_size: dict):
+    """Blocking: fetch -> downscale -> AI, with caching. Returns the AI result dict or None."""
+    from .utils import analyze_id_card_with_ai
+
+    unique_id = photo_size.get("file_unique_id")
+    if unique_id:
+        cached = OCR_CACHE.get(unique_id)
+        if cached is not None:
+            return cached
+
+    raw = fetch_telegram_file(photo_size["file_id"])
+    if not raw:
+        return None
+
+    digest = hashlib.sha256(raw).hexdigest()
+    result = BYTES_CACHE.get(digest)
+    if result is None:
+        data_url = "data:image/jpeg;base64," + base64.b64encode(prepare_image(raw)).decode("ascii")
+        result = analyze_id_card_with_ai(data_url)
+        if not result or not result.get("is_valid"):
+            return result
+        BYTES_CACHE.put(digest, result)
+
+    if unique_id:
+        OCR_CACHE.put(unique_id, result)
+    return result
+
+
+def build_draft_user(result: dict):
+    """Turns a valid scan result into (fake_tg_id, user_data, details) for the draft row."""
+    name = result.get("full_name", "Unknown")
+    nid = result.get("id_card_number", "Unknown")
+    sex = result.get("sex", "Unknown")
+    addr = result.get("address", "Unknown")
+    dob = result.get("date_of_birth", "Unknown")
+
+    # Normalize Sex
+    if sex and sex.upper().startswith("M"): sex = "Male"
+    elif sex and sex.upper().startswith("F"): sex = "Female"
+
+    # Temp ID from NID hash so re-scans of the same card hit the same draft
+    fake_tg_id = int(hashlib.sha256(nid.encode('utf-8')).hexdigest(), 16) % (10**12)
+
+    user_data = {
+        "telegram_id": fake_tg_id,
+        "full_name": name,
+        "phone_number": f"DRAFT_{fake_tg_id}", # Placeholder to satisfy NOT NULL constraint
+        "id_card_number": nid,
+        "sex": sex,
+        "address": addr,
+        "status": "pending", # Satisfies CHECK (status in ('active', 'pending', 'banned'))
+        "role": "user"
+    }
+    details = {"name": name, "nid": nid, "dob": dob, "addr": addr}
+    return fake_tg_id, user_data, details
+
+
+def scan_error_text(result):
+    """Message for a missing/invalid scan result, or None if the card is usable."""
+    if not result:
+        return "⚠️ AI Analysis failed. Please try again."
+    if not result.get("is_valid"):
+        if result.get("error") == "UNCLEAR":
+            return "⚠️ **Image Unclear**\nPlease re-upload a **clear image** of the ID card without glare or reflection."
+        return "❌ **Not Identified**\nPlease upload a valid Maldives National Identity Card."
+    return None
+
+
+def save_draft_user(supabase, fake_tg_id, user_data):
+    # Manual Upsert (Check -> Insert/Update) so an existing row keeps unrelated columns
+    from .gazetteer import place_fields
+    user_data = {**user_data, **place_fields(supabase, user_data.get("address"), address=True)}
+    ex = supabase.table("villingili_users").select("telegram_id").eq("telegram_id", fake_tg_id).execute()
+    if ex.data:
+        supabase.table("villingili_users").update(user_data).eq("telegram_id", fake_tg_id).execute()
+    else:
+        supabase.table("villingili_users").insert(user_data).execute()
+
+
+def find_registered_user(supabase, nid, fake_tg_id):
+    """Another user (not this card's draft) with the same ID card number, or None."""
+    if not nid or nid == "Unknown":
+        return None
+    rows = supabase.table("villingili_users").select("telegram_id, full_name, phone_number")\
+        .eq("id_card_number", nid).neq("telegram_id", fake_tg_id).limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def offer_update(chat_id, message_id, existing, user_data, job_id=None):
+    # The scanned fields wait in the pending store until an admin picks
+    # force_update_ or cancel_update_ (handled in index.py)
+    from .pending_store import get_pending_scan_store
+    tid = existing["telegram_id"]
+    get_pending_scan_store().put(tid, {"telegram_id": tid, **{k: user_data[k] for k in ("full_name", "id_card_number", "sex", "address")}})
+    msg = (
+        f"⚠️ <b>ID Card Already Registered</b>\n\n"
+        f"👤 {existing.get('full_name')} (☎️ {existing.get('phone_number')})\n\n"
+        f"<b>Scanned:</b>\n"
+        f"👤 Name: {user_data['full_name']}\n"
+        f"🆔 ID: {user_data['id_card_number']}\n"
+        f"🏠 Addr: {user_data['address']}\n\n"
+        f"Update this user with the scanned details?"
+    )
+    keyboard = {"inline_keyboard": [[
+        {"text": "✅ Update", "callback_data": f"force_update_{tid}"},
+        {"text": "❌ Cancel", "callback_data": f"cancel_update_{tid}"},
+    ]]}
+    _finish(chat_id, message_id, msg, keyboard, job_id)
+
+
+def blood_type_keyboard(fake_tg_id):
+    return {
+        "inline_keyboard": [
+            [{"text": bt, "callback_data": f"admin_set_blood_{fake_tg_id}_{bt}"} for bt in BLOOD_TYPES[i:i + 2]]
+            for i in range(0, len(BLOOD_TYPES), 2)
+        ]
+    }
+
+
+_JOB_COLUMNS = ("status", "chat_id", "message_id", "cards", "telegram_id", "saved", "error", "created_at", "finished_at")
+_jobs_table_missing = False
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _new_job(chat_id, message_id, status, **fields):
+    return {"job_id": uuid.uuid4().hex[:12], "status": status, "chat_id": chat_id,
+            "message_id": message_id, "created_at": _utc_now(), **fields}
+
+
+def save_scan_job(supabase, job):
+    """Writes the job's current state; never raises (a lost status must not stop the scan)."""
+    global _jobs_table_missing
+    if not _jobs_table_missing:
+        from .utils import missing_table
+        row = {"id": job["job_id"], **{k: job.get(k) for k in _JOB_COLUMNS}}
+        try:
+            res = supabase.table("villingili_scan_jobs").upsert(row, on_conflict="id").execute()
+            if getattr(res, "error", None):
+                raise RuntimeError(res.error)  # LocalDB reports errors instead of raising
+            return
+        except Exception as e:
+            if not missing_table(e):
+                log.error("Scan job save failed: %s", e)
+                return
+            _jobs_table_missing = True
+            log.warning("villingili_scan_jobs is missing (run supabase/scan_jobs.sql); keeping scan jobs in memory")
+    SCAN_JOBS.put(job["job_id"], job)
+
+
+def get_scan_job(supabase, job_id: str):
+    if _jobs_table_missing:
+        return SCAN_JOBS.get(job_id)
+    rows = supabase.table("villingili_scan_jobs").select("*").eq("id", job_id).execute().data
+    if not rows:
+        return None
+    row = dict(rows[0])
+    row["job_id"] = row.pop("id")
+    return row
+
+
+def _finish(chat_id, message_id, text, reply_markup=None, job_id=None):
+    if job_id:
+        # For GET /api/scan_jobs/{job_id}
+        text += f"\n\n🧾 Scan job {job_id}"
+    if message_id:
+        edit_telegram_message(chat_id, message_id, text, reply_markup=reply_markup)
+    else:
+        send_telegram_message(chat_id, text, reply_markup=reply_markup)
+
+
+async def _run_scan_job(supabase, job, photo_size):
+    chat_id, message_id, job_id = job["chat_id"], job["message_id"], job["job_id"]
+    job["status"] = "running"
+    await asyncio.to_thread(save_scan_job, supabase, job)
+    try:
+        result = await asyncio.to_thread(scan_id_card, photo_size)
+        error_text = scan_error_text(result)
+        if error_text:
+            job.update(status="failed", error=(result or {}).get("error") or "AI_FAILED")
+            await asyncio.to_thread(_finish, chat_id, message_id, error_text, None, job_id)
+            return
+
+        fake_tg_id, user_data, d = build_draft_user(result)
+        try:
+            existing = await asyncio.to_thread(find_registered_user, supabase, d["nid"], fake_tg_id)
+            if existing:
+                # Don't start a duplicate draft: offer to update the registered user
+                await asyncio.to_thread(offer_update, chat_id, message_id, existing, user_data, job_id)
+                job.update(status="done", telegram_id=existing["telegram_id"])
+                return
+            await asyncio.to_thread(save_draft_user, supabase, fake_tg_id, user_data)
+        except Exception as e:
+            log.error("DB Upsert Error: %s", e)
+            job.update(status="failed", error=str(e))
+            await asyncio.to_thread(_finish, chat_id, message_id, f"⚠️ Database Error: {e}", None, job_id)
+            return
+
+        msg = (
+            f"✅ **ID Scanned Successfully!**\n\n"
+            f"👤 Name: {d['name']}\n"
+            f"🆔 ID: {d['nid']}\n"
+            f"🎂 DOB: {d['dob']}\n"
+            f"🏠 Addr: {d['addr']}\n\n"
+            f"🩸 **Select Blood Type:**"
+        )
+        await asyncio.to_thread(_finish, chat_id, message_id, msg, blood_type_keyboard(fake_tg_id), job_id)
+        job.update(status="done", telegram_id=fake_tg_id)
+    except asyncio.CancelledError:
+        # Out of time in this invocation: say so rather than leave "Scanning..." up
+        job.update(status="failed", error="TIMEOUT")
+        _finish(chat_id, message_id, "⚠️ Scan took too long. Please send the photo again.", None, job_id)
+        raise
+    except Exception as e:
+        log.error("Photo Error: %s", e)
+        job.update(status="failed", error=str(e))
+        await asyncio.to_thread(_finish, chat_id, message_id, f"⚠️ Error processing photo: {e}", None, job_id)
+    finally:
+        job["finished_at"] = _utc_now()
+        # Plain call: an await here would be cut short when the task is cancelled
+        save_scan_job(supabase, job)
+
+
+async def start_id_card_scan(chat_id, photo: list):
+    """Posts the scanning notice and schedules the scan. Returns the job id."""
+    from .utils import get_supabase_client
+
+    job = _new_job(chat_id, None, "queued")
+    sent = send_telegram_message(chat_id, f"🔍 Scanning ID Card... (job {job['job_id']})")
+    job["message_id"] = sent.get("result", {}).get("message_id") if sent else None
+    run_in_background(_run_scan_job(get_supabase_client(), job, photo[-1]))
+    return job["job_id"]
+
+
+async def queue_album_photo(chat_id, media_group_id, photo: list):
+    """Buffers one photo of an album; the first photo schedules the batch."""
+    album = _ALBUMS.get(media_group_id)
+    if album is None:
+        album = _ALBUMS[media_group_id] = {"chat_id": chat_id, "photos": []}
+        run_in_background(_flush_album(media_group_id))
+    album["photos"].append(photo[-1])
+
+
+async def _flush_album(media_group_id):
+    # Each instance batches the photos of an album that reached it, so an
+    # album spread over several instances gives one summary per instance;
+    # a photo that arrived alone gets the single-card flow.
+    try:
+        await asyncio.sleep(ALBUM_COLLECT_SECONDS)
+    except asyncio.CancelledError:
+        album = _ALBUMS.pop(media_group_id, None)
+        if album:
+            send_telegram_message(album["chat_id"], f"⚠️ {len(album['photos'])} ID card(s) from an album were not scanned in time. Please send them again.")
+        raise
+    album = _ALBUMS.pop(media_group_id, None)
+    if not album:
+        return
+    if len(album["photos"]) == 1:
+        await start_id_card_scan(album["chat_id"], album["photos"])
+    else:
+        await process_album(album["chat_id"], album["photos"])
+
+
+async def process_album(chat_id, photo_sizes: list):
+    """Scans all cards concurrently, saves drafts in one upsert and posts one summary
+    (plus an update offer for each card that is already registered)."""
+    from .utils import get_supabase_client
+
+    job = _new_job(chat_id, None, "running", cards=len(photo_sizes))
+    job_id = job["job_id"]
+    sent = await asyncio.to_thread(send_telegram_message, chat_id, f"🔍 Scanning {len(photo_sizes)} ID Cards... (job {job_id})")
+    message_id = job["message_id"] = sent.get("result", {}).get("message_id") if sent else None
+
+    supabase = get_supabase_client()
+    await asyncio.to_thread(save_scan_job, supabase, job)
+
+    limit = asyncio.Semaphore(ALBUM_SCAN_CONCURRENCY)
+
+    async def scan_one(photo_size):
+        async with limit:
+            try:
+                return await asyncio.to_thread(scan_id_card, photo_size)
+            except Exception as e:
+                log.error("Album Photo Error: %s", e)
+                return None
+
+    try:
+        results = await asyncio.gather(*(scan_one(p) for p in photo_sizes))
+    except asyncio.CancelledError:
+        # Out of time in this invocation: say so rather than leave "Scanning..." up
+        job.update(status="failed", error="TIMEOUT", finished_at=_utc_now())
+        save_scan_job(supabase, job)
+        _finish(chat_id, message_id, f"⚠️ Scanning {len(photo_sizes)} ID cards took too long. Please send them again.", None, job_id)
+        raise
+
+    cards = [(n, build_draft_user(result)) for n, result in enumerate(results, start=1) if not scan_error_text(result)]
+    try:
+        # Same check as a single card: a registered ID gets an update offer, not a second draft
+        existing = await asyncio.to_thread(
+            lambda: {n: find_registered_user(supabase, d["nid"], fake_tg_id) for n, (fake_tg_id, _, d) in cards}
+        )
+    except Exception as e:
+        log.error("Album Registration Check Error: %s", e)
+        job.update(status="failed", error=str(e), finished_at=_utc_now())
+        await asyncio.to_thread(save_scan_job, supabase, job)
+        await asyncio.to_thread(_finish, chat_id, message_id, f"⚠️ Database Error: {e}", None, job_id)
+        return job_id
+
+    lines = [f"📋 <b>Scanned {len(photo_sizes)} ID Cards</b>\n"]
+    drafts = {}
+    offers = []
+    keyboard_rows = []
+    for n, result in enumerate(results, start=1):
+        error_text = scan_error_text(result)
+        if error_text:
+            reason = (result or {}).get("error") or "AI failed"
+            lines.append(f"{n}. ⚠️ Not read ({reason})")
+            continue
+
+        fake_tg_id, user_data, d = build_draft_user(result)
+        if existing.get(n):
+            offers.append((existing[n], user_data))
+            lines.append(f"{n}. ♻️ Already registered: {existing[n].get('full_name')} | 🆔 {d['nid']} (update offer below)")
+            continue
+        drafts[fake_tg_id] = user_data
+        lines.append(f"{n}. 👤 {d['name']} | 🆔 {d['nid']} | 🏠 {d['addr']}")
+        # An album is at most 10 photos, so 8 buttons per card stays under Telegram's 100
+        # album_set_blood_ keeps the summary message (admin_set_blood_ would replace it)
+        keyboard_rows.append([{"text": f"{n}: {bt}", "callback_data": f"album_set_blood_{fake_tg_id}_{bt}"} for bt in BLOOD_TYPES[:4]])
+        keyboard_rows.append([{"text": f"{n}: {bt}", "callback_data": f"album_set_blood_{fake_tg_id}_{bt}"} for bt in BLOOD_TYPES[4:]])
+
+    if drafts:
+        try:
+            from .gazetteer import place_fields
+            await asyncio.to_thread(
+                lambda: supabase.table("villingili_users").upsert(
+                    [{**u, **place_fields(supabase, u.get("address"), address=True)} for u in drafts.values()], on_conflict="telegram_id"
+                ).execute()
+            )
+        except Exception as e:
+            log.error("Album Upsert Error: %s", e)
+            job.update(status="failed", error=str(e), finished_at=_utc_now())
+            await asyncio.to_thread(save_scan_job, supabase, job)
+            await asyncio.to_thread(_finish, chat_id, message_id, f"⚠️ Database Error: {e}", None, job_id)
+            return job_id
+        lines.append("\n🩸 <b>Select Blood Type for each card:</b>")
+
+    reply_markup = {"inline_keyboard": keyboard_rows} if keyboard_rows else None
+    await asyncio.to_thread(_finish, chat_id, message_id, "\n".join(lines), reply_markup, job_id)
+    # One message each: force_update_/cancel_update_ replace the message they're on
+    for registered, user_data in offers:
+        await asyncio.to_thread(offer_update, chat_id, None, registered, user_data, job_id)
+    job.update(status="done", saved=len(drafts), finished_at=_utc_now())
+    await asyncio.to_thread(save_scan_job, supabase, job)
+    return job_id
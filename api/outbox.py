@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+
+from .logs import get_logger
+
+log = get_logger("outbox")
+
+# Blood requests and their channel posts.
+#
+# create_blood_request() saves the request and an outbox row (the channel
+# post to make) in one transaction (supabase/outbox.sql), so the requester is
+# answered without waiting on Telegram. dispatch_outbox() then posts due rows
+# in batches and records the message ids (and failures, with backoff) in one
+# round trip per batch. It is kicked after every new request and run from
+# /api/cron_outbox to pick up anything left behind.
+#
+# Serverless instances (Vercel sets VERCEL) freeze once an invocation ends,
+# so there the webhook posts what's due before it finishes (drain_outbox)
+# and failed posts wait for the cron instead of a sleeping dispatcher.
+#
+# Claiming a row pushes its next_attempt_at out by OUTBOX_LEASE_SECONDS, so
+# two workers never post the same row, and a worker that dies mid-batch only
+# delays it.
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get("OUTBOX_RETRY_BASE_SECONDS", "2"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.environ.get("OUTBOX_RETRY_MAX_SECONDS", "300"))
+OUTBOX_MAX_WAIT_SECONDS = 60  # a running dispatcher waits this long for a retry, no longer
+OUTBOX_DRAIN_SECONDS = float(os.environ.get("OUTBOX_DRAIN_SECONDS", "10"))
+SERVERLESS = bool(os.environ.get("VERCEL"))
+
+_dispatching = False
+_kicked = False  # a request was queued while the dispatcher was busy
+_rpc_missing = False
+
+
+def _missing_function(e):
+    # PGRST202: function not found, outbox.sql hasn't been run yet
+    return getattr(e, "code", None) == "PGRST202"
+
+
+def retry_delay(attempts):
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** attempts, OUTBOX_RETRY_MAX_SECONDS)
+
+
+def create_blood_request(supabase, requester, blood_type, location, urgency, channel_id=None):
+    """
+    Saves a blood request for `requester` (a villingili_users row) and queues
+    its channel post. Returns the request row; raises if it wasn't saved.
+    """
+    global _rpc_missing
+    from .utils import format_blood_request_message
+    from .events import publish_request_event
+
+    channel_id = channel_id or os.environ.get("TELEGRAM_CHANNEL_ID")
+    request = {
+        "requester_id": requester["telegram_id"],
+        "blood_type": blood_type,
+        "location": location,
+        "urgency": urgency,
+        "is_active": True,
+    }
+    from .gazetteer import place_fields
+    request.update(place_fields(supabase, location))
+    post = None
+    if channel_id:
+        post = {
+            "chat_id": str(channel_id),
+            "text": format_blood_request_message(blood_type, location, urgency, requester.get("full_name"), requester.get("phone_number")),
+        }
+
+    row = None
+    if not _rpc_missing:
+        try:
+            row = supabase.rpc("villingili_create_request", {"p_request": request, "p_post": post}).execute().data
+        except Exception as e:
+            if not _missing_function(e):
+                raise
+            _rpc_missing = True
+            log.warning("villingili_create_request is not installed (run supabase/outbox.sql); posting without an outbox")
+    if row is None:
+        row = supabase.table("villingili_requests").insert(request).execute().data[0]
+
+    publish_request_event("request_created", {**row, "requester": {"full_name": requester.get("full_name"), "phone_number": requester.get("phone_number")}})
+    # Private alerts to compatible donors, High urgency first
+    from .donor_alerts import fan_out
+    fan_out(supabase, row)
+    if post:
+        if _rpc_missing:
+            _start(_post_without_outbox(supabase, {"request_id": row["id"], **post}))
+        else:
+            kick_dispatcher()
+    return row
+
+
+def _start(coro):
+    from .utils import run_in_background
+    try:
+        run_in_background(coro)
+    except RuntimeError:
+        # No event loop (scripts): /api/cron_outbox will post it
+        coro.close()
+
+
+def kick_dispatcher():
+    """Starts a background dispatcher unless this process already has one running."""
+    global _kicked
+    _kicked = True
+    if not _dispatching:
+        _start(dispatch_outbox(once=SERVERLESS))
+
+
+async def drain_outbox(timeout=OUTBOX_DRAIN_SECONDS):
+    """
+    Posts what's due if this process queued a post that hasn't gone out yet,
+    for at most `timeout` seconds. Returns the dispatch totals, or None.
+    """
+    if not _kicked:
+        return None
+    try:
+        return await asyncio.wait_for(dispatch_outbox(once=True), timeout)
+    except asyncio.TimeoutError:
+        log.warning("Outbox drain stopped after %ss; /api/cron_outbox posts the rest", timeout)
+        return None
+
+
+def _send_batch(jobs):
+    # One channel, so one post at a time; a 429 postpones the rest of the batch
+    from .utils import send_telegram_message
+    results = []
+    for i, job in enumerate(jobs):
+        sent = send_telegram_message(job["chat_id"], job["text"])
+        if sent and sent.get("ok"):
+            # MOCK_TELEGRAM has no message id
+            results.append({"id": job["id"], "message_id": (sent.get("result") or {}).get("message_id")})
+            continue
+        error = (sent or {}).get("description") or "no response from Telegram"
+        retry_after = ((sent or {}).get("parameters") or {}).get("retry_after")
+        if retry_after:
+            results.append({"id": job["id"], "error": error, "retry_in": retry_after})
+            results += [{"id": j["id"], "error": "postponed (rate limited)", "retry_in": retry_after, "attempted": False} for j in jobs[i + 1:]]
+            break
+        results.append({"id": job["id"], "error": error, "retry_in": retry_delay(job.get("attempts") or 0)})
+    return results
+
+
+async def dispatch_outbox(supabase=None, once=False):
+    """
+    Posts due outbox rows in batches until none are left (waiting for
+    retries due within OUTBOX_MAX_WAIT_SECONDS unless `once`).
+    Returns {"sent": n, "failed": n}.
+    """
+    global _dispatching, _kicked
+    from .utils import get_supabase_client
+    supabase = supabase or get_supabase_client()
+    totals = {"sent": 0, "failed": 0}
+    if not supabase or _dispatching or _rpc_missing:
+        return totals
+
+    _dispatching = True
+    retry_at = None
+    try:
+        while True:
+            _kicked = False
+            jobs = await asyncio.to_thread(_claim, supabase)
+            if not jobs:
+                if _kicked:
+                    continue
+                # Wait for the earliest retry if it's close, then go again
+                if once or retry_at is None or retry_at - time.monotonic() > OUTBOX_MAX_WAIT_SECONDS:
+                    break
+                await asyncio.sleep(max(retry_at - time.monotonic(), 0))
+                retry_at = None
+                continue
+            results = await asyncio.to_thread(_send_batch, jobs)
+            await asyncio.to_thread(_complete, supabase, results)
+            for r in results:
+                if "error" in r:
+                    totals["failed"] += 1
+                    retry_at = min(retry_at or float("inf"), time.monotonic() + r["retry_in"])
+                else:
+                    totals["sent"] += 1
+    except Exception as e:
+        log.error("Outbox dispatch failed: %s", e)
+    finally:
+        _dispatching = False
+    return totals
+
+
+def _claim(supabase):
+    res = supabase.rpc("villingili_outbox_claim", {"p_limit": OUTBOX_BATCH_SIZE, "p_lease_seconds": OUTBOX_LEASE_SECONDS}).execute()
+    return res.data or []
+
+
+def _complete(supabase, results):
+    supabase.rpc("villingili_outbox_complete", {"p_results": results, "p_max_attempts": OUTBOX_MAX_ATTEMPTS}).execute()
+    for r in results:
+        if "error" in r:
+            log.warning("Channel post %s failed: %s (retry in %ss)", r["id"], r["error"], r["retry_in"])
+
+
+async def _post_without_outbox(supabase, job):
+    # Before outbox.sql is installed: same retries, kept in memory only. On
+    # serverless only those that fit in OUTBOX_DRAIN_SECONDS; nothing is left
+    # for the cron to retry, so outbox.sql is needed there.
+    deadline = time.monotonic() + OUTBOX_DRAIN_SECONDS if SERVERLESS else float("inf")
+    for attempt in range(OUTBOX_MAX_ATTEMPTS):
+        result = (await asyncio.to_thread(_send_batch, [{"id": None, "attempts": attempt, **job}]))[0]
+        if "error" not in result:
+            if result["message_id"]:
+                await asyncio.to_thread(
+                    lambda: supabase.table("villingili_requests").update({"telegram_message_id": result["message_id"]}).eq("id", job["request_id"]).execute()
+                )
+            return
+        log.warning("Channel post for request %s failed: %s", job["request_id"], result["error"])
+        if time.monotonic() + result["retry_in"] > deadline:
+            break
+        await asyncio.sleep(result["retry_in"])
+    log.error("Channel post for request %s not sent (run supabase/outbox.sql so posts are retried)", job["request_id"])
+
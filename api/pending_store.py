@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .logs import get_logger
+
+log = get_logger("pending_store")
+
+# Short-lived admin scan sessions: a single-card scan whose ID number is
+# already registered stores the scanned fields here (ocr.offer_update) until
+# an admin presses force_update_ or cancel_update_. Entries expire after
+# PENDING_SCAN_TTL seconds and the in-process backend never holds more than
+# PENDING_SCAN_MAX entries.
+#
+# PENDING_SCAN_BACKEND:
+#   memory  - per process (default without REDIS_URL); a button press that
+#             lands on another instance gets "Session expired"
+#   localdb - table in the LocalDB SQLite file, shared by workers on one host
+#   redis   - any Redis-compatible server at REDIS_URL, shared by all instances
+#             (default when REDIS_URL is set; scripts/mock_redis_server.py is
+#             a local stand-in)
+#
+# A shared backend that can't be reached raises instead of falling back to
+# memory, which would bring back "Session expired" across instances.
+
+PENDING_SCAN_TTL = int(os.environ.get("PENDING_SCAN_TTL", "900"))
+PENDING_SCAN_MAX = int(os.environ.get("PENDING_SCAN_MAX", "1000"))
+
+
+class MemoryPendingStore:
+    def __init__(self, ttl=PENDING_SCAN_TTL, max_items=PENDING_SCAN_MAX):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            # Oldest first: insertion order == expiry order since TTL is fixed
+            if expires_at > now and len(self._data) <= self.max_items:
+                break
+            self._data.popitem(last=False)
+
+    def put(self, key, value):
+        with self._lock:
+            now = time.time()
+            self._data.pop(str(key), None)
+            self._data[str(key)] = (now + self.ttl, value)
+            self._evict(now)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(str(key))
+            if not item or item[0] <= time.time():
+                return None
+            return item[1]
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(str(key), None)
+            if not item or item[0] <= time.time():
+                return None
+            return item[1]
+
+    def __len__(self):
+        with self._lock:
+            self._evict(time.time())
+            return len(self._data)
+
+
+class LocalDBPendingStore:
+    TABLE = "villingili_pending_scans"
+
+    def __init__(self, db_path=None, ttl=PENDING_SCAN_TTL, max_items=PENDING_SCAN_MAX):
+        from .local_db import DB_PATH
+        self.db_path = db_path or DB_PATH
+        self.ttl = ttl
+        self.max_items = max_items
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_expires_at ON {self.TABLE}(expires_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def put(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.TABLE} WHERE expires_at <= ?", (now,))
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} (key, value, expires_at) VALUES (?, ?, ?)",
+                (str(key), json.dumps(value), now + self.ttl),
+            )
+            conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE key IN ("
+                f"SELECT key FROM {self.TABLE} ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_items,),
+            )
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value FROM {self.TABLE} WHERE key = ? AND expires_at > ?", (str(key), time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pop(self, key):
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock first so two workers can't both pop it
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT value FROM {self.TABLE} WHERE key = ? AND expires_at > ?", (str(key), time.time())
+            ).fetchone()
+            conn.execute(f"DELETE FROM {self.TABLE} WHERE key = ?", (str(key),))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+
+class RedisPendingStore:
+    def __init__(self, url=None, ttl=PENDING_SCAN_TTL, prefix="pending_scan:"):
+        import redis  # only this backend needs it
+        self.client = redis.Redis.from_url(url or os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0"))
+        self.client.ping()
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, key, value):
+        self.client.set(self.prefix + str(key), json.dumps(value), ex=self.ttl)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + str(key))
+        return json.loads(raw) if raw else None
+
+    def pop(self, key):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self.prefix + str(key))
+        pipe.delete(self.prefix + str(key))
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_pending_scan_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = (os.environ.get("PENDING_SCAN_BACKEND") or ("redis" if os.environ.get("REDIS_URL") else "memory")).lower()
+                # No quiet fallback to memory: a shared backend was asked for
+                # because sessions have to survive a hop between instances
+                try:
+                    if backend == "redis":
+                        _store = RedisPendingStore()
+                    elif backend == "localdb":
+                        _store = LocalDBPendingStore()
+                    else:
+                        _store = MemoryPendingStore()
+                except Exception as e:
+                    log.error("Pending scan backend '%s' unavailable: %s", backend, e)
+                    raise RuntimeError(f"Pending scan backend '{backend}' unavailable: {e}") from e
+    return _store
@@ -0,0 +1,103 @@
+import re
+
+# Deterministic parser for blood requests. Handles the common, well-formed
+# messages ("A+ IGMH urgent", "O neg ADK avahah") without an OpenAI round trip.
+# Anything it isn't sure about returns None so the caller can fall back to AI.
+
+BLOOD_TYPES = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
+
+# group letter followed by a sign word; "a"/"o" alone are too common in English,
+# so a sign is always required
+_BLOOD_RE = re.compile(
+    r"(?<![a-z0-9])(ab|a|b|o)\s*"
+    r"(\+\s*ve|-\s*ve|\+|-|positive|negative|pos|neg|plus|minus|\(\+\)|\(-\))"
+    r"(?![a-z0-9])"
+)
+_POSITIVE = {"+", "+ve", "positive", "pos", "plus", "(+)"}
+
+# Canonical location -> aliases (already normalized: lowercase, no punctuation)
+KNOWN_LOCATIONS = {
+    "IGMH": ["igmh", "indira gandhi", "indira gandhi memorial hospital", "igm hospital"],
+    "ADK": ["adk", "adk hospital"],
+    "Tree Top": ["tree top", "treetop", "tree top hospital"],
+    "Hulhumale Hospital": ["hulhumale hospital", "hulhumale hosp"],
+    "Senahiya": ["senahiya", "senahiya hospital"],
+    "Villimale Hospital": ["villimale hospital", "villingili hospital"],
+    "Siwad Hospital": ["siwad hospital", "siwad"],
+    "Hithadhoo Regional Hospital": ["hithadhoo hospital", "hithadhoo regional hospital", "addu hospital", "ehrh"],
+    "Kulhudhuffushi Regional Hospital": ["kulhudhuffushi hospital", "kulhudhuffushi regional hospital", "krh"],
+    # Bare "male" is usually the patient ("male patient"), so only "Male'",
+    # "Malé" (both become "maale") or "at/in male" count as the island
+    "Male'": ["maale", "at male", "in male", "male city"],
+    "Hulhumale'": ["hulhumale", "hulhumaale"],
+    "Villingili": ["villingili", "villimale", "vilimale"],
+    "Addu": ["addu", "addu city", "hithadhoo"],
+    "Fuvahmulah": ["fuvahmulah", "fuvamulah"],
+    "Kulhudhuffushi": ["kulhudhuffushi"],
+    "Thinadhoo": ["thinadhoo"],
+}
+
+# English + Latin Dhivehi
+URGENCY_WORDS = [
+    "urgent", "urgently", "emergency", "asap", "critical", "immediately", "quick", "quickly",
+    "avas", "avahah", "avahashah", "avahashakah", "vaguthun", "ehbarun", "haalu", "hamamiadhu",
+]
+
+# Words that carry no extra meaning in a request. Any other word (a place we
+# don't know, "not urgent", "no longer needed") goes to the AI. "today" and
+# "miadhu" are not urgent by themselves; "hama miadhu" (this very day) is.
+FILLER_WORDS = {
+    "need", "needs", "needed", "require", "required", "requires", "want", "looking", "for", "blood", "donor",
+    "donors", "please", "pls", "plz", "at", "in", "to", "the", "a", "an", "my", "is", "type", "group", "of",
+    "patient", "hospital", "help", "unit", "units", "bag", "bags", "one", "two", "1", "2", "3", "any", "with",
+    "le", "ley", "lei", "beynun", "beynunvejje", "ve", "veynu", "dheefaanee", "eh", "ekah", "kuriah", "dhw",
+    "hospitalah", "thibey", "thibi", "ge", "aai", "bodu", "now", "today", "miadhu", "male", "female",
+}
+
+_LOCATION_PATTERNS = sorted(
+    ((alias, canonical) for canonical, aliases in KNOWN_LOCATIONS.items() for alias in aliases),
+    key=lambda item: -len(item[0]),
+)
+
+
+def normalize_request_text(text: str) -> str:
+    text = (text or "").lower().strip()
+    text = text.replace("’", "'").replace("`", "'")
+    text = re.sub(r"(?<!\w)mal(?:e'|é)", "maale", text)
+    text = text.replace("'", "")
+    text = re.sub(r"[^\w\s+\-()]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _find_location(text: str):
+    for alias, canonical in _LOCATION_PATTERNS:
+        match = re.search(rf"(?<!\w){re.escape(alias)}(?!\w)", text)
+        if match:
+            return canonical, text[:match.start()] + " " + text[match.end():]
+    return None, text
+
+
+def parse_request_locally(text: str):
+    """Returns {"blood_type", "location", "urgency"} or None when not confident."""
+    norm = normalize_request_text(text)
+    if not norm:
+        return None
+
+    matches = list(_BLOOD_RE.finditer(norm))
+    found = {f"{m.group(1).upper()}{'+' if m.group(2).replace(' ', '') in _POSITIVE else '-'}" for m in matches}
+    if len(found) != 1:
+        return None
+    blood_type = found.pop()
+
+    rest = _BLOOD_RE.sub(" ", norm)
+    location, rest = _find_location(rest)
+
+    words = rest.split()
+    urgency = "High" if any(w in URGENCY_WORDS for w in words) or "hama miadhu" in rest else "Normal"
+
+    leftover = [w for w in words if w not in FILLER_WORDS and w not in URGENCY_WORDS and w not in ("hama",)]
+    if leftover:
+        return None
+
+    return {"blood_type": blood_type, "location": location, "urgency": urgency}
+
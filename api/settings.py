@@ -0,0 +1,58 @@
+import os
+
+# Admin dashboard settings page (rarely used; imported on first use).
+
+
+def get_settings():
+    return {
+        "TELEGRAM_BOT_TOKEN": os.environ.get("TELEGRAM_BOT_TOKEN"),
+        "TELEGRAM_CHANNEL_ID": os.environ.get("TELEGRAM_CHANNEL_ID"),
+        "ADMIN_GROUP_ID": os.environ.get("TELEGRAM_ADMIN_GROUP_ID"),
+        "SUPABASE_URL": os.environ.get("SUPABASE_URL"),
+        # Mask Key for security
+        "SUPABASE_KEY": "HIDDEN",
+    }
+
+
+def update_settings(data):
+    # Updates .env file crudely
+    env_path = os.path.join(os.getcwd(), ".env")
+
+    # Read existing
+    lines = []
+    if os.path.exists(env_path):
+        with open(env_path, "r") as f:
+            lines = f.readlines()
+
+    updates = {
+        "TELEGRAM_BOT_TOKEN": data.get("TELEGRAM_BOT_TOKEN"),
+        "TELEGRAM_CHANNEL_ID": data.get("TELEGRAM_CHANNEL_ID"),
+        "TELEGRAM_ADMIN_GROUP_ID": data.get("ADMIN_GROUP_ID"), # Map Frontend name to Env name
+        "SUPABASE_URL": data.get("SUPABASE_URL"),
+        "SUPABASE_SERVICE_ROLE_KEY": data.get("SUPABASE_KEY") # Settings calls it KEY but likely means Service Role if Admin
+    }
+
+    # We need to actully update lines or append
+    # This is a bit complex to do reliably in 10 lines, but basic approach:
+    new_lines = []
+    keys_handled = set()
+    for line in lines:
+        key = line.split("=")[0].strip()
+        if key in updates and updates[key]:
+            new_lines.append(f"{key}={updates[key]}\n")
+            keys_handled.add(key)
+        else:
+            new_lines.append(line)
+
+    for k, v in updates.items():
+        if k not in keys_handled and v:
+            new_lines.append(f"{k}={v}\n")
+
+    with open(env_path, "w") as f:
+        f.writelines(new_lines)
+
+    # Also update memory
+    for k, v in updates.items():
+        if v: os.environ[k] = v
+
+    return {"status": "ok", "message": "Settings Updated (Restart might be needed)"}
@@ -0,0 +1,308 @@
+import os
+import time
+import sqlite3
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .logs import get_logger
+from .changes import _parse_cursor
+
+log = get_logger("snapshot")
+
+# A local SQLite copy of users and active requests, for when Supabase is
+# down or slow.
+#
+# refresh_snapshot() applies the same delta as /api/changes (rows whose
+# updated_at moved, tombstoned deletes) to SNAPSHOT_DB_PATH, and reloads
+# everything every SNAPSHOT_FULL_SECONDS or when the delta can't be trusted. It runs from
+# /api/cron_snapshot and in the background after a read finds the copy older
+# than SNAPSHOT_REFRESH_SECONDS. The file holds names and phone numbers, so
+# it is readable by its owner only.
+#
+# On serverless, /tmp belongs to one instance and dies with it: a cron call
+# only refreshes the instance it lands on, and a cold instance has no copy
+# to fall back to. Background threads freeze between invocations, so there a
+# stale read only marks the copy wanted and the webhook refreshes it
+# (refresh_if_wanted) before its invocation ends. The fallback covers warm
+# instances that have refreshed at least once.
+#
+# read_through() runs a read against Supabase with SNAPSHOT_READ_TIMEOUT_SECONDS
+# to answer. An error, a timeout or a read slower than SNAPSHOT_SLOW_MS counts
+# as a failure; after SNAPSHOT_FAILURE_THRESHOLD failures in a row, reads go
+# straight to the snapshot for SNAPSHOT_COOLDOWN_SECONDS before Supabase is
+# tried again. The same query runs on either side (the snapshot is a LocalDB
+# with the same tables), and callers get the snapshot's age to show.
+
+SNAPSHOT_DB_PATH = os.environ.get("SNAPSHOT_DB_PATH", "/tmp/villingili_snapshot.db")
+SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_ENABLED", "true").lower() != "false"
+SNAPSHOT_REFRESH_SECONDS = float(os.environ.get("SNAPSHOT_REFRESH_SECONDS", "300"))
+SNAPSHOT_FULL_SECONDS = float(os.environ.get("SNAPSHOT_FULL_SECONDS", "21600"))
+SNAPSHOT_READ_TIMEOUT_SECONDS = float(os.environ.get("SNAPSHOT_READ_TIMEOUT_SECONDS", "4"))
+SNAPSHOT_SLOW_MS = float(os.environ.get("SNAPSHOT_SLOW_MS", "2000"))
+SNAPSHOT_FAILURE_THRESHOLD = int(os.environ.get("SNAPSHOT_FAILURE_THRESHOLD", "3"))
+SNAPSHOT_COOLDOWN_SECONDS = float(os.environ.get("SNAPSHOT_COOLDOWN_SECONDS", "30"))
+SERVERLESS = bool(os.environ.get("VERCEL"))
+PAGE_SIZE = 1000  # PostgREST's default max rows
+
+# name -> (table, key column, only rows matching this (column, value))
+SNAPSHOT_TABLES = {
+    "users": ("villingili_users", "telegram_id", None),
+    "requests": ("villingili_requests", "id", ("is_active", True)),
+}
+
+_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS villingili_snapshot_meta (
+    name TEXT PRIMARY KEY,
+    cursor TEXT,
+    full_at REAL,
+    synced_at REAL
+);
+"""
+
+_refresh_lock = threading.Lock()
+_breaker_lock = threading.Lock()
+_failures = 0
+_open_until = 0.0
+_refresh_wanted = False
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="snapshot-read")
+stats = {"primary": 0, "snapshot": 0, "failed": 0, "slow": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+class SnapshotUnavailable(Exception):
+    pass
+
+
+def _connect():
+    conn = sqlite3.connect(SNAPSHOT_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init():
+    from .local_db import init_local_schema
+    if not os.path.exists(SNAPSHOT_DB_PATH):
+        os.close(os.open(SNAPSHOT_DB_PATH, os.O_CREAT | os.O_WRONLY, 0o600))
+    os.chmod(SNAPSHOT_DB_PATH, 0o600)
+    init_local_schema(SNAPSHOT_DB_PATH)
+    conn = _connect()
+    try:
+        conn.executescript(_META_SCHEMA)
+    finally:
+        conn.close()
+
+
+def snapshot_age():
+    """Seconds since the last successful refresh of every table, or None if never."""
+    if not os.path.exists(SNAPSHOT_DB_PATH):
+        return None
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT name, synced_at FROM villingili_snapshot_meta").fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    synced = {r["name"]: r["synced_at"] for r in rows}
+    if any(not synced.get(name) for name in SNAPSHOT_TABLES):
+        return None
+    return max(0.0, time.time() - min(synced.values()))
+
+
+# --- refresh ---
+
+def refresh_snapshot(supabase=None, full=False):
+    """Brings the snapshot up to date; returns {name: rows written} (skips if one is running)."""
+    if not _refresh_lock.acquire(blocking=False):
+        return {}
+    try:
+        from .utils import get_supabase_client
+        supabase = supabase or get_supabase_client()
+        _init()
+        return {name: _refresh_table(supabase, name, full) for name in SNAPSHOT_TABLES}
+    except Exception as e:
+        stats["refresh_errors"] += 1
+        log.error("Snapshot refresh failed: %s", e)
+        raise
+    finally:
+        _refresh_lock.release()
+
+
+def _refresh_table(supabase, name, full):
+    table, key, only = SNAPSHOT_TABLES[name]
+    conn = _connect()
+    try:
+        meta = conn.execute("SELECT cursor, full_at FROM villingili_snapshot_meta WHERE name = ?", (name,)).fetchone()
+        cursor, full_at = (meta["cursor"], meta["full_at"]) if meta else (None, None)
+        written = None
+        if not full and cursor and full_at and time.time() - full_at < SNAPSHOT_FULL_SECONDS:
+            try:
+                written, cursor = _incremental(supabase, conn, name, cursor)
+            except Exception as e:
+                # e.g. changes.sql not applied yet: reload instead
+                log.warning("Incremental snapshot of %s failed (%s); reloading it", table, e)
+        if written is None:
+            written, cursor = _full_load(supabase, conn, table, key, only)
+            full_at = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO villingili_snapshot_meta (name, cursor, full_at, synced_at) VALUES (?, ?, ?, ?)",
+            (name, cursor, full_at, time.time()),
+        )
+        conn.commit()
+        stats["refreshes"] += 1
+        return written
+    finally:
+        conn.close()
+
+
+def _store(conn, table, rows):
+    from .local_db import _table_columns, _set_clause
+    columns = _table_columns(conn.cursor(), SNAPSHOT_DB_PATH, table)
+    for row in rows:
+        keys, values = _set_clause({k: v for k, v in row.items() if k in columns})
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})", values)
+
+
+def _delete(conn, table, key, ids):
+    if ids:
+        # Tombstone row_ids are text; CAST lets them match integer keys too
+        conn.execute(f"DELETE FROM {table} WHERE CAST({key} AS TEXT) IN ({', '.join('?' * len(ids))})", [str(i) for i in ids])
+
+
+def _full_load(supabase, conn, table, key, only):
+    # Pages in key order, then swaps the table's contents in one transaction
+    rows, last = [], None
+    while True:
+        q = supabase.table(table).select("*").order(key).limit(PAGE_SIZE)
+        if only:
+            q = q.eq(*only)
+        if last is not None:
+            q = q.gt(key, last)
+        page = q.execute().data or []
+        rows += page
+        if len(page) < PAGE_SIZE:
+            break
+        last = page[-1][key]
+    conn.execute(f"DELETE FROM {table}")
+    _store(conn, table, rows)
+    stamps = [r["updated_at"] for r in rows if r.get("updated_at")]
+    return len(rows), max(stamps, key=_parse_cursor) if stamps else _utc_now()
+
+
+def _incremental(supabase, conn, name, cursor):
+    # Same delta as /api/changes; None (reload) when it's too big or too old to trust
+    from .changes import get_changes
+    table, key, only = SNAPSHOT_TABLES[name]
+    delta = get_changes(supabase, [name], cursor)
+    rows = delta[name]
+    if delta["full"] or len(rows) >= PAGE_SIZE:
+        return None, cursor
+    # Requests that closed leave the snapshot like deleted ones
+    gone = [r[key] for r in rows if only and r.get(only[0]) != only[1]]
+    _store(conn, table, [r for r in rows if not only or r.get(only[0]) == only[1]])
+    _delete(conn, table, key, gone + delta["deleted"][name])
+    return len(rows) + len(delta["deleted"][name]), delta["cursor"] or cursor
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _refresh_in_background():
+    global _refresh_wanted
+    if SERVERLESS:
+        _refresh_wanted = True
+        return
+    threading.Thread(target=_refresh_quietly, name="snapshot-refresh", daemon=True).start()
+
+
+def refresh_if_wanted():
+    """Runs the refresh a read asked for since the last call (serverless)."""
+    global _refresh_wanted
+    if _refresh_wanted:
+        _refresh_wanted = False
+        _refresh_quietly()
+
+
+def _refresh_quietly():
+    try:
+        refresh_snapshot()
+    except Exception:
+        pass  # logged by refresh_snapshot
+
+
+# --- reads ---
+
+def _breaker_open():
+    with _breaker_lock:
+        return time.monotonic() < _open_until
+
+
+def _record(ok):
+    global _failures, _open_until
+    with _breaker_lock:
+        if ok:
+            _failures = 0
+            return
+        _failures += 1
+        if _failures >= SNAPSHOT_FAILURE_THRESHOLD:
+            _open_until = time.monotonic() + SNAPSHOT_COOLDOWN_SECONDS
+            _failures = 0
+            log.warning("Supabase reads failing or slow; using the local snapshot for %ss", SNAPSHOT_COOLDOWN_SECONDS)
+
+
+def read_through(supabase, read):
+    """
+    Returns (read(supabase), None), or (read(snapshot), age in seconds) when
+    Supabase is failing or slow. Raises the Supabase error if there is no
+    snapshot to fall back to.
+    """
+    from .local_db import LocalDB
+    if not SNAPSHOT_ENABLED or isinstance(supabase, LocalDB):
+        return read(supabase), None
+
+    error = None
+    if not _breaker_open():
+        started = time.monotonic()
+        future = _pool.submit(read, supabase)
+        try:
+            data = future.result(timeout=SNAPSHOT_READ_TIMEOUT_SECONDS)
+            slow = (time.monotonic() - started) * 1000 > SNAPSHOT_SLOW_MS
+            if slow:
+                stats["slow"] += 1
+            _record(not slow)
+            stats["primary"] += 1
+            age = snapshot_age()
+            if age is None or age > SNAPSHOT_REFRESH_SECONDS:
+                _refresh_in_background()
+            return data, None
+        except FutureTimeout as e:
+            error = e
+            log.warning("Supabase read timed out after %ss; trying the local snapshot", SNAPSHOT_READ_TIMEOUT_SECONDS)
+        except Exception as e:
+            error = e
+            log.warning("Supabase read failed (%s); trying the local snapshot", e)
+        stats["failed"] += 1
+        _record(False)
+
+    age = snapshot_age()
+    if age is None:
+        if error is None:
+            # Breaker open but nothing to fall back to: try Supabase anyway
+            return read(supabase), None
+        raise SnapshotUnavailable(f"Supabase read failed and there is no local snapshot: {error}") from error
+    stats["snapshot"] += 1
+    return read(LocalDB(SNAPSHOT_DB_PATH)), age
+
+
+def stale_note(age):
+    """A line to add to a reply built from the snapshot ('' for live data)."""
+    if age is None:
+        return ""
+    if age < 90:
+        ago = f"{int(age)}s"
+    elif age < 5400:
+        ago = f"{int(age // 60)} min"
+    else:
+        ago = f"{age / 3600:.1f} h"
+    return f"\n\n⚠️ <i>Database slow or unreachable: showing the offline copy from {ago} ago.</i>"
@@ -0,0 +1,160 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+from .logs import get_logger
+
+log = get_logger("static")
+
+# Frontend bundle serving.
+#
+# The dist directory and the file manifest (sizes, ETags, precompressed
+# .br/.gz siblings written by scripts/compress_static.py) are resolved once,
+# on the first request. Vite's content-hashed files are cached by browsers
+# for a year; everything else, index.html included, is revalidated with an
+# ETag. index.html is kept in memory (plus a gzipped copy).
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=0, must-revalidate"
+# index-BqL29Amd.js, index-5LQIfRZC.css ...
+_HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def resolve_dist_dir():
+    # Robustly find dist_dir (api/static)
+    candidates = [
+        os.path.join(base_dir, "static"),
+        os.path.join(os.getcwd(), "api", "static"),
+        os.path.join(base_dir, "..", "api", "static"),
+        os.path.join(base_dir, "..", "frontend", "dist"),
+        os.path.join(os.getcwd(), "frontend", "dist"),
+    ]
+    for d in candidates:
+        if os.path.isdir(d) and (os.path.exists(os.path.join(d, "index.html")) or os.path.exists(os.path.join(d, "favicon.png"))):
+            log.info("Server: Found static dir at %s", d)
+            return os.path.abspath(d)
+    return os.path.join(base_dir, "static")  # Default
+
+
+_dist_dir = None
+
+def get_dist_dir():
+    global _dist_dir
+    if _dist_dir is None:
+        _dist_dir = resolve_dist_dir()
+    return _dist_dir
+
+
+class StaticEntry:
+    def __init__(self, rel_path, abs_path):
+        st = os.stat(abs_path)
+        self.path = abs_path
+        self.media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        self.etag = f'"{st.st_size:x}-{int(st.st_mtime_ns):x}"'
+        self.immutable = rel_path.startswith("assets/") and bool(_HASHED_NAME.search(rel_path))
+        # encoding -> path of the precompressed variant
+        self.variants = {enc: abs_path + ext for enc, ext in _ENCODINGS if os.path.isfile(abs_path + ext)}
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+_index = None  # (body, gzipped body, etag)
+
+
+def _build_manifest(dist_dir):
+    manifest = {}
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            if name.endswith((".gz", ".br")):
+                continue
+            abs_path = os.path.join(root, name)
+            rel_path = os.path.relpath(abs_path, dist_dir).replace(os.sep, "/")
+            manifest[rel_path] = StaticEntry(rel_path, abs_path)
+    return manifest
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                dist_dir = get_dist_dir()
+                _manifest = _build_manifest(dist_dir) if os.path.isdir(dist_dir) else {}
+    return _manifest
+
+
+def _load_index():
+    global _index
+    if _index is None:
+        entry = get_manifest().get("index.html")
+        if not entry:
+            return None
+        with open(entry.path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        _index = (body, gzip.compress(body, 9), etag)
+    return _index
+
+
+def _accepts(request: Request, encoding):
+    # "br;q=0" refuses br; "*" covers encodings not listed by name
+    qualities = {}
+    for part in request.headers.get("accept-encoding", "").lower().split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name.strip():
+            qualities[name.strip()] = q
+    return qualities.get(encoding, qualities.get("*", 0.0)) > 0
+
+
+def _not_modified(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    return bool(header) and etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+
+def serve_index(request: Request):
+    index = _load_index()
+    if not index:
+        return JSONResponse({"error": "Frontend Not Found", "dist_dir": get_dist_dir()}, status_code=404)
+    body, gz_body, etag = index
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE, "Vary": "Accept-Encoding"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    if _accepts(request, "gzip"):
+        headers["Content-Encoding"] = "gzip"
+        body = gz_body
+    return Response(body, media_type="text/html", headers=headers)
+
+
+def serve_static(request: Request, rel_path: str):
+    """Serves a file from the manifest, or None if it isn't part of the build."""
+    entry = get_manifest().get(rel_path.lstrip("/"))
+    if not entry:
+        return None
+    if rel_path.lstrip("/") == "index.html":
+        return serve_index(request)
+    headers = {"ETag": entry.etag, "Cache-Control": IMMUTABLE_CACHE if entry.immutable else REVALIDATE_CACHE}
+    if entry.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if _not_modified(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    for encoding, variant in entry.variants.items():
+        if _accepts(request, encoding):
+            headers["Content-Encoding"] = encoding
+            return FileResponse(variant, media_type=entry.media_type, headers=headers)
+    return FileResponse(entry.path, media_type=entry.media_type, headers=headers)
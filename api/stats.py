@@ -0,0 +1,117 @@
+import datetime
+
+from .logs import get_logger
+
+log = get_logger("stats")
+
+# Aggregates for the dashboard (/api/stats).
+#
+# Postgres keeps two small tables up to date from triggers on every write
+# (supabase/stats.sql; LocalDB has the same triggers): users counted by blood
+# type, status and last donation date, and requests by creation day and
+# state. get_stats() reads both in one RPC, so the dashboard never pulls the
+# users or requests tables to count them. recompute_stats() rebuilds the
+# tables from scratch, e.g. after a bulk import that bypassed the triggers.
+
+STATS_MAX_DAYS = 366
+
+_rpc_missing = False
+
+
+def _missing_function(e):
+    # PGRST202: function not found, stats.sql hasn't been run yet
+    return getattr(e, "code", None) == "PGRST202"
+
+
+def _cutoff():
+    from .donor_alerts import DONOR_COOLDOWN_DAYS
+    return (datetime.date.today() - datetime.timedelta(days=DONOR_COOLDOWN_DAYS)).isoformat()
+
+
+def get_stats(supabase, days=30):
+    """
+    Donor counts by blood type/status (with how many are past their donation
+    cooldown) and request counts per creation day for the last `days` days.
+    """
+    global _rpc_missing
+    days = max(1, min(int(days), STATS_MAX_DAYS))
+    since = datetime.date.today() - datetime.timedelta(days=days - 1)
+    cutoff = _cutoff()
+
+    data = None
+    if not _rpc_missing:
+        try:
+            data = supabase.rpc("villingili_stats", {"p_cutoff": cutoff, "p_since": since.isoformat()}).execute().data
+        except Exception as e:
+            if not _missing_function(e):
+                raise
+            _rpc_missing = True
+            log.warning("villingili_stats is not installed (run supabase/stats.sql); counting from the tables")
+    if data is None:
+        data = _stats_from_tables(supabase, cutoff, since)
+    return summarize(data, since, days)
+
+
+def recompute_stats(supabase):
+    """Rebuilds the counter tables from the users and requests tables."""
+    return supabase.rpc("villingili_recompute_stats", {}).execute().data
+
+
+def summarize(data, since, days):
+    donors = [{**d, "total": int(d["total"]), "eligible": int(d["eligible"])} for d in data.get("donors") or []]
+    by_type = {}
+    for d in donors:
+        t = by_type.setdefault(d["blood_type"] or "Unknown", {"blood_type": d["blood_type"] or "Unknown", "total": 0, "active": 0, "eligible": 0})
+        t["total"] += d["total"]
+        if d["status"] == "active":
+            t["active"] += d["total"]
+            t["eligible"] += d["eligible"]
+
+    # One row per day, including days without requests
+    per_day = {str(r["day"])[:10]: r for r in data.get("requests") or []}
+    request_days = []
+    for i in range(days):
+        day = (since + datetime.timedelta(days=i)).isoformat()
+        r = per_day.get(day) or {}
+        request_days.append({"day": day, **{k: int(r.get(k) or 0) for k in ("created", "open", "fulfilled", "expired")}})
+
+    from .donor_alerts import DONOR_COOLDOWN_DAYS
+    return {
+        "cooldown_days": DONOR_COOLDOWN_DAYS,
+        "donors": {
+            "by_type": sorted(by_type.values(), key=lambda t: t["blood_type"]),
+            "groups": donors,
+        },
+        "requests": {
+            "days": request_days,
+            "totals": {k: sum(d[k] for d in request_days) for k in ("created", "open", "fulfilled", "expired")},
+        },
+    }
+
+
+def _stats_from_tables(supabase, cutoff, since):
+    # Before stats.sql: the same numbers the slow way, from full table reads
+    from collections import Counter
+    users = supabase.table("villingili_users").select("blood_type, status, last_donation_date").execute().data or []
+    totals, eligible = Counter(), Counter()
+    for u in users:
+        key = (u.get("blood_type") or "", u.get("status") or "")
+        totals[key] += 1
+        last = str(u.get("last_donation_date") or "")[:10]
+        if not last or last < cutoff:
+            eligible[key] += 1
+    donors = [{"blood_type": k[0], "status": k[1], "total": n, "eligible": eligible[k]} for k, n in sorted(totals.items())]
+
+    reqs = supabase.table("villingili_requests").select("created_at, is_active, donors_found")\
+        .gte("created_at", since.isoformat()).execute().data or []
+    days = {}
+    for r in reqs:
+        day = days.setdefault(str(r.get("created_at"))[:10], {"day": str(r.get("created_at"))[:10], "created": 0, "open": 0, "fulfilled": 0, "expired": 0})
+        day["created"] += 1
+        if (r.get("donors_found") or 0) > 0:
+            day["fulfilled"] += 1
+        elif r.get("is_active") in (False, 0):
+            day["expired"] += 1
+        else:
+            day["open"] += 1
+    return {"donors": donors, "requests": list(days.values())}
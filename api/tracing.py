@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from .logs import get_logger
+
+log = get_logger("tracing")
+
+# Lightweight tracing for process_update.
+#
+# Every update gets a trace id; DB queries, Telegram calls and AI calls made
+# while handling it become spans (nested when one runs inside another).
+# Traces slower than TRACE_SLOW_MS are kept in a ring buffer, shown in the
+# dashboard (/api/traces/slow), and appended to an NDJSON file.
+# Outside an update (dashboard endpoints, scripts) span() is a no-op.
+
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "2000"))
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "50"))
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH", "slow_traces.ndjson")  # "" disables the file
+TRACE_MAX_SPANS = 500  # a runaway loop shouldn't grow a trace without bound
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+SLOW_TRACES = deque(maxlen=TRACE_BUFFER_SIZE)
+_file_lock = threading.Lock()
+_file_failed = False
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self.finished = False
+
+    def add(self, span):
+        # Background work scheduled by the update can outlive it; not part of it
+        if self.finished:
+            return
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(span)
+
+    def to_dict(self, duration_ms, error):
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 1),
+            "error": error,
+            "attrs": self.attrs,
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            "dropped_spans": self.dropped,
+        }
+
+
+def _span_record(trace, name, start, end, parent, attrs, error=None):
+    return {
+        "id": uuid.uuid4().hex[:8],
+        "parent": parent,
+        "name": name,
+        "start_ms": round((start - trace.start) * 1000, 1),
+        "duration_ms": round((end - start) * 1000, 1),
+        "error": error,
+        **attrs,
+    }
+
+
+@contextmanager
+def span(name, **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    start = time.perf_counter()
+    record = _span_record(trace, name, start, start, _current_span.get(), attrs)
+    token = _current_span.set(record["id"])
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        trace.add(record)
+
+
+def record_span(name, start, end, error=None, **attrs):
+    """Adds an already finished span (for callbacks that only see the end, like httpx hooks)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(_span_record(trace, name, start, end, _current_span.get(), attrs, error))
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.id if trace else None
+
+
+def _keep_slow(trace_dict):
+    global _file_failed
+    SLOW_TRACES.append(trace_dict)
+    log.warning("Slow update %s %sms (trace %s)", trace_dict['name'], trace_dict['duration_ms'], trace_dict['trace_id'])
+    if not TRACE_LOG_PATH or _file_failed:
+        return
+    try:
+        with _file_lock, open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace_dict, default=str) + "\n")
+    except OSError as e:
+        # e.g. read-only filesystem on serverless; the ring buffer still works
+        _file_failed = True
+        log.warning("Tracing: can't write %s: %s", TRACE_LOG_PATH, e)
+
+
+def trace_update(handler):
+    """Wraps process_update(data) in a trace."""
+    async def wrapper(data):
+        from .metrics import update_flow
+        trace = Trace(update_flow(data), {"update_id": data.get("update_id")})
+        token = _current_trace.set(trace)
+        span_token = _current_span.set(None)
+        error = None
+        try:
+            return await handler(data)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(token)
+            trace.finished = True
+            duration_ms = (time.perf_counter() - trace.start) * 1000
+            if duration_ms >= TRACE_SLOW_MS:
+                _keep_slow(trace.to_dict(duration_ms, error))
+
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+
+def get_slow_traces(limit=20):
+    return list(reversed(SLOW_TRACES))[:limit]
+
+
+def trace_supabase(client):
+    # PostgREST round trips as spans: start on request, record on response
+    try:
+        session = client.postgrest.session
+    except Exception:
+        return
+
+    def on_request(request):
+        request.extensions["trace_start"] = time.perf_counter()
+
+    def on_response(response):
+        request = response.request
+        start = request.extensions.get("trace_start")
+        if start is None:
+            return
+        record_span(
+            "db",
+            start,
+            time.perf_counter(),
+            error=f"HTTP {response.status_code}" if response.status_code >= 400 else None,
+            target=f"{request.method} {request.url.path.rsplit('/', 1)[-1]}",
+        )
+
+    session.event_hooks["request"].append(on_request)
+    session.event_hooks["response"].append(on_response)
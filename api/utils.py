@@ -1,9 +1,128 @@
 import os
-import json
-from supabase import create_client, Client
-from openai import OpenAI
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
 
 from .local_db import LocalDB
+from .metrics import count_call, instrument_supabase
+from .tracing import span, trace_supabase
+from .request_parser import normalize_request_text, parse_request_locally
+from .logs import get_logger
+
+log = get_logger("utils")
+reply_log = get_logger("bot_replies")
+
+
+class LRUCache:
+    # Shared with worker threads (to_thread parses, scans), hence the lock
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# Keep references so fire-and-forget tasks aren't garbage collected mid-run
+_BACKGROUND_TASKS = set()
+
+def run_in_background(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+async def drain_background(timeout):
+    """
+    Waits for run_in_background tasks (and any they start) for up to `timeout`
+    seconds, then cancels what's left. Serverless instances freeze once an
+    invocation ends, so the webhook calls this before it finishes. Returns
+    how many tasks were cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    current = asyncio.current_task()
+    while True:
+        pending = {t for t in _BACKGROUND_TASKS if t is not current and not t.done()}
+        remaining = deadline - loop.time()
+        if not pending:
+            return 0
+        if remaining <= 0:
+            break
+        await asyncio.wait(pending, timeout=remaining)
+    for task in pending:
+        task.cancel()
+    await asyncio.wait(pending, timeout=2)
+    log.warning("Cancelled %d background tasks still running after %.1fs", len(pending), timeout)
+    return len(pending)
+
+
+def missing_table(e):
+    """Whether a query failed because its table doesn't exist (its .sql file hasn't been run)."""
+    # PGRST205: not in PostgREST's schema cache; 42P01: Postgres; the rest: LocalDB
+    return getattr(e, "code", None) in ("PGRST205", "42P01") or "no such table" in str(e)
+
+
+# Serverless: what a call finishes after its response (drains, the event log
+# flush) shares one deadline, INVOCATION_BUDGET_SECONDS after the request
+# came in; keep it under maxDuration in vercel.json
+INVOCATION_BUDGET_SECONDS = float(os.environ.get("INVOCATION_BUDGET_SECONDS", "50"))
+_invocation_deadline = contextvars.ContextVar("invocation_deadline", default=None)
+
+
+def start_invocation():
+    _invocation_deadline.set(time.monotonic() + INVOCATION_BUDGET_SECONDS)
+
+
+def invocation_time_left(reserve=0.0):
+    """Seconds left before the request's deadline, keeping `reserve` for later steps."""
+    deadline = _invocation_deadline.get()
+    if deadline is None:
+        deadline = time.monotonic() + INVOCATION_BUDGET_SECONDS
+    return max(0.0, deadline - time.monotonic() - reserve)
+
+
+# Normalized request text -> parsed result (local or AI)
+PARSE_CACHE = LRUCache(int(os.environ.get("PARSE_CACHE_SIZE", "512")))
+
+# Bot API base URL; point it at scripts/mock_telegram_server.py to run offline
+TELEGRAM_API_BASE = os.environ.get("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+
+
+def telegram_api_url(token, method):
+    return f"{TELEGRAM_API_BASE}/bot{token}/{method}"
+
+
+def telegram_file_url(token, file_path):
+    return f"{TELEGRAM_API_BASE}/file/bot{token}/{file_path}"
+
 
 def get_supabase_client():
     url = os.environ.get("SUPABASE_URL")
@@ -14,20 +133,32 @@ def get_supabase_client():
     # Simple check: if we have keys and it's not the default placeholder
     if url and key and "localhost:8000" not in url:
         try:
-            return create_client(url, key)
+            from supabase import create_client  # heavy; only when Supabase is configured
+            client = create_client(url, key)
+            instrument_supabase(client)
+            trace_supabase(client)
+            return client
         except Exception as e:
-            print(f"Supabase Connection Failed: {e}, falling back to LocalDB")
+            log.warning("Supabase Connection Failed: %s, falling back to LocalDB", e)
             
     return LocalDB()
 
 def parse_request_with_ai(text: str):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        print("Warning: OpenAI API key missing.")
-        return None
-    
-    client = OpenAI(api_key=api_key)
-    
+    # 1. Repeats of a message we've already parsed
+    cache_key = normalize_request_text(text)
+    cached = PARSE_CACHE.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    # 2. Confident local parse (no network)
+    parsed = parse_request_locally(text)
+    if parsed:
+        PARSE_CACHE.put(cache_key, parsed)
+        return dict(parsed)
+
+    # 3. Ambiguous - ask the model
+    from .ai_gateway import chat_json
+
     system_prompt = """
     You are an expert entity extractor for a Maldivian blood donation system.
     Extract the following fields from the user input:
@@ -39,20 +170,18 @@ def parse_request_with_ai(text: str):
     Return ONLY a JSON object: {"blood_type": "...", "location": "...", "urgency": "..."}
     """
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            response_format={"type": "json_object"}
-        )
-        content = response.choices[0].message.content
-        return json.loads(content)
-    except Exception as e:
-        print(f"Error parsing with AI: {e}")
-        return None
+    parsed = chat_json(
+        "parse_request",
+        "gpt-4o-mini",
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ],
+    )
+    if isinstance(parsed, dict):
+        PARSE_CACHE.put(cache_key, parsed)
+        return dict(parsed)
+    return parsed
 
 def send_telegram_message(chat_id: int, text: str, reply_markup=None):
     # This function will rely on the bot token in env
@@ -61,18 +190,15 @@ def send_telegram_message(chat_id: int, text: str, reply_markup=None):
     
     # Mock Mode Check
     if os.environ.get("MOCK_TELEGRAM") == "true" or not token:
-        msg_log = f"\n[BOT REPLIED] Chat: {chat_id}\nMessage: {text}\nKB: {reply_markup}\n{'-'*30}\n"
-        print(msg_log, flush=True)
-        # Also write to a file for easier reading
-        with open("bot_replies.log", "a", encoding="utf-8") as f:
-            f.write(msg_log)
+        # Console + BOT_REPLY_LOG (bot_replies.log), written in batches by the log thread
+        reply_log.info("\n[BOT REPLIED] Chat: %s\nMessage: %s\nKB: %s\n%s\n", chat_id, text, reply_markup, "-" * 30)
         return {"ok": True}
 
     if not token:
-        print("Warning: Telegram Bot Token missing.")
+        log.warning("Telegram Bot Token missing.")
         return None
         
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = telegram_api_url(token, "sendMessage")
     payload = {
         "chat_id": chat_id,
         "text": text,
@@ -82,10 +208,13 @@ def send_telegram_message(chat_id: int, text: str, reply_markup=None):
         payload["reply_markup"] = reply_markup
         
     try:
-        response = requests.post(url, json=payload)
+        with span("telegram", method="sendMessage"):
+            response = requests.post(url, json=payload)
+        count_call("telegram", "sendMessage", not response.ok)
         return response.json()
     except Exception as e:
-        print(f"Error sending Telegram message: {e}")
+        count_call("telegram", "sendMessage", True)
+        log.error("Error sending Telegram message: %s", e)
         return None
 
 def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup=None):
@@ -94,7 +223,7 @@ def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup
     if not token:
         return None
         
-    url = f"https://api.telegram.org/bot{token}/editMessageText"
+    url = telegram_api_url(token, "editMessageText")
     payload = {
         "chat_id": chat_id,
         "message_id": message_id,
@@ -105,10 +234,13 @@ def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup
         payload["reply_markup"] = reply_markup
         
     try:
-        response = requests.post(url, json=payload)
+        with span("telegram", method="editMessageText"):
+            response = requests.post(url, json=payload)
+        count_call("telegram", "editMessageText", not response.ok)
         return response.json()
     except Exception as e:
-        print(f"Error editing Telegram message: {e}")
+        count_call("telegram", "editMessageText", True)
+        log.error("Error editing Telegram message: %s", e)
         return None
 
 def answer_callback_query(callback_query_id: str, text: str = None, show_alert: bool = False, url: str = None):
@@ -117,7 +249,7 @@ def answer_callback_query(callback_query_id: str, text: str = None, show_alert:
     if not token:
         return None
         
-    url_api = f"https://api.telegram.org/bot{token}/answerCallbackQuery"
+    url_api = telegram_api_url(token, "answerCallbackQuery")
     payload = {"callback_query_id": callback_query_id}
     if text:
         payload["text"] = text
@@ -126,9 +258,12 @@ def answer_callback_query(callback_query_id: str, text: str = None, show_alert:
         payload["url"] = url
         
     try:
-        requests.post(url_api, json=payload)
+        with span("telegram", method="answerCallbackQuery"):
+            response = requests.post(url_api, json=payload)
+        count_call("telegram", "answerCallbackQuery", not response.ok)
     except Exception as e:
-        print(f"Error answering callback: {e}")
+        count_call("telegram", "answerCallbackQuery", True)
+        log.error("Error answering callback: %s", e)
 
 
 def check_and_prompt_missing_info(user_id: int, user_data: dict):
@@ -183,9 +318,8 @@ def check_and_prompt_missing_info(user_id: int, user_data: dict):
     send_telegram_message(user_id, msg_text, reply_markup=keyboard)
 
 def analyze_id_card_with_ai(image_url: str):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    
+    from .ai_gateway import chat_json
+
     prompt = """
     Analyze this image carefully. It MUST be a "Maldives National Identity Card".
     
@@ -214,24 +348,20 @@ def analyze_id_card_with_ai(image_url: str):
     }
     """
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": image_url}}
-                    ],
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
-        print(f"AI Vision Error: {e}")
-        return None
+    return chat_json(
+        "id_card",
+        "gpt-4o",
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ],
+            }
+        ],
+        timeout=float(os.environ.get("AI_VISION_TIMEOUT_SECONDS", "30")),
+    )
 
 def format_blood_request_message(blood_type, location, urgency, req_name, req_phone):
     lines = [f"🚨 <b>BLOOD REQUEST</b>", f"Type: {blood_type}"]
@@ -26,6 +26,27 @@ export function RequestTable() {
 
     useEffect(() => {
         fetchRequests()
+
+        // Live feed: new requests, expiries and donor counts pushed by the server.
+        // EventSource reconnects on its own and resumes from the last event id.
+        const token = localStorage.getItem('access_token')
+        if (!token || typeof EventSource === 'undefined') return
+        const source = new EventSource(`/api/requests/stream?token=${encodeURIComponent(token)}`)
+
+        source.addEventListener('request_created', (e) => {
+            const req = JSON.parse(e.data)
+            setData(prev => [req, ...prev.filter(r => r.id !== req.id)])
+        })
+        const applyPatch = (e) => {
+            const patch = JSON.parse(e.data)
+            setData(prev => prev.map(r => (r.id === patch.id ? { ...r, ...patch } : r)))
+        }
+        source.addEventListener('request_expired', applyPatch)
+        source.addEventListener('donor_found', applyPatch)
+        // Server couldn't replay what we missed: reload once, then keep streaming
+        source.addEventListener('reset', () => fetchRequests())
+
+        return () => source.close()
     }, [])
 
     const fetchRequests = async () => {
@@ -1,4 +1,4 @@
-import { LogOut, Users, Activity, Settings as SettingsIcon } from 'lucide-react'
+import { LogOut, Users, Activity, BarChart3, Timer, Settings as SettingsIcon } from 'lucide-react'
 import { Button } from "@/components/ui/button"
 
 export function Sidebar({
@@ -37,6 +37,24 @@ export function Sidebar({
                     <Activity className={`w-5 h-5 ${mobile || !isCollapsed ? 'mr-2' : ''}`} />
                     {(mobile || !isCollapsed) && <span>Live Feed</span>}
                 </Button>
+                <Button
+                    variant={activeTab === 'stats' ? "secondary" : "ghost"}
+                    className={`w-full justify-start ${!mobile && isCollapsed ? 'px-2 justify-center' : ''}`}
+                    onClick={() => { setActiveTab('stats'); if (mobile) setIsSidebarOpen(false); }}
+                    title="Statistics"
+                >
+                    <BarChart3 className={`w-5 h-5 ${mobile || !isCollapsed ? 'mr-2' : ''}`} />
+                    {(mobile || !isCollapsed) && <span>Statistics</span>}
+                </Button>
+                <Button
+                    variant={activeTab === 'traces' ? "secondary" : "ghost"}
+                    className={`w-full justify-start ${!mobile && isCollapsed ? 'px-2 justify-center' : ''}`}
+                    onClick={() => { setActiveTab('traces'); if (mobile) setIsSidebarOpen(false); }}
+                    title="Slow Updates"
+                >
+                    <Timer className={`w-5 h-5 ${mobile || !isCollapsed ? 'mr-2' : ''}`} />
+                    {(mobile || !isCollapsed) && <span>Slow Updates</span>}
+                </Button>
                 <Button
                     variant={activeTab === 'settings' ? "secondary" : "ghost"}
                     className={`w-full justify-start ${!mobile && isCollapsed ? 'px-2 justify-center' : ''}`}
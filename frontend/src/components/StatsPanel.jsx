@@ -0,0 +1,125 @@
+import { useState, useEffect } from 'react'
+import { fetchWithAuth } from '@/lib/auth'
+import { RefreshCw } from 'lucide-react'
+import { Button } from "@/components/ui/button"
+import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
+import {
+    Table,
+    TableBody,
+    TableCell,
+    TableHead,
+    TableHeader,
+    TableRow,
+} from "@/components/ui/table"
+import { format, parseISO } from "date-fns"
+
+const DAY_OPTIONS = [7, 30, 90]
+
+export function StatsPanel() {
+    const [stats, setStats] = useState(null)
+    const [days, setDays] = useState(30)
+    const [loading, setLoading] = useState(true)
+
+    useEffect(() => {
+        fetchStats()
+    }, [days])
+
+    const fetchStats = async () => {
+        setLoading(true)
+        try {
+            const res = await fetchWithAuth(`/api/stats?days=${days}`)
+            if (!res) return
+            if (!res.ok) throw new Error("Failed to fetch stats")
+            setStats(await res.json())
+        } catch (error) {
+            console.error('Error fetching stats:', error)
+        } finally {
+            setLoading(false)
+        }
+    }
+
+    const totals = stats?.requests.totals
+    const maxCreated = Math.max(1, ...(stats?.requests.days || []).map(d => d.created))
+
+    return (
+        <div className="space-y-4">
+            <div className="flex items-center justify-between">
+                <div className="flex gap-2">
+                    {DAY_OPTIONS.map(n => (
+                        <Button key={n} variant={days === n ? 'secondary' : 'outline'} size="sm" onClick={() => setDays(n)}>
+                            {n} days
+                        </Button>
+                    ))}
+                </div>
+                <Button variant="outline" size="sm" onClick={fetchStats} disabled={loading}>
+                    <RefreshCw className={`mr-2 h-4 w-4 ${loading ? 'animate-spin' : ''}`} />
+                    Refresh
+                </Button>
+            </div>
+
+            <div className="grid gap-4 grid-cols-2 md:grid-cols-4">
+                {['created', 'fulfilled', 'expired', 'open'].map(k => (
+                    <Card key={k}>
+                        <CardHeader className="pb-2">
+                            <CardTitle className="text-sm font-medium capitalize text-muted-foreground">Requests {k}</CardTitle>
+                        </CardHeader>
+                        <CardContent className="text-2xl font-bold tabular-nums">{totals ? totals[k] : '…'}</CardContent>
+                    </Card>
+                ))}
+            </div>
+
+            <Card>
+                <CardHeader>
+                    <CardTitle className="text-base">Donors by blood type</CardTitle>
+                    <CardDescription>
+                        Eligible: active and no donation in the last {stats?.cooldown_days ?? '…'} days.
+                    </CardDescription>
+                </CardHeader>
+                <CardContent>
+                    <Table>
+                        <TableHeader>
+                            <TableRow>
+                                <TableHead>Blood Type</TableHead>
+                                <TableHead className="text-right">Registered</TableHead>
+                                <TableHead className="text-right">Active</TableHead>
+                                <TableHead className="text-right">Eligible</TableHead>
+                            </TableRow>
+                        </TableHeader>
+                        <TableBody>
+                            {(stats?.donors.by_type || []).map(t => (
+                                <TableRow key={t.blood_type}>
+                                    <TableCell className="font-medium">{t.blood_type}</TableCell>
+                                    <TableCell className="text-right tabular-nums">{t.total}</TableCell>
+                                    <TableCell className="text-right tabular-nums">{t.active}</TableCell>
+                                    <TableCell className="text-right tabular-nums">{t.eligible}</TableCell>
+                                </TableRow>
+                            ))}
+                        </TableBody>
+                    </Table>
+                </CardContent>
+            </Card>
+
+            <Card>
+                <CardHeader>
+                    <CardTitle className="text-base">Requests per day</CardTitle>
+                </CardHeader>
+                <CardContent className="space-y-1">
+                    {(stats?.requests.days || []).slice().reverse().map(d => (
+                        <div key={d.day} className="flex items-center gap-2 text-xs">
+                            <div className="w-20 text-muted-foreground">{format(parseISO(d.day), 'MMM d')}</div>
+                            <div className="relative flex-1 h-3 rounded bg-muted">
+                                <div
+                                    className="absolute h-3 rounded bg-primary"
+                                    style={{ width: `${(d.created / maxCreated) * 100}%` }}
+                                />
+                            </div>
+                            <div className="w-40 text-right tabular-nums" title="created / fulfilled / expired">
+                                {d.created} · {d.fulfilled} fulfilled · {d.expired} expired
+                            </div>
+                        </div>
+                    ))}
+                </CardContent>
+            </Card>
+        </div>
+    )
+}
@@ -0,0 +1,153 @@
+import { useState, useEffect, Fragment } from 'react'
+import { fetchWithAuth } from '@/lib/auth'
+import { RefreshCw, ChevronRight, ChevronDown } from 'lucide-react'
+import { Button } from "@/components/ui/button"
+import { Badge } from "@/components/ui/badge"
+import {
+    Table,
+    TableBody,
+    TableCell,
+    TableHead,
+    TableHeader,
+    TableRow,
+} from "@/components/ui/table"
+import { format } from "date-fns"
+
+const SPAN_COLORS = {
+    db: 'bg-blue-500',
+    telegram: 'bg-sky-400',
+    ai: 'bg-purple-500',
+}
+
+function spanLabel(span) {
+    return span.target || span.method || span.call_type || span.name
+}
+
+// One bar per span, positioned on the trace's time axis
+function SpanWaterfall({ trace }) {
+    const total = Math.max(trace.duration_ms, 1)
+    const spent = {}
+    trace.spans.forEach(s => { spent[s.name] = (spent[s.name] || 0) + s.duration_ms })
+
+    return (
+        <div className="space-y-2 py-2">
+            <div className="flex flex-wrap gap-2 text-xs text-muted-foreground">
+                {Object.entries(spent).map(([name, ms]) => (
+                    <span key={name}>{name}: {Math.round(ms)} ms</span>
+                ))}
+                <span>untracked: {Math.max(0, Math.round(total - Object.values(spent).reduce((a, b) => a + b, 0)))} ms</span>
+                {trace.dropped_spans > 0 && <span>({trace.dropped_spans} spans dropped)</span>}
+            </div>
+            {trace.spans.map(s => (
+                <div key={s.id} className="flex items-center gap-2 text-xs">
+                    <div className="w-56 truncate font-mono" title={spanLabel(s)}>
+                        {s.parent ? '↳ ' : ''}{s.name} · {spanLabel(s)}
+                    </div>
+                    <div className="relative flex-1 h-3 rounded bg-muted">
+                        <div
+                            className={`absolute h-3 rounded ${s.error ? 'bg-destructive' : SPAN_COLORS[s.name] || 'bg-primary'}`}
+                            style={{
+                                left: `${(s.start_ms / total) * 100}%`,
+                                width: `${Math.max((s.duration_ms / total) * 100, 0.5)}%`,
+                            }}
+                            title={s.error || `${s.duration_ms} ms`}
+                        />
+                    </div>
+                    <div className="w-16 text-right tabular-nums">{s.duration_ms} ms</div>
+                </div>
+            ))}
+            {trace.spans.length === 0 && <div className="text-xs text-muted-foreground">No spans recorded.</div>}
+        </div>
+    )
+}
+
+export function TraceTable() {
+    const [traces, setTraces] = useState([])
+    const [threshold, setThreshold] = useState(null)
+    const [expanded, setExpanded] = useState(null)
+    const [loading, setLoading] = useState(true)
+
+    useEffect(() => {
+        fetchTraces()
+    }, [])
+
+    const fetchTraces = async () => {
+        setLoading(true)
+        try {
+            const res = await fetchWithAuth('/api/traces/slow?limit=50')
+            if (!res) return
+            if (!res.ok) throw new Error("Failed to fetch traces")
+            const data = await res.json()
+            setTraces(data.traces)
+            setThreshold(data.threshold_ms)
+        } catch (error) {
+            console.error('Error fetching traces:', error)
+        } finally {
+            setLoading(false)
+        }
+    }
+
+    return (
+        <div className="space-y-4">
+            <div className="flex items-center justify-between">
+                <p className="text-sm text-muted-foreground">
+                    Bot updates slower than {threshold ?? '…'} ms on this server instance, newest first.
+                </p>
+                <Button variant="outline" size="sm" onClick={fetchTraces} disabled={loading}>
+                    <RefreshCw className={`mr-2 h-4 w-4 ${loading ? 'animate-spin' : ''}`} />
+                    Refresh
+                </Button>
+            </div>
+            <div className="rounded-md border">
+                <Table>
+                    <TableHeader>
+                        <TableRow>
+                            <TableHead className="w-8" />
+                            <TableHead>Time</TableHead>
+                            <TableHead>Flow</TableHead>
+                            <TableHead className="text-right">Duration</TableHead>
+                            <TableHead className="text-right">Spans</TableHead>
+                            <TableHead>Trace ID</TableHead>
+                        </TableRow>
+                    </TableHeader>
+                    <TableBody>
+                        {traces.map(t => (
+                            <Fragment key={t.trace_id}>
+                                <TableRow
+                                    className="cursor-pointer"
+                                    onClick={() => setExpanded(expanded === t.trace_id ? null : t.trace_id)}
+                                >
+                                    <TableCell>
+                                        {expanded === t.trace_id ? <ChevronDown className="h-4 w-4" /> : <ChevronRight className="h-4 w-4" />}
+                                    </TableCell>
+                                    <TableCell>{format(new Date(t.started_at * 1000), 'MMM d, HH:mm:ss')}</TableCell>
+                                    <TableCell>
+                                        <Badge variant={t.error ? 'destructive' : 'secondary'}>{t.name}</Badge>
+                                    </TableCell>
+                                    <TableCell className="text-right tabular-nums">{t.duration_ms} ms</TableCell>
+                                    <TableCell className="text-right tabular-nums">{t.spans.length}</TableCell>
+                                    <TableCell className="font-mono text-xs">{t.trace_id}</TableCell>
+                                </TableRow>
+                                {expanded === t.trace_id && (
+                                    <TableRow>
+                                        <TableCell colSpan={6}>
+                                            {t.error && <div className="text-xs text-destructive pb-1">{t.error}</div>}
+                                            <SpanWaterfall trace={t} />
+                                        </TableCell>
+                                    </TableRow>
+                                )}
+                            </Fragment>
+                        ))}
+                        {!loading && traces.length === 0 && (
+                            <TableRow>
+                                <TableCell colSpan={6} className="h-24 text-center">
+                                    No slow updates recorded.
+                                </TableCell>
+                            </TableRow>
+                        )}
+                    </TableBody>
+                </Table>
+            </div>
+        </div>
+    )
+}
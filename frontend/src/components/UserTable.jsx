@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from 'react'
+import { useState, useEffect, useMemo, useRef } from 'react'
 import { fetchWithAuth } from '@/lib/auth'
 import {
     useReactTable,
@@ -49,6 +49,14 @@ import {
 
 import { EditUserModal } from './EditUserModal'
 
+// Applies a delta from /api/changes: upsert changed rows by telegram_id, drop deleted ones
+const mergeUserChanges = (users, changed, deleted) => {
+    const byId = new Map(users.map(u => [String(u.telegram_id), u]))
+    deleted.forEach(id => byId.delete(String(id)))
+    changed.forEach(u => byId.set(String(u.telegram_id), u))
+    return [...byId.values()].sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''))
+}
+
 export function UserTable() {
     const [data, setData] = useState([])
     const [sorting, setSorting] = useState([])
@@ -65,15 +73,24 @@ export function UserTable() {
         fetchUsers()
     }, [])
 
+    // Newest updated_at we've seen; later refreshes only fetch what changed since
+    const cursorRef = useRef(null)
+
     const fetchUsers = async () => {
         try {
-            const res = await fetchWithAuth('/api/users')
+            const since = cursorRef.current ? `&since=${encodeURIComponent(cursorRef.current)}` : ''
+            const res = await fetchWithAuth(`/api/changes?tables=users${since}`)
             if (!res) return // Handled by auth.js logic (redirected)
 
-            const users = await res.json()
+            const changes = await res.json()
             if (!res.ok) throw new Error("Failed to fetch users")
 
-            setData(users)
+            if (changes.full) {
+                setData(changes.users)
+            } else {
+                setData(prev => mergeUserChanges(prev, changes.users, changes.deleted.users))
+            }
+            if (changes.cursor) cursorRef.current = changes.cursor
             setLoading(false)
         } catch (error) {
             console.error('Error fetching users:', error)
@@ -1,5 +1,11 @@
 
+// Last body + ETag per GET url, so unchanged lists come back as a 304
+const etagCache = new Map()
+
 export const fetchWithAuth = async (url, options = {}) => {
+    const method = (options.method || 'GET').toUpperCase()
+    const cached = method === 'GET' ? etagCache.get(url) : null
+
     // 1. Get Token
     const token = localStorage.getItem('access_token')
 
@@ -13,6 +19,10 @@ export const fetchWithAuth = async (url, options = {}) => {
         headers['Authorization'] = `Bearer ${token}`
     }
 
+    if (cached) {
+        headers['If-None-Match'] = cached.etag
+    }
+
     // 3. Make Request
     const response = await fetch(url, {
         ...options,
@@ -25,11 +35,26 @@ export const fetchWithAuth = async (url, options = {}) => {
         // Clear Storage
         localStorage.removeItem('admin_user')
         localStorage.removeItem('access_token')
+        etagCache.clear()
 
         // Force Reload/Redirect to Login
         window.location.href = '/'
         return null
     }
 
+    // 5. Conditional GET: replay the cached body on 304, remember new ETags on 200
+    if (response.status === 304 && cached) {
+        return new Response(cached.body, { status: 200, headers: { 'Content-Type': 'application/json', 'ETag': cached.etag } })
+    }
+    if (method === 'GET') {
+        const etag = response.headers.get('ETag')
+        if (response.ok && etag) {
+            const body = await response.clone().text()
+            etagCache.set(url, { etag, body })
+        } else {
+            etagCache.delete(url)
+        }
+    }
+
     return response
 }
@@ -7,6 +7,8 @@ import { UserTable } from '../components/UserTable'
 import { RequestTable } from '../components/RequestTable'
 import { CommandTable } from '../components/CommandTable'
 import { AdminTable } from '../components/AdminTable'
+import { TraceTable } from '../components/TraceTable'
+import { StatsPanel } from '../components/StatsPanel'
 import { Sidebar } from '../components/Sidebar'
 import { Settings } from './Settings'
 
@@ -138,7 +140,7 @@ export default function Dashboard() {
                             <PanelLeft className="h-5 w-5" />
                         </Button>
                         <h1 className="text-xl font-bold tracking-tight">
-                            {activeTab === 'feed' ? 'Live Requests' : activeTab === 'users' ? 'User Management' : 'Settings'}
+                            {activeTab === 'feed' ? 'Live Requests' : activeTab === 'users' ? 'User Management' : activeTab === 'traces' ? 'Slow Updates' : activeTab === 'stats' ? 'Statistics' : 'Settings'}
                         </h1>
                     </div>
 
@@ -195,6 +197,18 @@ export default function Dashboard() {
                         </div>
                     )}
 
+                    {activeTab === 'stats' && (
+                        <div className="max-w-7xl mx-auto space-y-4">
+                            <StatsPanel />
+                        </div>
+                    )}
+
+                    {activeTab === 'traces' && (
+                        <div className="max-w-7xl mx-auto space-y-4">
+                            <TraceTable />
+                        </div>
+                    )}
+
                     {activeTab === 'settings' && (
                         <div className="max-w-4xl mx-auto space-y-8 pb-10">
                             <Settings />
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from api.index import process_update
+from api.utils import telegram_api_url
 import requests
 
 async def main():
@@ -17,14 +18,14 @@ async def main():
     # Clear webhook first (cannot poll if webhook is active)
     print("Clearing webhook...")
     try:
-        requests.get(f"https://api.telegram.org/bot{token}/deleteWebhook")
+        requests.get(telegram_api_url(token, "deleteWebhook"))
     except Exception as e:
         print(f"Error clearing webhook: {e}")
     
     print("✅ Bot polling started... (Press Ctrl+C to stop)")
     while True:
         try:
-            url = f"https://api.telegram.org/bot{token}/getUpdates?offset={offset}&timeout=10"
+            url = telegram_api_url(token, "getUpdates") + f"?offset={offset}&timeout=10"
             resp = requests.get(url, timeout=40).json()
             if "result" in resp:
                 for update in resp["result"]:
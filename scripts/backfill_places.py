@@ -0,0 +1,81 @@
+"""
+Fills in island_code/atoll_code (supabase/gazetteer.sql) for existing users
+and requests, from their address/location text.
+
+    python scripts/backfill_places.py
+    python scripts/backfill_places.py --batch-size 500 --dry-run
+
+Reads each table in key order, a batch at a time, and writes one update per
+distinct (island_code, atoll_code) pair in the batch. Rows whose codes are
+already right are skipped, so it can be re-run (e.g. after gazetteer changes).
+"""
+import os
+import sys
+import argparse
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from api.utils import get_supabase_client
+from api.gazetteer import place_codes
+
+# table -> (key column, text column)
+TABLES = {
+    "villingili_users": ("telegram_id", "address"),
+    "villingili_requests": ("id", "location"),
+}
+
+
+def backfill(supabase, table, batch_size, dry_run=False):
+    key, text_column = TABLES[table]
+    scanned = changed = 0
+    last = None
+    while True:
+        q = supabase.table(table).select(f"{key}, {text_column}, island_code, atoll_code").order(key).limit(batch_size)
+        if last is not None:
+            q = q.gt(key, last)
+        rows = q.execute().data or []
+        if not rows:
+            break
+        last = rows[-1][key]
+        scanned += len(rows)
+
+        groups = defaultdict(list)
+        for row in rows:
+            codes = place_codes(row.get(text_column), address=text_column == "address")
+            if row.get("island_code") != codes["island_code"] or row.get("atoll_code") != codes["atoll_code"]:
+                groups[(codes["island_code"], codes["atoll_code"])].append(row[key])
+        for (island, atoll), ids in groups.items():
+            changed += len(ids)
+            if not dry_run:
+                supabase.table(table).update({"island_code": island, "atoll_code": atoll}).in_(key, ids).execute()
+        print(f"{table}: {scanned} scanned, {changed} {'to update' if dry_run else 'updated'}")
+        if len(rows) < batch_size:
+            break
+    return scanned, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would change")
+    parser.add_argument("--table", choices=sorted(TABLES), help="only this table")
+    args = parser.parse_args()
+
+    supabase = get_supabase_client()
+    for table in [args.table] if args.table else TABLES:
+        try:
+            backfill(supabase, table, args.batch_size, args.dry_run)
+        except Exception as e:
+            print(f"❌ {table}: {e}")
+            print("Has supabase/gazetteer.sql been run?")
+            sys.exit(1)
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    main()
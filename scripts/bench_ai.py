@@ -0,0 +1,61 @@
+"""
+Burst benchmark for the AI gateway against the local mock model server.
+
+    python scripts/bench_ai.py --calls 50 --threads 20 --latency-ms 500
+
+Shows that in-flight calls stay at AI_MAX_CONCURRENCY and reports latency
+and token accounting per call type.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--port", type=int, default=8788)
+    args = parser.parse_args()
+
+    server, state = start_server(port=args.port, latency_ms=args.latency_ms)
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    from api import ai_gateway
+
+    ai_gateway.reset_openai_client()
+
+    # Ambiguous texts so the local parser doesn't short-circuit the call
+    texts = [f"blood needed for patient number {i} somewhere" for i in range(args.calls)]
+
+    def one(text):
+        start = time.perf_counter()
+        ai_gateway.chat_json("parse_request", "gpt-4o-mini", [{"role": "user", "content": text}])
+        return (time.perf_counter() - start) * 1000
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = sorted(pool.map(one, texts))
+    wall = time.perf_counter() - wall
+
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print(f"calls={args.calls} wall={wall:.2f}s throughput={args.calls / wall:.1f}/s")
+    print(f"p50={p(0.5):.0f}ms p95={p(0.95):.0f}ms p99={p(0.99):.0f}ms mean={statistics.mean(latencies):.0f}ms")
+    print(f"server max in-flight={state.max_in_flight} (cap AI_MAX_CONCURRENCY={ai_gateway.AI_MAX_CONCURRENCY})")
+    for call_type, m in ai_gateway.get_ai_metrics().items():
+        print(f"{call_type}: {m}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Webhook latency while a burst of admin logins is running.
+
+    python scripts/bench_login.py --logins 20 --webhooks 200
+
+Runs the app in-process against a temporary LocalDB (no Supabase, no
+Telegram token) and reports webhook p50/p99 at idle and during the burst.
+Try AUTH_MAX_WORKERS=1 or BCRYPT_ROUNDS=13 to see the effect of each.
+"""
+import os
+import sys
+import time
+import asyncio
+import contextlib
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_out = sys.stdout
+WORKDIR = tempfile.mkdtemp(prefix="bench_login_")
+os.environ["LOCAL_DB_PATH"] = os.path.join(WORKDIR, "bench.db")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.pop("SUPABASE_URL", None)
+os.environ.pop("TELEGRAM_BOT_TOKEN", None)
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-only-jwt-signing-secret-0123456789")  # JWT signing key
+
+
+def init_db(path, password_hash):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE villingili_users (telegram_id INTEGER PRIMARY KEY, full_name TEXT, phone_number TEXT,
+            blood_type TEXT, role TEXT DEFAULT 'user', status TEXT DEFAULT 'active');
+        CREATE TABLE villingili_admin_users (id INTEGER PRIMARY KEY AUTOINCREMENT, telegram_id INTEGER,
+            username TEXT, phone_number TEXT, password TEXT NOT NULL);
+    """)
+    conn.execute(
+        "INSERT INTO villingili_admin_users (telegram_id, username, phone_number, password) VALUES (?, ?, ?, ?)",
+        (1, "bench", "7000000", password_hash),
+    )
+    conn.commit()
+    conn.close()
+
+
+def webhook_payload(i):
+    # Callback from an unregistered user: one DB read, no outbound calls
+    return {"update_id": i, "callback_query": {
+        "id": str(i), "from": {"id": 999}, "data": "noop",
+        "message": {"message_id": 1, "chat": {"id": 999}},
+    }}
+
+
+def report(line):
+    _out.write(line + "\n")
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return f"n={len(latencies)} p50={p(0.5):.1f}ms p99={p(0.99):.1f}ms max={latencies[-1]:.1f}ms"
+
+
+async def run(args):
+    import httpx
+    from api import index, admin_auth
+
+    init_db(os.environ["LOCAL_DB_PATH"], admin_auth.get_password_hash("secret"))
+    transport = httpx.ASGITransport(app=index.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def webhooks(n, interval):
+            latencies = []
+            for i in range(n):
+                start = time.perf_counter()
+                await client.post("/api/webhook", json=webhook_payload(i))
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(interval)
+            return latencies
+
+        async def login(i):
+            # Distinct wrong passwords so the login cache can't help
+            await client.post("/api/admin_login", json={"username": "7000000", "password": f"wrong-{i}"})
+
+        await webhooks(10, 0)  # warm-up
+        idle = await webhooks(args.webhooks, args.interval)
+        report(f"idle        {summary(idle)}")
+
+        start = time.perf_counter()
+        burst = asyncio.gather(*(login(i) for i in range(args.logins)))
+        during = await webhooks(args.webhooks, args.interval)
+        await burst
+        report(f"login burst {summary(during)}")
+        report(f"{args.logins} logins in {time.perf_counter() - start:.2f}s "
+              f"(BCRYPT_ROUNDS={admin_auth.BCRYPT_ROUNDS}, AUTH_MAX_WORKERS={admin_auth.AUTH_MAX_WORKERS})")
+
+        first = await client.post("/api/admin_login", json={"username": "bench", "password": "secret"})
+        start = time.perf_counter()
+        for _ in range(5):
+            await client.post("/api/admin_login", json={"username": "bench", "password": "secret"})
+        report(f"login status={first.json().get('status')} repeat (cached) avg={(time.perf_counter() - start) * 200:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--webhooks", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    os.chdir(WORKDIR)
+    # process_update is chatty; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Cold-start benchmark: import cost of api.index and time to first response.
+
+    python scripts/bench_startup.py --runs 5
+    python scripts/bench_startup.py --runs 5 --json >> startup_history.jsonl
+
+Every run is a fresh interpreter. Reports the median of:
+  - total `import api.index` time and the heaviest modules (python -X importtime)
+  - process spawn -> first GET /api/index response
+  - process spawn -> first webhook processed (temporary LocalDB, no network)
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+# Runs inside the child interpreter
+_FIRST_RESPONSE = r"""
+import os, sys, time, json, asyncio
+t0 = time.perf_counter()
+sys.path.insert(0, os.environ["BENCH_ROOT"])
+from api import index
+t_import = time.perf_counter()
+
+import httpx
+
+async def main():
+    transport = httpx.ASGITransport(app=index.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/api/index")
+        t_first = time.perf_counter()
+        await client.post("/api/webhook", json={"update_id": 1, "callback_query": {
+            "id": "1", "from": {"id": 999}, "data": "noop",
+            "message": {"message_id": 1, "chat": {"id": 999}}}})
+        t_webhook = time.perf_counter()
+    return t_first, t_webhook
+
+t_first, t_webhook = asyncio.run(main())
+sys.__stdout__.write("BENCH " + json.dumps({
+    "import_ms": (t_import - t0) * 1000,
+    "first_response_ms": (t_first - t0) * 1000,
+    "first_webhook_ms": (t_webhook - t0) * 1000,
+}) + "\n")
+"""
+
+
+def child_env(workdir):
+    env = dict(os.environ)
+    env.update({
+        "BENCH_ROOT": ROOT,
+        "LOCAL_DB_PATH": os.path.join(workdir, "bench.db"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    # Measure the app itself, not Supabase/Telegram round trips
+    for key in ("SUPABASE_URL", "TELEGRAM_BOT_TOKEN"):
+        env.pop(key, None)
+    return env
+
+
+def run_importtime(env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.index"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    modules = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        cumulative, name = int(m.group(2)), m.group(4)
+        modules[name] = cumulative
+        if name == "api.index":
+            total = cumulative
+    return total / 1000.0, modules
+
+
+def run_first_response(env, workdir):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _FIRST_RESPONSE], cwd=workdir, env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH ")), None)
+    if not line:
+        raise RuntimeError(f"first-response run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(line[6:])
+    result["process_wall_ms"] = wall
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="one JSON line, for tracking across releases")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = child_env(workdir)
+
+    import sqlite3
+    conn = sqlite3.connect(env["LOCAL_DB_PATH"])
+    conn.execute("CREATE TABLE IF NOT EXISTS villingili_users (telegram_id INTEGER PRIMARY KEY, full_name TEXT, status TEXT)")
+    conn.close()
+
+    totals, per_module, firsts = [], {}, []
+    for _ in range(args.runs):
+        total, modules = run_importtime(env)
+        totals.append(total)
+        for name, us in modules.items():
+            per_module.setdefault(name, []).append(us)
+        firsts.append(run_first_response(env, workdir))
+
+    median = lambda values: statistics.median(values) if values else 0.0
+    heaviest = sorted(((median(v) / 1000.0, k) for k, v in per_module.items()), reverse=True)[:args.top]
+    summary = {
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "import_api_index_ms": round(median(totals), 1),
+        "first_response_ms": round(median([f["first_response_ms"] for f in firsts]), 1),
+        "first_webhook_ms": round(median([f["first_webhook_ms"] for f in firsts]), 1),
+        "process_wall_ms": round(median([f["process_wall_ms"] for f in firsts]), 1),
+        "loaded": {name: name in per_module for name in ("supabase", "openai", "passlib", "jwt", "PIL", "api.ocr", "api.admin_auth")},
+    }
+
+    if args.json:
+        summary["timestamp"] = int(time.time())
+        print(json.dumps(summary))
+        return
+
+    print(f"import api.index     {summary['import_api_index_ms']:8.1f} ms (median of {args.runs})")
+    print(f"first GET /api/index {summary['first_response_ms']:8.1f} ms incl. import")
+    print(f"first webhook        {summary['first_webhook_ms']:8.1f} ms incl. import")
+    print(f"process wall         {summary['process_wall_ms']:8.1f} ms")
+    print("loaded at import:    " + ", ".join(f"{k}={'yes' if v else 'no'}" for k, v in summary["loaded"].items()))
+    print("\nheaviest imports (cumulative, ms):")
+    for ms, name in heaviest:
+        print(f"  {ms:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Writes .gz (and .br, if the brotli package is installed) next to each
+compressible file of the built frontend, for api/static_files.py to serve.
+
+    python scripts/compress_static.py            # api/static
+    python scripts/compress_static.py frontend/dist
+
+Runs as the last step of `npm run build`. Variants that are already newer
+than their source are skipped; ones that don't save space are not written.
+"""
+import os
+import sys
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".ico")
+MIN_SIZE = 1024
+
+
+def _write_variant(path, raw, ext, compress):
+    target = path + ext
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return None
+    data = compress(raw)
+    if len(data) >= len(raw):
+        if os.path.exists(target):
+            os.remove(target)
+        return None
+    with open(target, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def compress_dir(root):
+    written = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                raw = f.read()
+            if len(raw) < MIN_SIZE:
+                continue
+            sizes = [f"{len(raw)}B"]
+            gz = _write_variant(path, raw, ".gz", lambda b: gzip.compress(b, 9, mtime=0))
+            if gz:
+                sizes.append(f"gz {gz}B")
+            if brotli:
+                br = _write_variant(path, raw, ".br", lambda b: brotli.compress(b, quality=11))
+                if br:
+                    sizes.append(f"br {br}B")
+            if len(sizes) > 1:
+                written += 1
+                print(f"{os.path.relpath(path, root)}: {', '.join(sizes)}")
+    return written
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api", "static")
+    if not brotli:
+        print("brotli not installed: writing gzip variants only")
+    print(f"Compressed {compress_dir(root)} files in {root}")
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Usage:
+    python scripts/mock_openai_server.py --port 8787 --latency-ms 800
+    OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=mock uvicorn api.index:app
+
+Text prompts are answered with the local request parser (falling back to an
+empty result); image prompts get a fixed, valid Maldives ID card result.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.request_parser import parse_request_locally
+
+FAKE_ID_CARD = {
+    "is_valid": True,
+    "error": None,
+    "full_name": "Ahmed Mock",
+    "id_card_number": "A000001",
+    "sex": "M",
+    "address": "Mock House, Villingili",
+    "date_of_birth": "01/01/1990",
+}
+
+
+class MockState:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def _answer(body):
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {}
+    content = last.get("content")
+
+    if isinstance(content, list):
+        # Vision request - vary the ID with the image so the draft rows differ
+        image = next((c.get("image_url", {}).get("url", "") for c in content if c.get("type") == "image_url"), "")
+        card = dict(FAKE_ID_CARD)
+        card["id_card_number"] = "A%06d" % (abs(hash(image)) % 1000000)
+        return card
+
+    parsed = parse_request_locally(content or "")
+    return parsed or {"blood_type": None, "location": None, "urgency": "Normal"}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload):
+            raw = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/_stats"):
+                with state.lock:
+                    return self._send(200, {"calls": state.calls, "max_in_flight": state.max_in_flight})
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+
+            with state.lock:
+                state.calls += 1
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                delay = state.latency_ms + random.uniform(0, state.jitter_ms)
+                time.sleep(delay / 1000.0)
+                if random.random() < state.error_rate:
+                    return self._send(500, {"error": {"message": "injected error", "type": "server_error"}})
+
+                content = json.dumps(_answer(body))
+                self._send(200, {
+                    "id": f"chatcmpl-mock-{state.calls}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(json.dumps(body.get("messages", []))) // 4,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": len(json.dumps(body.get("messages", []))) // 4 + len(content) // 4,
+                    },
+                })
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=8787, latency_ms=0, jitter_ms=0, error_rate=0.0):
+    """Starts the server in a daemon thread. Returns (server, state)."""
+    state = MockState(latency_ms, jitter_ms, error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = MockState(args.latency_ms, args.jitter_ms, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Mock OpenAI listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped.")
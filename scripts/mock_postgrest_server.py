@@ -0,0 +1,323 @@
+"""
+Local PostgREST stand-in backed by LocalDB, so the real supabase client code
+path (HTTP round trips included) can run offline.
+
+Usage:
+    python scripts/mock_postgrest_server.py --db blood_donation.db --port 54321 --latency-ms 40
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=<any JWT-shaped key> uvicorn api.index:app
+
+Speaks the subset of PostgREST the project uses on /rest/v1/<table>:
+select (with count=exact and HEAD), eq/neq/gt/gte/lt/lte/like/ilike/is/in
+filters, or=(...), order, limit, insert, upsert (on_conflict), update,
+delete, single-object responses and Prefer: return=minimal|representation,
+plus POST /rest/v1/rpc/<function> for the functions LocalDB implements.
+Every request is recorded so round trips per flow can be counted.
+
+Control endpoints:
+    GET  /_stats    round trips per table and method, max in flight
+    GET  /_calls    recorded requests (?limit=50)
+    POST /_reset    clear recorded requests and counters
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import random
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.local_db import LocalDB, _PG_OPS, _RPC_FUNCTIONS, _parse_or_filter
+
+SINGLE_OBJECT = "application/vnd.pgrst.object+json"
+# Query parameters that are not column filters
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns", "or"}
+
+
+class MockState:
+    def __init__(self, db_path, latency_ms=0, jitter_ms=0, error_rate=0.0, max_calls=10000):
+        self.db = LocalDB(db_path)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.max_calls = max_calls
+        self.reset()
+
+    def reset(self):
+        self.calls = deque(maxlen=self.max_calls)
+        self.counts = {}  # "GET villingili_users" -> n
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def stats(self):
+        return {
+            "calls": sum(self.counts.values()),
+            "by_route": dict(self.counts),
+            "errors": self.errors,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+def _value(raw):
+    # URL values are strings; PostgREST casts them to the column type
+    if raw == "null":
+        return None
+    if raw in ("true", "false"):
+        return raw == "true"
+    return raw
+
+
+def _split_list(raw):
+    """'("a,b",c)' -> ['a,b', 'c']"""
+    items, current, quoted = [], "", False
+    for ch in raw.strip("()"):
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            items.append(current)
+            current = ""
+        else:
+            current += ch
+    if current or items:
+        items.append(current)
+    return items
+
+
+def apply_filters(query, params):
+    for column, raw in params:
+        if column in _RESERVED:
+            continue
+        op, _, arg = raw.partition(".")
+        if op == "not":
+            raise ValueError("not.* filters are not supported")
+        if op == "in":
+            query.in_(column, [_value(v) for v in _split_list(arg)])
+        elif op in _PG_OPS:
+            if op in ("like", "ilike"):
+                arg = arg.replace("*", "%")
+            query.filters.append((column, _PG_OPS[op], _value(arg)))
+        else:
+            raise ValueError(f"unsupported operator {op!r}")
+    for column, raw in params:
+        if column == "or":
+            clauses = _parse_or_filter(raw.strip("()"))
+            query.filters.append(("__or__", "OR", [(c, o, _value(v)) for c, o, v in clauses]))
+
+
+def apply_order(query, raw):
+    terms = []
+    for term in raw.split(","):
+        parts = term.split(".")
+        direction = "DESC" if "desc" in parts[1:] else "ASC"
+        nulls = " NULLS FIRST" if "nullsfirst" in parts else " NULLS LAST" if "nullslast" in parts else ""
+        terms.append(f"{parts[0]} {direction}{nulls}")
+    query.order_by = ", ".join(terms)
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like a real PostgREST behind a proxy
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload=None, headers=None):
+            raw = b"" if payload is None or self.command == "HEAD" else json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _error(self, code, message, pg_code="PGRST000", details=None):
+            with state.lock:
+                state.errors += 1
+            self._send(code, {"code": pg_code, "message": message, "details": details, "hint": None})
+
+        def _read_body(self):
+            # Always consume it, or the next request on this connection is garbage
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            self.body = json.loads(raw) if raw else None
+
+        def _prefer(self):
+            prefs = {}
+            for part in (self.headers.get("Prefer") or "").split(","):
+                key, _, value = part.strip().partition("=")
+                if key:
+                    prefs[key] = value
+            return prefs
+
+        def do_GET(self):
+            self._route()
+
+        def do_HEAD(self):
+            self._route()
+
+        def do_POST(self):
+            self._route()
+
+        def do_PATCH(self):
+            self._route()
+
+        def do_DELETE(self):
+            self._route()
+
+        def _route(self):
+            self._read_body()
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if parts[0] == "_stats":
+                with state.lock:
+                    return self._send(200, state.stats())
+            if parts[0] == "_calls":
+                limit = int(dict(parse_qsl(url.query)).get("limit", 100))
+                with state.lock:
+                    return self._send(200, list(state.calls)[-limit:])
+            if parts[0] == "_reset" and self.command == "POST":
+                with state.lock:
+                    state.reset()
+                return self._send(200, {"ok": True})
+            if parts[:2] != ["rest", "v1"] or len(parts) != (4 if parts[2:3] == ["rpc"] else 3):
+                return self._error(404, "Not Found", "PGRST125")
+
+            table = "/".join(parts[2:])
+            params = parse_qsl(url.query, keep_blank_values=True)
+            with state.lock:
+                route = f"{self.command} {table}"
+                state.counts[route] = state.counts.get(route, 0) + 1
+                state.calls.append({"method": self.command, "table": table, "query": url.query, "at": time.time()})
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                time.sleep((state.latency_ms + random.uniform(0, state.jitter_ms)) / 1000.0)
+                if random.random() < state.error_rate:
+                    return self._error(503, "injected error")
+                if table.startswith("rpc/"):
+                    self._rpc(table[4:])
+                else:
+                    self._table(table, params)
+            except (ValueError, KeyError) as e:
+                self._error(400, str(e), "PGRST100")
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _table(self, table, params):
+            args = dict(params)
+            prefer = self._prefer()
+            query = state.db.table(table)
+            representation = prefer.get("return") == "representation"
+
+            if self.command in ("GET", "HEAD"):
+                query.select(args.get("select", "*"), count=prefer.get("count"))
+                apply_filters(query, params)
+                if "order" in args:
+                    apply_order(query, args["order"])
+                if "limit" in args:
+                    query.limit(int(args["limit"]))
+                return self._reply(query.execute(), prefer)
+
+            if self.command == "POST":
+                body = self.body
+                if prefer.get("resolution") == "merge-duplicates":
+                    query.upsert(body, on_conflict=args.get("on_conflict"))
+                else:
+                    query.insert(body)
+                res = query.execute()
+                return self._reply(res, prefer, status=201, minimal=not representation)
+
+            if self.command == "PATCH":
+                query.update(self.body)
+                apply_filters(query, params)
+                return self._reply(query.execute(), prefer, minimal=not representation)
+
+            if self.command == "DELETE":
+                deleted = None
+                if representation:
+                    # PostgREST returns the deleted rows
+                    lookup = state.db.table(table).select("*")
+                    apply_filters(lookup, params)
+                    deleted = lookup.execute().data
+                query.delete()
+                apply_filters(query, params)
+                res = query.execute()
+                if not res.error and deleted is not None:
+                    res.data = deleted
+                return self._reply(res, prefer, minimal=not representation)
+
+            self._error(405, "Method Not Allowed")
+
+        def _rpc(self, fn):
+            if self.command != "POST":
+                return self._error(405, "Method Not Allowed")
+            try:
+                res = state.db.rpc(fn, self.body or {}).execute()
+            except ValueError as e:
+                if fn not in _RPC_FUNCTIONS:
+                    return self._error(404, str(e), "PGRST202")
+                raise
+            except sqlite3.IntegrityError as e:
+                if "UNIQUE" in str(e):
+                    return self._error(409, str(e), "23505")
+                return self._error(400, str(e), "23502")
+            self._send(200, res.data)
+
+        def _reply(self, res, prefer, status=200, minimal=False):
+            if res.error:
+                return self._error(400, res.error)
+            rows = res.data or []
+            total = res.count if res.count is not None else "*"
+            headers = {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{total}" if rows else f"*/{total}"}
+            if minimal:
+                return self._send(204 if status == 200 else status, None, headers)
+            if SINGLE_OBJECT in (self.headers.get("Accept") or ""):
+                if len(rows) != 1:
+                    return self._send(406, {
+                        "code": "PGRST116",
+                        "message": "JSON object requested, multiple (or no) rows returned",
+                        "details": f"The result contains {len(rows)} rows",
+                        "hint": None,
+                    })
+                return self._send(status, rows[0], headers)
+            self._send(status, rows, headers)
+
+    return Handler
+
+
+def start_server(db_path, host="127.0.0.1", port=54321, **options):
+    """Starts the server in a daemon thread. Returns (server, state)."""
+    state = MockState(db_path, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PostgREST stand-in backed by LocalDB")
+    parser.add_argument("--db", default=os.environ.get("LOCAL_DB_PATH", "blood_donation.db"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = MockState(args.db, args.latency_ms, args.jitter_ms, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"PostgREST stand-in for {args.db} listening on http://{args.host}:{args.port}/rest/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped.")
@@ -0,0 +1,142 @@
+"""
+Tiny Redis-compatible stand-in for offline runs of the shared pending-scan store.
+
+    python scripts/mock_redis_server.py --port 6390
+    PENDING_SCAN_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn api.index:app
+
+Supports HELLO, PING, GET, SET [EX|PX], DEL, GETDEL, EXPIRE, TTL, DBSIZE and
+MULTI/EXEC - enough for api/pending_store.py. Data lives in memory only.
+"""
+import time
+import argparse
+import threading
+import socketserver
+
+_data = {}  # key -> (value bytes, expires_at or None)
+_lock = threading.Lock()
+
+
+def _alive(key):
+    item = _data.get(key)
+    if item and item[1] is not None and item[1] <= time.time():
+        del _data[key]
+        return None
+    return item
+
+
+def _bulk(value, proto=2):
+    if value is None:
+        return b"_\r\n" if proto == 3 else b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def run_command(args, proto=2):
+    cmd = args[0].upper()
+    with _lock:
+        if cmd == b"PING":
+            return b"+PONG\r\n"
+        if cmd in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+        if cmd == b"HELLO":
+            proto = int(args[1]) if len(args) > 1 else 2
+            if proto == 3:
+                return b"%3\r\n+server\r\n+redis\r\n+version\r\n+7.0.0\r\n+proto\r\n:3\r\n"
+            return b"*6\r\n+server\r\n+redis\r\n+version\r\n+7.0.0\r\n+proto\r\n:2\r\n"
+        if cmd == b"GET":
+            item = _alive(args[1])
+            return _bulk(item[0] if item else None, proto)
+        if cmd == b"GETDEL":
+            item = _alive(args[1])
+            _data.pop(args[1], None)
+            return _bulk(item[0] if item else None, proto)
+        if cmd == b"SET":
+            expires_at = None
+            opts = [a.upper() for a in args[3:]]
+            if b"EX" in opts:
+                expires_at = time.time() + int(args[3 + opts.index(b"EX") + 1])
+            elif b"PX" in opts:
+                expires_at = time.time() + int(args[3 + opts.index(b"PX") + 1]) / 1000.0
+            _data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if cmd == b"DEL":
+            removed = sum(1 for k in args[1:] if _alive(k) and _data.pop(k, None))
+            return b":%d\r\n" % removed
+        if cmd == b"EXPIRE":
+            item = _alive(args[1])
+            if not item:
+                return b":0\r\n"
+            _data[args[1]] = (item[0], time.time() + int(args[2]))
+            return b":1\r\n"
+        if cmd == b"TTL":
+            item = _alive(args[1])
+            if not item:
+                return b":-2\r\n"
+            return b":%d\r\n" % (-1 if item[1] is None else int(item[1] - time.time()))
+        if cmd == b"DBSIZE":
+            return b":%d\r\n" % sum(1 for k in list(_data) if _alive(k))
+    return b"-ERR unknown command '%s'\r\n" % cmd
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()  # inline command (e.g. from telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        queued = None
+        proto = 2
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            cmd = args[0].upper()
+            if cmd == b"HELLO" and len(args) > 1:
+                proto = int(args[1])
+            if cmd == b"MULTI":
+                queued = []
+                self.wfile.write(b"+OK\r\n")
+            elif cmd == b"EXEC" and queued is not None:
+                replies = [run_command(a, proto) for a in queued]
+                queued = None
+                self.wfile.write(b"*%d\r\n" % len(replies) + b"".join(replies))
+            elif cmd == b"DISCARD":
+                queued = None
+                self.wfile.write(b"+OK\r\n")
+            elif queued is not None:
+                queued.append(args)
+                self.wfile.write(b"+QUEUED\r\n")
+            else:
+                self.wfile.write(run_command(args, proto))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(host="127.0.0.1", port=6390):
+    server = Server((host, port), RESPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    print(f"Mock Redis listening on redis://{args.host}:{args.port}/0")
+    try:
+        Server((args.host, args.port), RESPHandler).serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped.")
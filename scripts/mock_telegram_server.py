@@ -0,0 +1,270 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Usage:
+    python scripts/mock_telegram_server.py --port 8081 --latency-ms 120 --rate-limit 0.05
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=mock uvicorn api.index:app
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=mock python local_bot.py
+
+Implements the methods the bot uses (sendMessage, editMessageText,
+answerCallbackQuery, getFile + file download, getUpdates, deleteWebhook,
+setWebhook, ...). Every call is recorded. Latency, 429 "retry after" replies
+and 5xx errors can be injected; --chat-rate also enforces Telegram's
+per-chat flood limit (messages per second per chat).
+
+Control endpoints:
+    GET  /_stats     call counts per method, 429s, errors, max in flight
+    GET  /_calls     recorded calls (?method=sendMessage&limit=50)
+    POST /_updates   queue an update (or a list) for getUpdates
+    POST /_reset     clear recorded calls and counters
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_USER = {"id": 888888, "is_bot": True, "first_name": "MockBot", "username": "mock_bot"}
+# Methods that just acknowledge with `true`
+_TRUE_METHODS = {"answerCallbackQuery", "deleteWebhook", "setWebhook", "setMyCommands", "deleteMyCommands", "deleteMessage"}
+
+
+class MockState:
+    def __init__(self, latency_ms=0, jitter_ms=0, rate_limit=0.0, retry_after=1, error_rate=0.0, chat_rate=0.0, max_calls=10000):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit    # probability of a 429
+        self.retry_after = retry_after
+        self.error_rate = error_rate    # probability of a 500
+        self.chat_rate = chat_rate      # msgs/s per chat before 429 (0 = off)
+        self.lock = threading.Lock()
+        self.updates_ready = threading.Condition(self.lock)
+        self.updates = []
+        self.max_calls = max_calls
+        self.reset()
+
+    def reset(self):
+        self.calls = deque(maxlen=self.max_calls)
+        self.counts = {}
+        self.rate_limited = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.next_message_id = 1000
+        self.chat_sends = {}  # chat_id -> recent send timestamps
+
+    def stats(self):
+        return {
+            "calls": sum(self.counts.values()),
+            "by_method": dict(self.counts),
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "max_in_flight": self.max_in_flight,
+            "pending_updates": len(self.updates),
+        }
+
+
+def fake_photo(file_id):
+    """A JPEG (when Pillow is installed) that differs per file_id."""
+    rng = random.Random(file_id)
+    try:
+        from PIL import Image, ImageDraw
+        img = Image.new("RGB", (1280, 853), (rng.randint(150, 255), rng.randint(150, 255), rng.randint(150, 255)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rng.randint(0, 1200), rng.randint(0, 800)
+            draw.rectangle([x, y, x + rng.randint(20, 300), y + rng.randint(10, 120)], fill=(rng.randint(0, 120),) * 3)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=80)
+        return out.getvalue()
+    except ImportError:
+        return f"fake-jpeg-{file_id}".encode("utf-8") + bytes(rng.getrandbits(8) for _ in range(2048))
+
+
+def _message(state, params, chat_id=None):
+    with state.lock:
+        state.next_message_id += 1
+        message_id = state.next_message_id
+    return {
+        "message_id": int(params.get("message_id") or message_id),
+        "from": BOT_USER,
+        "chat": {"id": chat_id if chat_id is not None else params.get("chat_id")},
+        "date": int(time.time()),
+        "text": params.get("text", ""),
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload, content_type="application/json"):
+            raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _params(self, url):
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                raw = self.rfile.read(length)
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    params.update(json.loads(raw or b"{}"))
+                else:
+                    params.update({k: v[-1] for k, v in parse_qs(raw.decode("utf-8")).items()})
+            return params
+
+        def do_GET(self):
+            self._dispatch()
+
+        def do_POST(self):
+            self._dispatch()
+
+        def _dispatch(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+
+            if parts[0].startswith("_"):
+                return self._control(parts[0], url)
+            if parts[0] == "file" and len(parts) >= 3:
+                # /file/bot<token>/photos/<file_id>.jpg
+                file_id = parts[-1].rsplit(".", 1)[0]
+                return self._call("_download", {"file_id": file_id})
+            if len(parts) == 2 and parts[0].startswith("bot"):
+                return self._call(parts[1], self._params(url))
+            self._send(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+        def _control(self, name, url):
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if name == "_stats":
+                with state.lock:
+                    return self._send(200, state.stats())
+            if name == "_calls":
+                method = query.get("method")
+                limit = int(query.get("limit", 100))
+                with state.lock:
+                    calls = [c for c in state.calls if not method or c["method"] == method]
+                return self._send(200, calls[-limit:])
+            if name == "_updates" and self.command == "POST":
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"[]")
+                with state.updates_ready:
+                    state.updates.extend(body if isinstance(body, list) else [body])
+                    state.updates_ready.notify_all()
+                return self._send(200, {"ok": True, "pending": len(state.updates)})
+            if name == "_reset" and self.command == "POST":
+                with state.lock:
+                    state.reset()
+                return self._send(200, {"ok": True})
+            self._send(404, {"error": "not found"})
+
+        def _flooded(self, method, params):
+            # Telegram allows roughly chat_rate messages per second per chat
+            if not state.chat_rate or method not in ("sendMessage", "editMessageText"):
+                return False
+            now = time.monotonic()
+            with state.lock:
+                sent = state.chat_sends.setdefault(params.get("chat_id"), deque())
+                while sent and now - sent[0] > 1.0:
+                    sent.popleft()
+                if len(sent) >= state.chat_rate:
+                    return True
+                sent.append(now)
+            return False
+
+        def _call(self, method, params):
+            with state.lock:
+                state.counts[method] = state.counts.get(method, 0) + 1
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+                state.calls.append({"method": method, "params": params, "at": time.time()})
+            try:
+                if method == "getUpdates":
+                    return self._get_updates(params)
+
+                time.sleep((state.latency_ms + random.uniform(0, state.jitter_ms)) / 1000.0)
+                if random.random() < state.rate_limit or self._flooded(method, params):
+                    with state.lock:
+                        state.rate_limited += 1
+                    return self._send(429, {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {state.retry_after}",
+                        "parameters": {"retry_after": state.retry_after},
+                    })
+                if random.random() < state.error_rate:
+                    with state.lock:
+                        state.errors += 1
+                    return self._send(500, {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"})
+
+                if method == "_download":
+                    return self._send(200, fake_photo(params["file_id"]), "image/jpeg")
+                if method == "getMe":
+                    return self._send(200, {"ok": True, "result": BOT_USER})
+                if method in ("sendMessage", "editMessageText"):
+                    return self._send(200, {"ok": True, "result": _message(state, params)})
+                if method == "getFile":
+                    file_id = params.get("file_id", "")
+                    return self._send(200, {"ok": True, "result": {
+                        "file_id": file_id,
+                        "file_unique_id": f"u_{file_id}",
+                        "file_path": f"photos/{file_id}.jpg",
+                    }})
+                if method in _TRUE_METHODS:
+                    return self._send(200, {"ok": True, "result": True})
+                self._send(404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"})
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _get_updates(self, params):
+            offset = int(params.get("offset") or 0)
+            timeout = min(float(params.get("timeout") or 0), 30)
+            deadline = time.monotonic() + timeout
+            with state.updates_ready:
+                # Like Telegram, an offset confirms everything before it
+                state.updates = [u for u in state.updates if u.get("update_id", 0) >= offset]
+                while not state.updates and time.monotonic() < deadline:
+                    state.updates_ready.wait(deadline - time.monotonic())
+                result = list(state.updates[:int(params.get("limit") or 100)])
+            self._send(200, {"ok": True, "result": result})
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=8081, **options):
+    """Starts the server in a daemon thread. Returns (server, state)."""
+    state = MockState(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="probability of a 429 reply")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--chat-rate", type=float, default=0.0, help="messages/s per chat before 429 (0 = off)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = MockState(args.latency_ms, args.jitter_ms, args.rate_limit, args.retry_after, args.error_rate, args.chat_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Mock Telegram Bot API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped.")
@@ -2,8 +2,9 @@ import os
 import sys
 import json
 import requests
-import time
-import random
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from telegram_updates import text_message, reply_message, callback_query
 
 # Set MOCK env var so utils.py prints instead of sending
 os.environ["MOCK_TELEGRAM"] = "true"
@@ -57,73 +58,28 @@ def main():
             continue
 
         # --- PAYLOAD CONSTRUCTION ---
-        timestamp = int(time.time())
-        update = {
-            "update_id": timestamp,
-        }
-
         # Handle Callbacks (Buttons)
         if text.startswith("callback:"):
             data_payload = text.split(":", 1)[1].strip()
-            update["callback_query"] = {
-                "id": str(timestamp),
-                "from": {
-                    "id": user_id,
-                    "is_bot": False,
-                    "first_name": first_name,
-                    "language_code": "en"
-                },
-                "message": {
-                    "message_id": timestamp,
-                    "chat": {
-                        "id": chat_id,
-                        "type": chat_type
-                    },
-                    "date": timestamp,
-                    "text": "[Button Message]"
-                },
-                "data": data_payload
-            }
+            update = callback_query(user_id, data_payload, chat_id, chat_type, first_name)
             print(f">> Sending CALLBACK: {data_payload}")
 
+        # Simulate 'Reply to Scan' (admin group logic checks reply_to_message)
+        # Format: reply:REF-TEXT|ACTUAL-TEXT
+        # Example: reply:REF:123|9999999
+        elif text.startswith("reply:"):
+            try:
+                meta, actual_text = text.split("|", 1)
+                reply_text = meta.split(":", 1)[1] # remove 'reply:'
+                update = reply_message(user_id, actual_text, reply_text, chat_id, chat_type)
+                print(f">> Simulate REPLYING to message: '{reply_text}'")
+            except:
+                print("Error parsing reply syntax. Use: reply:TargetText|MyMessage")
+                continue
+
         # Handle Normal Messages (Text)
         else:
-            update["message"] = {
-                "message_id": timestamp,
-                "from": {
-                    "id": user_id,
-                    "is_bot": False,
-                    "first_name": first_name,
-                    "language_code": "en"
-                },
-                "chat": {
-                    "id": chat_id,
-                    "type": chat_type
-                },
-                "date": timestamp,
-                "text": text
-            }
-            # Admin Group Logic often checks for Reply headers, Photos etc.
-            # This sim only creates text.
-            # To simulate 'Reply to Scan', we need 'reply_to_message' structure.
-            # Simple syntax hack: "reply:REF:123|message"
-            if text.startswith("reply:"):
-                # Format: reply:REF-TEXT|ACTUAL-TEXT
-                # Example: reply:REF:123|9999999
-                try:
-                    meta, actual_text = text.split("|", 1)
-                    reply_text = meta.split(":", 1)[1] # remove 'reply:'
-                    
-                    update["message"]["text"] = actual_text
-                    update["message"]["reply_to_message"] = {
-                        "message_id": timestamp - 10,
-                        "from": {"id": 888888, "first_name": "Bot"},
-                        "chat": {"id": chat_id},
-                        "text": reply_text
-                    }
-                    print(f">> Simulate REPLYING to message: '{reply_text}'")
-                except:
-                    print("Error parsing reply syntax. Use: reply:TargetText|MyMessage")
+            update = text_message(user_id, text, chat_id, chat_type, first_name)
 
         # --- SEND ---
         try:
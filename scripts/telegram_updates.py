@@ -0,0 +1,85 @@
+"""
+Builders for the Telegram update payloads the bot receives.
+Shared by simulate_bot.py (interactive) and load_test.py (bursts).
+"""
+import time
+import itertools
+
+_ids = itertools.count(int(time.time() * 1000))
+
+
+def next_id():
+    return next(_ids)
+
+
+def _user(user_id, first_name="SimUser"):
+    return {"id": user_id, "is_bot": False, "first_name": first_name, "language_code": "en"}
+
+
+def _chat(chat_id, chat_type="private"):
+    return {"id": chat_id, "type": chat_type}
+
+
+def message(user_id, text=None, chat_id=None, chat_type="private", first_name="SimUser", **extra):
+    uid = next_id()
+    msg = {
+        "message_id": uid,
+        "from": _user(user_id, first_name),
+        "chat": _chat(chat_id if chat_id is not None else user_id, chat_type),
+        "date": int(time.time()),
+    }
+    if text is not None:
+        msg["text"] = text
+    msg.update(extra)
+    return {"update_id": uid, "message": msg}
+
+
+def text_message(user_id, text, chat_id=None, chat_type="private", first_name="SimUser"):
+    return message(user_id, text, chat_id, chat_type, first_name)
+
+
+def contact_message(user_id, phone_number, first_name="SimUser", last_name=""):
+    contact = {"phone_number": phone_number, "first_name": first_name, "last_name": last_name, "user_id": user_id}
+    return message(user_id, chat_id=user_id, first_name=first_name, contact=contact)
+
+
+def reply_message(user_id, text, reply_text, chat_id=None, chat_type="private"):
+    """A message replying to an earlier bot message (e.g. 'REF:123' scans)."""
+    update = message(user_id, text, chat_id, chat_type)
+    update["message"]["reply_to_message"] = {
+        "message_id": update["message"]["message_id"] - 10,
+        "from": {"id": 888888, "first_name": "Bot"},
+        "chat": {"id": update["message"]["chat"]["id"]},
+        "text": reply_text,
+    }
+    return update
+
+
+def photo_message(user_id, chat_id, file_id, chat_type="supergroup", media_group_id=None):
+    # Telegram sends several sizes, largest last
+    photo = [
+        {"file_id": f"{file_id}_s", "file_unique_id": f"{file_id}_us", "width": 90, "height": 60},
+        {"file_id": file_id, "file_unique_id": f"u_{file_id}", "width": 1280, "height": 853},
+    ]
+    extra = {"photo": photo}
+    if media_group_id:
+        extra["media_group_id"] = media_group_id
+    return message(user_id, chat_id=chat_id, chat_type=chat_type, **extra)
+
+
+def callback_query(user_id, data, chat_id=None, chat_type="private", first_name="SimUser"):
+    uid = next_id()
+    return {
+        "update_id": uid,
+        "callback_query": {
+            "id": str(uid),
+            "from": _user(user_id, first_name),
+            "message": {
+                "message_id": uid,
+                "chat": _chat(chat_id if chat_id is not None else user_id, chat_type),
+                "date": int(time.time()),
+                "text": "[Button Message]",
+            },
+            "data": data,
+        },
+    }
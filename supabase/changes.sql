@@ -0,0 +1,33 @@
+-- Tombstones for deleted rows, read by /api/changes (delta sync).
+-- Run after updated_at.sql. Safe to run more than once.
+
+create table if not exists villingili_tombstones (
+  id bigint generated by default as identity primary key,
+  table_name text not null,
+  row_id text not null,
+  deleted_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create index if not exists idx_villingili_tombstones_deleted_at on villingili_tombstones(deleted_at);
+
+create or replace function villingili_record_tombstone()
+returns trigger as $$
+begin
+  -- TG_ARGV[0] is the key column (telegram_id for users, id for requests)
+  insert into villingili_tombstones (table_name, row_id)
+  values (TG_TABLE_NAME, to_jsonb(old) ->> TG_ARGV[0]);
+  return old;
+end;
+$$ language plpgsql;
+
+drop trigger if exists trg_villingili_users_tombstone on villingili_users;
+create trigger trg_villingili_users_tombstone after delete on villingili_users
+  for each row execute function villingili_record_tombstone('telegram_id');
+
+drop trigger if exists trg_villingili_requests_tombstone on villingili_requests;
+create trigger trg_villingili_requests_tombstone after delete on villingili_requests
+  for each row execute function villingili_record_tombstone('id');
+
+-- Clients that haven't synced for longer than this do a full reload
+-- (see CHANGES_TOMBSTONE_DAYS). Prune with:
+--   delete from villingili_tombstones where deleted_at < now() - interval '30 days';
@@ -0,0 +1,8 @@
+-- Index for donor alert selection (api/donor_alerts.py):
+--   blood_type in (...) and status = 'active'
+--   and (last_donation_date is null or last_donation_date < cooldown cutoff)
+-- Safe to run more than once.
+
+create index if not exists idx_villingili_users_donor_pool
+  on villingili_users(blood_type, last_donation_date)
+  where status = 'active';
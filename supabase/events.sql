@@ -0,0 +1,42 @@
+-- Append-only event log (api/event_log.py): what happened to users and
+-- requests, one compact row per event. Rows are written in batches by the
+-- API and read in id order by /api/events (audit views, rollups).
+-- Run after stats.sql. Safe to run more than once.
+
+create table if not exists villingili_events (
+  id bigint generated by default as identity primary key,
+  type text not null,           -- request_created, request_expired, donor_found, user_merged, status_changed, ...
+  subject text not null,        -- 'user' | 'request'
+  subject_id text,              -- telegram_id or request id
+  actor text,                   -- admin username or telegram id, when known
+  data jsonb not null default '{}'::jsonb,
+  created_at timestamp with time zone not null,  -- when it happened (API clock)
+  logged_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create index if not exists idx_villingili_events_subject on villingili_events(subject, subject_id, id);
+create index if not exists idx_villingili_events_type on villingili_events(type, id);
+create index if not exists idx_villingili_events_logged_at on villingili_events(logged_at);
+
+create or replace function villingili_events_append_only()
+returns trigger as $$
+begin
+  raise exception 'villingili_events is append-only';
+end;
+$$ language plpgsql;
+
+-- To prune old events, disable this trigger for the delete:
+--   alter table villingili_events disable trigger trg_villingili_events_append_only;
+--   delete from villingili_events where created_at < now() - interval '1 year';
+--   alter table villingili_events enable trigger trg_villingili_events_append_only;
+drop trigger if exists trg_villingili_events_append_only on villingili_events;
+create trigger trg_villingili_events_append_only before update or delete on villingili_events
+  for each row execute function villingili_events_append_only();
+
+-- Server-side only: the anon key ships with the dashboard
+revoke all on table villingili_events from anon, authenticated;
+
+-- Donor alert caps (api/donor_alerts.py) read recent donor_alerted /
+-- donor_unreachable events for the candidate donors
+create index if not exists idx_villingili_events_donor_alerts on villingili_events(type, subject_id, created_at)
+  where type in ('donor_alerted', 'donor_unreachable');
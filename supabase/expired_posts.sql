@@ -0,0 +1,10 @@
+-- Channel posts of expired requests still waiting for their "EXPIRED" edit
+-- (api/index.py cron_expire). A run edits as many as Telegram's rate allows
+-- and leaves the rest flagged for the next one.
+-- Run after scan_jobs.sql. Safe to run more than once.
+
+alter table villingili_requests add column if not exists expired_post_pending boolean not null default false;
+
+create index if not exists idx_villingili_requests_expired_post_pending
+  on villingili_requests(created_at)
+  where expired_post_pending;
@@ -0,0 +1,23 @@
+-- Canonical island/atoll codes (api/gazetteer.py) next to free-text places:
+-- villingili_users.address and villingili_requests.location. Donor alerts
+-- look up compatible donors on the request's island, then its atoll.
+-- Run after donor_alerts.sql, then scripts/backfill_places.py for existing
+-- rows. Safe to run more than once.
+
+alter table villingili_users add column if not exists island_code text;
+alter table villingili_users add column if not exists atoll_code text;
+alter table villingili_requests add column if not exists island_code text;
+alter table villingili_requests add column if not exists atoll_code text;
+
+-- Donor alert selection by place:
+--   island_code (or atoll_code) = ... and blood_type in (...) and status = 'active'
+--   and (last_donation_date is null or last_donation_date < cooldown cutoff)
+create index if not exists idx_villingili_users_donor_island
+  on villingili_users(island_code, blood_type, last_donation_date)
+  where status = 'active';
+create index if not exists idx_villingili_users_donor_atoll
+  on villingili_users(atoll_code, blood_type, last_donation_date)
+  where status = 'active';
+
+create index if not exists idx_villingili_requests_island_code on villingili_requests(island_code);
+create index if not exists idx_villingili_requests_atoll_code on villingili_requests(atoll_code);
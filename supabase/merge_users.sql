@@ -0,0 +1,99 @@
+-- Atomic user merge, called as rpc('villingili_merge_users') by api/merge.py.
+-- Moves the source user's requests to the target, settles the target's profile
+-- by policy, then deletes the source, all in one transaction.
+-- Run after changes.sql. Safe to run more than once.
+--
+-- p_policy: keep_target | take_source | fill_missing (see api/merge.py)
+-- p_fields: columns written to the target last; creates the target if missing
+-- Returns the merged target row, or null if the source doesn't exist.
+
+create or replace function villingili_merge_users(
+  p_source bigint,
+  p_target bigint,
+  p_policy text default 'keep_target',
+  p_fields jsonb default '{}'::jsonb
+) returns jsonb as $$
+declare
+  src villingili_users;
+  merged villingili_users;
+  target_exists boolean;
+  result jsonb;
+begin
+  if p_source = p_target then
+    raise exception 'source and target are the same user';
+  end if;
+
+  -- Lock both rows in key order so concurrent merges can't deadlock
+  perform 1 from villingili_users where telegram_id in (p_source, p_target) order by telegram_id for update;
+
+  select * into src from villingili_users where telegram_id = p_source;
+  if not found then
+    return null;
+  end if;
+
+  select * into merged from villingili_users where telegram_id = p_target;
+  target_exists := found;
+  if not target_exists then
+    -- Column defaults (keys for columns that don't exist are ignored)
+    merged := jsonb_populate_record(null::villingili_users, jsonb_build_object(
+      'telegram_id', p_target,
+      'role', 'user',
+      'status', 'active',
+      'created_at', timezone('utc'::text, now()),
+      'updated_at', timezone('utc'::text, now())
+    ));
+  end if;
+
+  -- Keep the field list in sync with PROFILE_FIELDS in api/merge.py
+  if p_policy = 'take_source' then
+    merged.full_name := src.full_name;
+    merged.id_card_number := src.id_card_number;
+    merged.sex := src.sex;
+    merged.address := src.address;
+    merged.blood_type := src.blood_type;
+  elsif p_policy = 'fill_missing' then
+    merged.full_name := coalesce(nullif(merged.full_name, ''), src.full_name);
+    merged.id_card_number := coalesce(nullif(merged.id_card_number, ''), src.id_card_number);
+    merged.sex := coalesce(nullif(merged.sex, ''), src.sex);
+    merged.address := coalesce(nullif(merged.address, ''), src.address);
+    merged.blood_type := coalesce(nullif(merged.blood_type, ''), src.blood_type);
+  elsif p_policy <> 'keep_target' then
+    raise exception 'unknown merge policy %', p_policy;
+  end if;
+
+  merged := jsonb_populate_record(merged, coalesce(p_fields, '{}'::jsonb) - 'telegram_id');
+
+  -- The phone number usually moves from source to target; free it first
+  update villingili_users set phone_number = phone_number || '_merging_' || telegram_id
+  where telegram_id = p_source;
+
+  if target_exists then
+    update villingili_users set
+      full_name = merged.full_name,
+      phone_number = merged.phone_number,
+      alternate_phones = merged.alternate_phones,
+      blood_type = merged.blood_type,
+      sex = merged.sex,
+      id_card_number = merged.id_card_number,
+      address = merged.address,
+      role = merged.role,
+      status = merged.status,
+      last_donation_date = merged.last_donation_date,
+      username = merged.username,
+      pending_request_id = merged.pending_request_id
+    where telegram_id = p_target;
+  else
+    insert into villingili_users select (merged).*;
+  end if;
+
+  update villingili_requests set requester_id = p_target where requester_id = p_source;
+  delete from villingili_users where telegram_id = p_source;
+
+  select to_jsonb(u) into result from villingili_users u where telegram_id = p_target;
+  return result;
+end;
+$$ language plpgsql security definer set search_path = public;
+
+-- Server-side only: the anon key ships with the dashboard
+revoke all on function villingili_merge_users(bigint, bigint, text, jsonb) from public, anon, authenticated;
+grant execute on function villingili_merge_users(bigint, bigint, text, jsonb) to service_role;
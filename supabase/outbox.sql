@@ -0,0 +1,104 @@
+-- Outbox for channel posts of new blood requests (api/outbox.py).
+-- A request and its post are saved in one transaction; the dispatcher claims
+-- due posts in batches and records the results in one call per batch.
+-- Run after merge_users.sql. Safe to run more than once.
+
+create table if not exists villingili_outbox (
+  id bigint generated by default as identity primary key,
+  request_id uuid references villingili_requests(id) on delete cascade,
+  chat_id text not null,
+  text text not null,
+  status text not null default 'pending' check (status in ('pending', 'sent', 'failed')),
+  attempts int not null default 0,
+  next_attempt_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  message_id bigint,
+  last_error text,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  sent_at timestamp with time zone
+);
+
+create index if not exists idx_villingili_outbox_due on villingili_outbox(next_attempt_at) where status = 'pending';
+
+-- p_request: villingili_requests columns; p_post: {chat_id, text} or null
+create or replace function villingili_create_request(p_request jsonb, p_post jsonb default null)
+returns jsonb as $$
+declare
+  req villingili_requests;
+begin
+  -- Column defaults (keys for columns that don't exist are ignored)
+  req := jsonb_populate_record(null::villingili_requests, jsonb_build_object(
+    'id', uuid_generate_v4(),
+    'is_active', true,
+    'donors_found', 0,
+    'created_at', timezone('utc'::text, now()),
+    'updated_at', timezone('utc'::text, now())
+  ) || p_request);
+  insert into villingili_requests select (req).*;
+
+  if p_post is not null and jsonb_typeof(p_post) = 'object' then
+    insert into villingili_outbox (request_id, chat_id, text)
+    values (req.id, p_post ->> 'chat_id', p_post ->> 'text');
+  end if;
+  return to_jsonb(req);
+end;
+$$ language plpgsql security definer set search_path = public;
+
+-- Claims up to p_limit due posts for p_lease_seconds
+create or replace function villingili_outbox_claim(p_limit int, p_lease_seconds int)
+returns setof villingili_outbox as $$
+  update villingili_outbox o
+  set next_attempt_at = now() + make_interval(secs => p_lease_seconds)
+  where o.id in (
+    select id from villingili_outbox
+    where status = 'pending' and next_attempt_at <= now()
+    order by id
+    limit p_limit
+    for update skip locked
+  )
+  returning o.*;
+$$ language sql security definer set search_path = public;
+
+-- p_results: [{id, message_id}] for sent posts, [{id, error, retry_in, attempted}] for failed ones
+create or replace function villingili_outbox_complete(p_results jsonb, p_max_attempts int)
+returns int as $$
+declare
+  r jsonb;
+  tries int;
+  req_id uuid;
+  n int := 0;
+begin
+  for r in select value from jsonb_array_elements(p_results) loop
+    if r ? 'error' then
+      update villingili_outbox
+      set attempts = attempts + (case when coalesce((r ->> 'attempted')::boolean, true) then 1 else 0 end),
+          last_error = r ->> 'error',
+          next_attempt_at = now() + make_interval(secs => coalesce((r ->> 'retry_in')::float, 0))
+      where id = (r ->> 'id')::bigint
+      returning attempts into tries;
+      if tries >= p_max_attempts then
+        update villingili_outbox set status = 'failed' where id = (r ->> 'id')::bigint;
+      end if;
+    else
+      update villingili_outbox
+      set status = 'sent', attempts = attempts + 1, last_error = null, sent_at = now(),
+          message_id = (r ->> 'message_id')::bigint
+      where id = (r ->> 'id')::bigint
+      returning request_id into req_id;
+      if r ->> 'message_id' is not null then
+        update villingili_requests set telegram_message_id = (r ->> 'message_id')::bigint where id = req_id;
+      end if;
+    end if;
+    n := n + 1;
+  end loop;
+  return n;
+end;
+$$ language plpgsql security definer set search_path = public;
+
+-- Server-side only: the anon key ships with the dashboard
+revoke all on table villingili_outbox from anon, authenticated;
+revoke all on function villingili_create_request(jsonb, jsonb) from public, anon, authenticated;
+revoke all on function villingili_outbox_claim(int, int) from public, anon, authenticated;
+revoke all on function villingili_outbox_complete(jsonb, int) from public, anon, authenticated;
+grant execute on function villingili_create_request(jsonb, jsonb) to service_role;
+grant execute on function villingili_outbox_claim(int, int) to service_role;
+grant execute on function villingili_outbox_complete(jsonb, int) to service_role;
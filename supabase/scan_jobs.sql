@@ -0,0 +1,23 @@
+-- Status of ID-card scan jobs (api/ocr.py), shared by every instance so
+-- /api/scan_jobs/{id} answers wherever the dashboard's poll lands.
+-- Run after events.sql. Safe to run more than once.
+
+create table if not exists villingili_scan_jobs (
+  id text primary key,          -- job id returned when the scan starts
+  status text not null check (status in ('queued', 'running', 'done', 'failed')),
+  chat_id bigint,
+  message_id bigint,            -- the "Scanning..." message edited with the result
+  cards int,                    -- albums: photos in the batch
+  telegram_id bigint,           -- draft user created by a single scan
+  saved int,                    -- albums: drafts saved
+  error text,
+  created_at timestamp with time zone not null,
+  finished_at timestamp with time zone
+);
+
+-- Jobs are only looked up by id; old ones can go at any time:
+--   delete from villingili_scan_jobs where created_at < now() - interval '7 days';
+create index if not exists idx_villingili_scan_jobs_created_at on villingili_scan_jobs(created_at);
+
+-- Server-side only: the anon key ships with the dashboard
+revoke all on table villingili_scan_jobs from anon, authenticated;
@@ -0,0 +1,155 @@
+-- Dashboard statistics (/api/stats, api/stats.py).
+-- Triggers keep two small tables in step with every write:
+--   villingili_donor_counts:  users by blood type, status and last donation date
+--   villingili_request_daily: requests by creation day (UTC) and state
+-- so the dashboard reads aggregates instead of whole tables. A request is
+-- 'fulfilled' once a donor offered to help, 'expired' if it closed without
+-- one, 'open' otherwise. villingili_recompute_stats() rebuilds both tables
+-- from scratch with one GROUP BY each.
+-- Run after gazetteer.sql. Safe to run more than once.
+
+create table if not exists villingili_donor_counts (
+  blood_type text not null default '',
+  status text not null default '',
+  last_donation text not null default '',  -- 'YYYY-MM-DD', '' for never
+  n int not null default 0,
+  primary key (blood_type, status, last_donation)
+);
+
+create table if not exists villingili_request_daily (
+  day date primary key,
+  created int not null default 0,
+  open int not null default 0,
+  fulfilled int not null default 0,
+  expired int not null default 0
+);
+
+create or replace function villingili_request_state(p_is_active boolean, p_donors_found int)
+returns text as $$
+  select case
+    when coalesce(p_donors_found, 0) > 0 then 'fulfilled'
+    when not coalesce(p_is_active, true) then 'expired'
+    else 'open'
+  end;
+$$ language sql immutable;
+
+create or replace function villingili_count_donor(p_row villingili_users, p_delta int)
+returns void as $$
+  insert into villingili_donor_counts (blood_type, status, last_donation, n)
+  values (coalesce(p_row.blood_type, ''), coalesce(p_row.status, ''), coalesce(p_row.last_donation_date::text, ''), p_delta)
+  on conflict (blood_type, status, last_donation) do update set n = villingili_donor_counts.n + excluded.n;
+$$ language sql;
+
+create or replace function villingili_count_request(p_row villingili_requests, p_delta int)
+returns void as $$
+  insert into villingili_request_daily as d (day, created, open, fulfilled, expired)
+  select (p_row.created_at at time zone 'utc')::date, p_delta,
+         case when s = 'open' then p_delta else 0 end,
+         case when s = 'fulfilled' then p_delta else 0 end,
+         case when s = 'expired' then p_delta else 0 end
+  from villingili_request_state(p_row.is_active, p_row.donors_found) s
+  on conflict (day) do update set
+    created = d.created + excluded.created,
+    open = d.open + excluded.open,
+    fulfilled = d.fulfilled + excluded.fulfilled,
+    expired = d.expired + excluded.expired;
+$$ language sql;
+
+create or replace function villingili_users_stats()
+returns trigger as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform villingili_count_donor(old, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform villingili_count_donor(new, 1);
+  end if;
+  return null;
+end;
+$$ language plpgsql security definer set search_path = public;
+
+create or replace function villingili_requests_stats()
+returns trigger as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform villingili_count_request(old, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform villingili_count_request(new, 1);
+  end if;
+  return null;
+end;
+$$ language plpgsql security definer set search_path = public;
+
+drop trigger if exists trg_villingili_users_stats on villingili_users;
+create trigger trg_villingili_users_stats
+  after insert or delete or update of blood_type, status, last_donation_date on villingili_users
+  for each row execute function villingili_users_stats();
+
+drop trigger if exists trg_villingili_requests_stats on villingili_requests;
+create trigger trg_villingili_requests_stats
+  after insert or delete or update of created_at, is_active, donors_found on villingili_requests
+  for each row execute function villingili_requests_stats();
+
+-- Rebuilds both tables from villingili_users/villingili_requests; returns their sizes
+create or replace function villingili_recompute_stats()
+returns jsonb as $$
+begin
+  -- Writers wait for the rebuild, so their trigger deltas land on top of it
+  lock table villingili_donor_counts, villingili_request_daily in exclusive mode;
+
+  delete from villingili_donor_counts where true;
+  insert into villingili_donor_counts (blood_type, status, last_donation, n)
+  select coalesce(blood_type, ''), coalesce(status, ''), coalesce(last_donation_date::text, ''), count(*)
+  from villingili_users
+  group by 1, 2, 3;
+
+  delete from villingili_request_daily where true;
+  insert into villingili_request_daily (day, created, open, fulfilled, expired)
+  select (created_at at time zone 'utc')::date, count(*),
+         count(*) filter (where s = 'open'),
+         count(*) filter (where s = 'fulfilled'),
+         count(*) filter (where s = 'expired')
+  from (select created_at, villingili_request_state(is_active, donors_found) s from villingili_requests) r
+  group by 1;
+
+  return jsonb_build_object(
+    'donor_groups', (select count(*) from villingili_donor_counts),
+    'days', (select count(*) from villingili_request_daily)
+  );
+end;
+$$ language plpgsql security definer set search_path = public;
+
+-- Everything /api/stats shows, in one call. Donors are past their cooldown
+-- when they never donated or last donated before p_cutoff ('YYYY-MM-DD').
+create or replace function villingili_stats(p_cutoff text, p_since date)
+returns jsonb as $$
+  select jsonb_build_object(
+    'donors', (
+      select coalesce(jsonb_agg(g order by g.blood_type, g.status), '[]'::jsonb)
+      from (
+        select blood_type, status, sum(n) as total,
+               coalesce(sum(n) filter (where last_donation = '' or last_donation < p_cutoff), 0) as eligible
+        from villingili_donor_counts
+        group by blood_type, status
+        having sum(n) > 0
+      ) g
+    ),
+    'requests', (
+      select coalesce(jsonb_agg(d order by d.day), '[]'::jsonb)
+      from villingili_request_daily d
+      where d.day >= p_since
+    )
+  );
+$$ language sql stable security definer set search_path = public;
+
+-- Server-side only: the anon key ships with the dashboard
+revoke all on table villingili_donor_counts from anon, authenticated;
+revoke all on table villingili_request_daily from anon, authenticated;
+revoke all on function villingili_recompute_stats() from public, anon, authenticated;
+revoke all on function villingili_stats(text, date) from public, anon, authenticated;
+grant execute on function villingili_recompute_stats() to service_role;
+grant execute on function villingili_stats(text, date) to service_role;
+
+-- Counts for the rows already there
+select villingili_recompute_stats();
@@ -0,0 +1,31 @@
+-- updated_at columns for conditional GETs (ETag) on the dashboard list endpoints.
+-- Safe to run more than once.
+
+create or replace function villingili_touch_updated_at()
+returns trigger as $$
+begin
+  new.updated_at = timezone('utc'::text, now());
+  return new;
+end;
+$$ language plpgsql;
+
+alter table villingili_users add column if not exists updated_at timestamp with time zone default timezone('utc'::text, now()) not null;
+alter table villingili_requests add column if not exists updated_at timestamp with time zone default timezone('utc'::text, now()) not null;
+alter table villingili_admin_users add column if not exists updated_at timestamp with time zone default timezone('utc'::text, now()) not null;
+
+drop trigger if exists trg_villingili_users_updated_at on villingili_users;
+create trigger trg_villingili_users_updated_at before update on villingili_users
+  for each row execute function villingili_touch_updated_at();
+
+drop trigger if exists trg_villingili_requests_updated_at on villingili_requests;
+create trigger trg_villingili_requests_updated_at before update on villingili_requests
+  for each row execute function villingili_touch_updated_at();
+
+drop trigger if exists trg_villingili_admin_users_updated_at on villingili_admin_users;
+create trigger trg_villingili_admin_users_updated_at before update on villingili_admin_users
+  for each row execute function villingili_touch_updated_at();
+
+-- The version query is "order by updated_at desc limit 1"
+create index if not exists idx_villingili_users_updated_at on villingili_users(updated_at);
+create index if not exists idx_villingili_requests_updated_at on villingili_requests(updated_at);
+create index if not exists idx_villingili_admin_users_updated_at on villingili_admin_users(updated_at);